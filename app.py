@@ -6,8 +6,21 @@ from gradio.themes.citrus import Citrus
 import gradio as gr
 from gradio_modal import Modal
 from dataManagement.dataIMU import get_imu_data
-from dataManagement.dataPointCloud import visualize_pointcloud_topic, get_pointcloud_topics, debug_bag_file
+from dataManagement.dataPointCloud import (render_pointcloud_topic, visualize_pointcloud_progressive,
+                                           refine_pointcloud_region, visualize_pointcloud_map,
+                                           visualize_range_image, visualize_bev, visualize_bev_strip,
+                                           visualize_pointcloud_frame, pointcloud_frame_count,
+                                           get_pointcloud_topics, debug_bag_file,
+                                           RANGE_CHANNEL, RANGE_IMAGE_CHANNELS)
 from dataManagement.dataGeo import get_gps_data
+from dataManagement.bagCache import get_bag_metadata
+from dataManagement.lasReader import is_las_file
+from dataManagement.bagExtraction import extract_sensor_topics
+from dataManagement.pointCloudFilters import DEFAULT_POINT_BUDGET, DOWNSAMPLE_METHODS, VOXEL_CENTROID
+from dataManagement.groundSegmentation import GROUND_METHODS, NO_GROUND
+from dataManagement.outlierRemoval import OUTLIER_METHODS, RADIUS_OUTLIERS
+from dataManagement.birdsEyeView import BEV_RANGE, BEV_RESOLUTION
+from dataManagement.timeSeriesDecimation import DECIMATION_METHODS, MIN_MAX
 import pathlib
 import pandas as pd
 import numpy as np
@@ -135,20 +148,98 @@ with gr.Blocks(theme=theme, css=custom_css) as demo:
         )
 
         # Seleccionar archivo de nube de puntos
-        file_input = gr.File(label="Upload Point Cloud File (.bag)", file_types=[".bag"])
+        file_input = gr.File(label="Upload Point Cloud File (.bag, ROS 2 .db3/.mcap, .las/.laz)",
+                             file_types=[".bag", ".db3", ".mcap", ".las", ".laz"])
         debug_button = gr.Button("Debug Bag File")
         update_topics_btn = gr.Button("Load Point Cloud Topics")
         debug_output = gr.Textbox(label="Debug Info", lines=10, interactive=False)
         selected_topic = gr.State()  # Estado oculto para almacenar el topic seleccionado
 
+        # Submuestreo para la visualización
+        with gr.Row():
+            downsample_method = gr.Dropdown(
+                list(DOWNSAMPLE_METHODS), value=VOXEL_CENTROID, label="Downsampling"
+            )
+            leaf_size_input = gr.Number(value=0, label="Voxel leaf size (m, 0 = auto)")
+            point_budget = gr.Slider(
+                50000, 1000000, value=DEFAULT_POINT_BUDGET, step=50000, label="Point budget"
+            )
+            quantize_input = gr.Checkbox(value=False, label="Quantize coordinates (int16, smaller payload)")
+            outlier_method = gr.Dropdown(list(OUTLIER_METHODS), value=RADIUS_OUTLIERS, label="Noise filter")
+
+        # Segmentación del suelo (RANSAC): colorear por clase o descartar el suelo
+        with gr.Row():
+            ground_method = gr.Dropdown(list(GROUND_METHODS), value=NO_GROUND, label="Ground segmentation")
+            hide_ground_input = gr.Checkbox(value=False, label="Hide ground points")
+            detect_objects_input = gr.Checkbox(value=False, label="Detect objects (bounding boxes)")
+            deskew_input = gr.Checkbox(value=False, label="Deskew sweeps with IMU (uses the per-point time field)")
+
         visualize_button = gr.Button("Visualize Point Cloud")
+        process_all_button = gr.Button("Process All Sensors (single pass)")
 
         point_cloud_output = gr.Plot(label="Point Cloud Visualization")
 
+        # Recorrer los frames del topic en el tiempo (los contiguos se preparan en segundo plano)
+        with gr.Row():
+            prev_frame_button = gr.Button("◀ Previous frame")
+            frame_slider = gr.Slider(0, 0, value=0, step=1, label="Frame")
+            next_frame_button = gr.Button("Next frame ▶")
+
+        # Refinar una región de la nube (más detalle solo donde se está mirando)
+        with gr.Row():
+            region_x = gr.Number(value=0, label="Region center X (m)")
+            region_y = gr.Number(value=0, label="Region center Y (m)")
+            region_z = gr.Number(value=0, label="Region center Z (m)")
+            region_radius = gr.Number(value=10, label="Region half-size (m)")
+        refine_button = gr.Button("Refine Region")
+
+        # Mapa: registrar todos los frames del topic y acumularlos
+        with gr.Row():
+            map_stride = gr.Number(value=1, precision=0, label="Map frame stride")
+            map_max_frames = gr.Number(value=0, precision=0, label="Map max frames (0 = all)")
+        map_button = gr.Button("Build Map (ICP)")
+
+        # Vista previa ligera: imagen de rango del primer frame (anillos x azimut)
+        with gr.Row():
+            range_channel = gr.Dropdown(list(RANGE_IMAGE_CHANNELS), value=RANGE_CHANNEL, label="Range image channel")
+            range_image_button = gr.Button("Range Image Preview")
+
+        # Vista cenital (BEV): imagen 2D del primer frame o tira de miniaturas de todo el recorrido
+        with gr.Row():
+            bev_range = gr.Number(value=BEV_RANGE, label="BEV half-size (m)")
+            bev_resolution = gr.Number(value=BEV_RESOLUTION, label="BEV cell size (m)")
+            bev_stride = gr.Number(value=1, precision=0, label="BEV strip frame stride")
+        with gr.Row():
+            bev_button = gr.Button("BEV Preview")
+            bev_strip_button = gr.Button("BEV Strip (all frames)")
+        bev_output = gr.Image(label="Bird's-eye view (R = max height, G = density, B = intensity)", type="numpy")
+
         # Función para actualizar archivo compartido
         def update_shared_file(file):
+            # Indexar el bag una sola vez; todas las pestañas reutilizan los metadatos
+            if file is not None and not is_las_file(file):
+                try:
+                    get_bag_metadata(file)
+                except Exception as e:
+                    print(f"No se pudo indexar el archivo: {str(e)}")
             return file
 
+        def update_frame_slider(file, topic):
+            # El slider cubre todos los mensajes del topic cargado
+            count = pointcloud_frame_count(file, topic)
+            return gr.update(minimum=0, maximum=max(count - 1, 0), value=0)
+
+        def step_frame(step, file, topic, n, *display):
+            n = int(np.clip(int(n or 0) + step, 0, max(pointcloud_frame_count(file, topic) - 1, 0)))
+            fig, info = visualize_pointcloud_frame(file, topic, n, *display)
+            return n, fig, info
+
+        def previous_frame(*args):
+            return step_frame(-1, *args)
+
+        def next_frame(*args):
+            return step_frame(1, *args)
+
         # Conexiones de eventos
         file_input.change(
             fn=update_shared_file,
@@ -168,12 +259,75 @@ with gr.Blocks(theme=theme, css=custom_css) as demo:
             outputs=[selected_topic, debug_output]
         )
 
+        # Progresivo: primero un nivel grueso del octree y luego el detalle completo
         visualize_button.click(
-            fn=visualize_pointcloud_topic, 
-            inputs=[file_input, selected_topic], 
+            fn=visualize_pointcloud_progressive, 
+            inputs=[file_input, selected_topic, downsample_method, leaf_size_input, point_budget, quantize_input,
+                    ground_method, hide_ground_input, detect_objects_input, outlier_method, deskew_input], 
+            outputs=[point_cloud_output, debug_output]
+        )
+
+        refine_button.click(
+            fn=refine_pointcloud_region,
+            inputs=[file_input, selected_topic, region_x, region_y, region_z, region_radius, point_budget,
+                    quantize_input],
+            outputs=point_cloud_output
+        )
+
+        map_button.click(
+            fn=visualize_pointcloud_map,
+            inputs=[file_input, selected_topic, map_stride, map_max_frames, point_budget, quantize_input,
+                    deskew_input],
+            outputs=[point_cloud_output, debug_output]
+        )
+
+        bev_button.click(
+            fn=visualize_bev,
+            inputs=[file_input, selected_topic, bev_range, bev_resolution],
+            outputs=[bev_output, debug_output]
+        )
+
+        bev_strip_button.click(
+            fn=visualize_bev_strip,
+            inputs=[file_input, selected_topic, bev_range, bev_stride],
+            outputs=[bev_output, debug_output]
+        )
+
+        range_image_button.click(
+            fn=visualize_range_image,
+            inputs=[file_input, selected_topic, range_channel],
             outputs=point_cloud_output
         )
 
+        selected_topic.change(
+            fn=update_frame_slider,
+            inputs=[file_input, selected_topic],
+            outputs=frame_slider
+        )
+
+        frame_inputs = [file_input, selected_topic, frame_slider, downsample_method, leaf_size_input, point_budget,
+                        quantize_input, ground_method, hide_ground_input, detect_objects_input, outlier_method,
+                        deskew_input]
+
+        # Solo al soltar el slider: arrastrarlo no lanza una petición por cada frame intermedio
+        frame_slider.release(
+            fn=visualize_pointcloud_frame,
+            inputs=frame_inputs,
+            outputs=[point_cloud_output, debug_output]
+        )
+
+        prev_frame_button.click(
+            fn=previous_frame,
+            inputs=frame_inputs,
+            outputs=[frame_slider, point_cloud_output, debug_output]
+        )
+
+        next_frame_button.click(
+            fn=next_frame,
+            inputs=frame_inputs,
+            outputs=[frame_slider, point_cloud_output, debug_output]
+        )
+
     # Segundo tab: Data Analysis
     with gr.Tab("Data Analysis For IMU Sensor"):
         gr.Markdown("## Data Analysis For IMU Sensor", elem_id="data-analysis-title")
@@ -205,12 +359,20 @@ with gr.Blocks(theme=theme, css=custom_css) as demo:
         #imu_table = gr.Dataframe(label="IMU Data", interactive=False)
 
         # Por esto:
-        imu_file_input = gr.File(label="Upload IMU Data File (.bag)", file_types=[".bag"], visible=False)
+        imu_file_input = gr.File(label="Upload IMU Data File (.bag, ROS 2 .db3/.mcap)", file_types=[".bag", ".db3", ".mcap"], visible=False)
         imu_run_button = gr.Button("Analyze IMU Data", elem_id="imu-inference-button")
 
         # Salidas
         imu_table = gr.Dataframe(label="IMU Data", interactive=False)
         imu_plot = gr.Plot(label="IMU Sensor Analysis")
+
+        # Las series se reducen al ancho de la gráfica; el zoom vuelve a reducir
+        # la ventana elegida desde la resolución completa
+        with gr.Row():
+            imu_decimation = gr.Dropdown(list(DECIMATION_METHODS), value=MIN_MAX, label="Plot decimation")
+            imu_zoom_start = gr.Number(value=0, label="Zoom start (s)")
+            imu_zoom_end = gr.Number(value=0, label="Zoom end (s, 0 = whole recording)")
+            imu_zoom_button = gr.Button("Zoom (full resolution)")
         #imu_image = gr.Image(label="IMU Sensor Plot")
 
         # Función para mostrar los datos del IMU en tabla
@@ -226,17 +388,30 @@ with gr.Blocks(theme=theme, css=custom_css) as demo:
         )
 
         # Función para procesar y mostrar datos IMU
-        def analyze_imu_data(bag_file):
-            df, fig = get_imu_data(bag_file)
+        # Como en la pestaña GPS, se usa el archivo cargado en Point Cloud si no hay otro
+        def analyze_imu_data(bag_file, shared, decimation):
+            df, fig = get_imu_data(bag_file or shared, decimation=decimation)
             return df, fig
 
+        def zoom_imu_data(bag_file, shared, start, end, decimation):
+            # Sin final se vuelve a la grabación completa
+            time_range = (float(start or 0), float(end)) if end else None
+            _, fig = get_imu_data(bag_file or shared, time_range, decimation)
+            return fig
+
         # Conexión del evento IMU
         imu_run_button.click(
             fn=analyze_imu_data,
-            inputs=imu_file_input,
+            inputs=[imu_file_input, shared_file, imu_decimation],
             outputs=[imu_table, imu_plot]
         )
 
+        imu_zoom_button.click(
+            fn=zoom_imu_data,
+            inputs=[imu_file_input, shared_file, imu_zoom_start, imu_zoom_end, imu_decimation],
+            outputs=imu_plot
+        )
+
     with gr.Tab("Georeferencing"):
         gr.Markdown("## GPS Data Analysis & Georeferencing")
         gr.HTML("""
@@ -435,5 +610,42 @@ with gr.Blocks(theme=theme, css=custom_css) as demo:
             outputs=[geo_table, geo_viewer, gps_stats, file_info, status_display]
         )
 
+    # Procesar LiDAR, IMU y GPS con una sola lectura del bag
+    def process_all_sensors(bag_file, topic_name=None, method=VOXEL_CENTROID, leaf_size=0,
+                            max_points=DEFAULT_POINT_BUDGET, quantize=False, ground=NO_GROUND,
+                            hide_ground=False, detect_objects=False, outliers=RADIUS_OUTLIERS, deskew=False):
+        if bag_file is None:
+            message = "No hay archivo seleccionado"
+            return (None, message, None, None, None) + analyze_gps_data_with_progress(None)
+
+        try:
+            extraction = extract_sensor_topics(bag_file)
+        except Exception as e:
+            message = f"Error procesando el bag: {str(e)}"
+            return (None, message, None, None, None) + analyze_gps_data_with_progress(None)
+
+        # Las pestañas leen lo extraído desde la caché, sin volver a recorrer el bag
+        summary = (
+            "=== EXTRACCIÓN EN UNA SOLA PASADA ===\n"
+            f"PointCloud2: {extraction.pointcloud_topic or 'no encontrado'}\n"
+            f"IMU: {extraction.imu_topic or 'no encontrado'}\n"
+            f"GPS: {extraction.gps_topic or 'no encontrado'}\n"
+        )
+        pc_fig, pc_info = render_pointcloud_topic(bag_file, extraction.pointcloud_topic, method, leaf_size,
+                                                  max_points, quantize, ground, hide_ground, detect_objects, outliers,
+                                                  deskew)
+        summary += "\n" + pc_info
+        imu_df, imu_fig = get_imu_data(bag_file)
+        gps_outputs = analyze_gps_data_with_progress(bag_file, topic_name)
+        return (extraction.pointcloud_topic, summary, pc_fig, imu_df, imu_fig) + gps_outputs
+
+    process_all_button.click(
+        fn=process_all_sensors,
+        inputs=[file_input, gps_topic_input, downsample_method, leaf_size_input, point_budget, quantize_input,
+                ground_method, hide_ground_input, detect_objects_input, outlier_method, deskew_input],
+        outputs=[selected_topic, debug_output, point_cloud_output, imu_table, imu_plot,
+                 geo_table, geo_viewer, gps_stats, file_info, status_display]
+    )
+
 if __name__ == "__main__":
     demo.launch()
\ No newline at end of file
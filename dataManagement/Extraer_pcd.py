@@ -1,28 +1,43 @@
-import rosbag
-import sensor_msgs.point_cloud2 as pc2
-import open3d as o3d
-import numpy as np
+# Ejecutar desde la raíz del repositorio: python -m dataManagement.Extraer_pcd
+#
+# Exporta los frames de un topic PointCloud2 a PCD o LAS (ver pointCloudExport).
+# Ejemplos:
+#   python -m dataManagement.Extraer_pcd hall_02.bag -o frames_pcd
+#   python -m dataManagement.Extraer_pcd hall_02.bag --format las --start 1600000010 --end 1600000020
+import argparse
 
-# Ruta del archivo bag
-bag = rosbag.Bag("hall_02.bag")
+from dataManagement.bagCache import get_topic_table
+from dataManagement.dataPointCloud import find_pointcloud_topic
+from dataManagement.parallelDecode import default_workers
+from dataManagement.pointCloudExport import EXPORT_FORMATS, PCD_BINARY, export_pointcloud_frames
 
-# Nombre del topic con las nubes de puntos
-topic = "/velodyne_points"
 
-for i, (topic, msg, t) in enumerate(bag.read_messages(topics=[topic])):
-    pc = pc2.read_points(msg, skip_nans=True, field_names=["x", "y", "z"])
-    points = np.array(list(pc))
+def main():
+    parser = argparse.ArgumentParser(description="Exporta los frames PointCloud2 de un bag a PCD o LAS")
+    parser.add_argument('bag', nargs='?', default='hall_02.bag', help="Bag de entrada")
+    parser.add_argument('-t', '--topic', help="Topic PointCloud2 (por defecto, el primero del bag)")
+    parser.add_argument('-o', '--output-dir', default='frames', help="Carpeta de salida")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default=PCD_BINARY,
+                        help="pcd (binary), pcd_compressed (binary_compressed, requiere el paquete lzf) o las")
+    parser.add_argument('--start', type=float, help="Tiempo inicial (segundos, como en el bag)")
+    parser.add_argument('--end', type=float, help="Tiempo final (segundos, como en el bag)")
+    parser.add_argument('--stride', type=int, default=1, help="Exportar uno de cada N frames")
+    parser.add_argument('--max-frames', type=int, help="Número máximo de frames")
+    parser.add_argument('--workers', type=int, default=default_workers(), help="Procesos del pool")
+    args = parser.parse_args()
 
-    if len(points) == 0:
-        continue
+    topic = args.topic or find_pointcloud_topic(get_topic_table(args.bag))
+    if topic is None:
+        parser.error(f"No se encontraron topics de PointCloud2 en {args.bag}")
 
-    # Guarda
-    pcd = o3d.geometry.PointCloud()
-    pcd.points = o3d.utility.Vector3dVector(points)
+    try:
+        export_pointcloud_frames(args.bag, topic, args.output_dir, args.format, stride=args.stride,
+                                 start_time=args.start, end_time=args.end, max_frames=args.max_frames,
+                                 workers=args.workers, progress=True)
+    except ImportError as e:
+        parser.error(str(e))
 
-    filename = f"frame_{i:03d}.pcd"
-    o3d.io.write_point_cloud(filename, pcd)
-    print(f"{filename} guardado.")
-    
-    if i >= 4:  # Solo los primeros 5 mensajes
-        break
+
+# El pool de procesos necesita la guarda de __main__ (los workers importan este módulo)
+if __name__ == '__main__':
+    main()
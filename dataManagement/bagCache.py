@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Union
+
+import pandas as pd
+
+from dataManagement.bagReader import BagIndex, BagReader, BagReaderBase, bag_file_path
+from dataManagement.ros2BagReader import Ros2BagIndex, Ros2BagReader, is_ros2_bag, ros2_storage_files
+
+# Caché de sesión con los metadatos de cada bag subido (catálogo de topics e
+# índice de chunks). Todas las pestañas de la app comparten la misma entrada,
+# así el bag se indexa una sola vez por contenido.
+
+CACHE_MAX_ENTRIES = 16
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Tamaño de cada lectura al calcular la huella del contenido
+FINGERPRINT_BLOCK_SIZE = 8 * 1024 * 1024
+
+class BagMetadata(NamedTuple):
+    fingerprint: str
+    index: Union[BagIndex, Ros2BagIndex]
+    topic_table: pd.DataFrame
+    size: int  # Tamaño estimado en memoria (bytes)
+
+
+def bag_files(path: str) -> List[str]:
+    """Archivos que forman el bag (uno en ROS1, uno o varios en ROS 2)"""
+    return ros2_storage_files(path)[1] if is_ros2_bag(path) else [path]
+
+
+def bag_fingerprint(path: str) -> str:
+    """
+    Huella del contenido del bag: hash de todos los bytes de todos sus archivos.
+
+    Las entradas de la caché en disco se reutilizan entre sesiones por esta
+    huella, así que dos grabaciones distintas no pueden compartirla aunque solo
+    difieran en un mensaje. Leer el bag completo cuesta segundos en bags de
+    varios GB, pero BagMetadataCache la calcula una sola vez por (ruta, tamaño, mtime).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for file in bag_files(path):
+        digest.update(str(os.path.getsize(file)).encode())
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(FINGERPRINT_BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def open_bag_file(path, index=None) -> BagReaderBase:
+    """Abre un bag de ROS1 (.bag) o de ROS 2 (directorio, .db3, .mcap) con el lector adecuado"""
+    if is_ros2_bag(bag_file_path(path)):
+        return Ros2BagReader(path, index=index)
+    return BagReader(path, index=index)
+
+
+def _estimate_size(index, topic_table: pd.DataFrame) -> int:
+    """Estimación aproximada de la memoria que ocupa una entrada"""
+    size = int(topic_table.memory_usage(deep=True).sum())
+    for connection in index.connections.values():
+        size += 200 + len(connection.message_definition) + len(connection.topic) + len(connection.msg_type)
+    for chunk in index.chunks:
+        size += 120 + 100 * len(chunk.counts)
+    return size
+
+
+class BagMetadataCache:
+    """Caché LRU de metadatos de bags, acotada por número de entradas y tamaño"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._fingerprints = {}  # (ruta, tamaño, mtime) -> huella
+        self._lock = threading.Lock()
+
+    def fingerprint(self, path: str) -> str:
+        key = tuple((os.path.abspath(file), os.stat(file).st_size, os.stat(file).st_mtime_ns)
+                    for file in bag_files(path))
+        with self._lock:
+            fingerprint = self._fingerprints.get(key)
+        if fingerprint is None:
+            fingerprint = bag_fingerprint(path)
+            with self._lock:
+                self._fingerprints[key] = fingerprint
+        return fingerprint
+
+    def get(self, bag_file) -> BagMetadata:
+        path = bag_file_path(bag_file)
+        fingerprint = self.fingerprint(path)
+
+        with self._lock:
+            metadata = self._entries.get(fingerprint)
+            if metadata is not None:
+                self._entries.move_to_end(fingerprint)
+                return metadata
+
+        with open_bag_file(path) as reader:
+            index = reader.index
+            topic_table = reader.topic_table()
+        metadata = BagMetadata(fingerprint, index, topic_table, _estimate_size(index, topic_table))
+
+        with self._lock:
+            self._entries[fingerprint] = metadata
+            self._entries.move_to_end(fingerprint)
+            self._evict()
+        return metadata
+
+    def _evict(self):
+        total = sum(entry.size for entry in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+
+
+_cache = BagMetadataCache()
+
+
+def get_bag_metadata(bag_file) -> BagMetadata:
+    """Metadatos (índice y catálogo de topics) del bag, indexándolo solo la primera vez"""
+    return _cache.get(bag_file)
+
+
+def get_topic_table(bag_file) -> pd.DataFrame:
+    """Catálogo de topics del bag (copia, se puede modificar libremente)"""
+    return get_bag_metadata(bag_file).topic_table.copy()
+
+
+def open_bag(bag_file) -> BagReaderBase:
+    """Abre el bag (ROS1 o ROS 2) reutilizando el índice de la caché"""
+    return open_bag_file(bag_file, index=get_bag_metadata(bag_file).index)
+
+
+def clear_bag_cache():
+    _cache.clear()
@@ -0,0 +1,121 @@
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from dataManagement.bagCache import get_bag_metadata, open_bag
+from dataManagement.bagReader import select_spans
+from dataManagement.dataGeo import GPS_TABLE, find_gps_topic_fast
+from dataManagement.dataIMU import IMU_TABLE, find_imu_topic
+from dataManagement.dataPointCloud import PointCloudFrame, find_pointcloud_topic, frame_cache_name
+from dataManagement import pointCloudDecoder, rosMessages
+from dataManagement.topicCache import load_frame, load_table, store_frame, store_table
+
+# Extracción de LiDAR, IMU y GPS en una sola lectura secuencial del bag. Cada
+# chunk se lee una única vez y sus mensajes se reparten a los decodificadores de
+# cada sensor; los resultados quedan en la caché en disco para las pestañas.
+
+
+class SensorExtraction(NamedTuple):
+    pointcloud_topic: Optional[str]
+    imu_topic: Optional[str]
+    gps_topic: Optional[str]
+    frames: List[PointCloudFrame]
+    imu_df: Optional[pd.DataFrame]
+    gps_df: Optional[pd.DataFrame]
+
+
+def _topic_type(topic_table: pd.DataFrame, topic: Optional[str]) -> str:
+    if topic is None:
+        return ''
+    return str(topic_table.loc[topic_table['Topics'] == topic, 'Types'].iloc[0])
+
+
+def extract_sensor_topics(bag_file, max_frames: int = 1,
+                          fields=pointCloudDecoder.DEFAULT_EXTRA_FIELDS) -> SensorExtraction:
+    """
+    Extrae en una sola pasada los primeros `max_frames` frames del topic de
+    PointCloud2 y las tablas completas de IMU y GPS. Lo que ya esté en la caché
+    en disco no se vuelve a decodificar.
+    """
+    metadata = get_bag_metadata(bag_file)
+    topic_table = metadata.topic_table
+    fingerprint = metadata.fingerprint
+
+    pointcloud_topic = find_pointcloud_topic(topic_table)
+    imu_topic = find_imu_topic(topic_table)
+    gps_topic = find_gps_topic_fast(topic_table)
+    # Solo se decodifican los tipos estándar de sensor_msgs
+    if 'sensor_msgs/Imu' not in _topic_type(topic_table, imu_topic):
+        imu_topic = None
+    if 'sensor_msgs/NavSatFix' not in _topic_type(topic_table, gps_topic):
+        gps_topic = None
+
+    imu_df = load_table(fingerprint, imu_topic, IMU_TABLE, rosMessages.TABLE_DECODER_VERSION) if imu_topic else None
+    gps_df = load_table(fingerprint, gps_topic, GPS_TABLE, rosMessages.TABLE_DECODER_VERSION) if gps_topic else None
+
+    frames = []
+    if pointcloud_topic:
+        for n in range(max_frames):
+            cached = load_frame(fingerprint, pointcloud_topic, frame_cache_name(n, fields),
+                                pointCloudDecoder.POINTCLOUD_DECODER_VERSION)
+            if cached is None:
+                break
+            frames.append(PointCloudFrame(n, cached[0], cached[1]))
+
+    pending = {}
+    if imu_topic and imu_df is None:
+        pending['imu'] = imu_topic
+    if gps_topic and gps_df is None:
+        pending['gps'] = gps_topic
+    if pointcloud_topic and len(frames) < max_frames:
+        pending['pointcloud'] = pointcloud_topic
+
+    if pending:
+        with open_bag(bag_file) as reader:
+            kind_ids = {kind: reader.connection_ids([topic]) for kind, topic in pending.items()}
+            wanted = set().union(*kind_ids.values())
+            batches = {'imu': [], 'gps': []}
+            lidar_seen = 0
+
+            for chunk in reader.select_chunks(wanted):
+                if not wanted.intersection(chunk.counts):
+                    continue  # Ya no queda nada que decodificar en este chunk
+                spans = reader.read_chunk_spans(chunk, wanted)
+                if spans is None:
+                    continue
+
+                for kind, body_dtype in (('imu', rosMessages.IMU_BODY_DTYPE), ('gps', rosMessages.NAVSATFIX_BODY_DTYPE)):
+                    if kind in kind_ids:
+                        mask = np.isin(spans.connections, list(kind_ids[kind]))
+                        if mask.any():
+                            batches[kind].append(rosMessages.decode_stamped_columns(
+                                select_spans(spans, mask), body_dtype, reader.message_encoding))
+
+                if 'pointcloud' in kind_ids and lidar_seen < max_frames:
+                    lidar = select_spans(spans, np.isin(spans.connections, list(kind_ids['pointcloud'])))
+                    view = memoryview(spans.buffer)
+                    for pos, length, timestamp in zip(lidar.positions.tolist(), lidar.lengths.tolist(),
+                                                      lidar.timestamps.tolist()):
+                        if lidar_seen >= len(frames):
+                            cloud = rosMessages.deserialize_pointcloud2(view[pos:pos + length],
+                                                                        reader.message_encoding)
+                            columns = pointCloudDecoder.decode_pointcloud2(cloud, fields=fields)
+                            frame = PointCloudFrame(lidar_seen, timestamp / 1e9, columns)
+                            store_frame(fingerprint, pointcloud_topic, frame_cache_name(lidar_seen, fields),
+                                        pointCloudDecoder.POINTCLOUD_DECODER_VERSION, frame.timestamp, columns)
+                            frames.append(frame)
+                        lidar_seen += 1
+                        if lidar_seen >= max_frames:
+                            # Frames completos: el resto de chunks solo de LiDAR ya no se leen
+                            wanted -= kind_ids['pointcloud']
+                            break
+
+        if 'imu' in pending:
+            imu_df = pd.DataFrame(rosMessages.concatenate_columns(batches['imu'], rosMessages.IMU_BODY_DTYPE))
+            store_table(fingerprint, imu_topic, IMU_TABLE, rosMessages.TABLE_DECODER_VERSION, imu_df)
+        if 'gps' in pending:
+            gps_df = pd.DataFrame(rosMessages.concatenate_columns(batches['gps'], rosMessages.NAVSATFIX_BODY_DTYPE))
+            store_table(fingerprint, gps_topic, GPS_TABLE, rosMessages.TABLE_DECODER_VERSION, gps_df)
+
+    return SensorExtraction(pointcloud_topic, imu_topic, gps_topic, frames, imu_df, gps_df)
@@ -0,0 +1,591 @@
+import bz2
+import heapq
+import os
+import struct
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Lector de archivos .bag de ROS1 (formato v2.0) que no necesita ROS instalado.
+# Lee una sola vez los registros de conexión y de índice de chunks y después
+# salta directamente a los chunks que cubren el topic y el rango de tiempo pedidos.
+
+BAG_MAGIC = b'#ROSBAG V2.0\n'
+
+OP_MSG_DATA = 0x02
+OP_BAG_HEADER = 0x03
+OP_INDEX_DATA = 0x04
+OP_CHUNK = 0x05
+OP_CHUNK_INFO = 0x06
+OP_CONNECTION = 0x07
+
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_TIME = struct.Struct('<II')
+_CHUNK_COUNT = struct.Struct('<II')
+_INDEX_ENTRY = np.dtype([('secs', '<u4'), ('nsecs', '<u4'), ('offset', '<u4')])
+
+
+class Connection(NamedTuple):
+    id: int
+    topic: str
+    msg_type: str
+    md5sum: str
+    message_definition: str
+    callerid: str
+    latching: bool
+
+
+class ChunkInfo(NamedTuple):
+    position: int           # Posición del registro de chunk en el archivo
+    start_time: int         # Nanosegundos
+    end_time: int           # Nanosegundos
+    counts: Dict[int, int]  # Mensajes por id de conexión
+
+
+class BagIndex(NamedTuple):
+    connections: Dict[int, Connection]
+    chunks: List[ChunkInfo]  # Ordenados por start_time
+
+
+class MessageSpans(NamedTuple):
+    """Ubicación de los mensajes de un chunk descomprimido (arreglos paralelos)"""
+    buffer: np.ndarray       # Chunk descomprimido (uint8)
+    connections: np.ndarray  # Id de conexión de cada mensaje
+    positions: np.ndarray    # Inicio del mensaje serializado dentro del buffer
+    lengths: np.ndarray      # Longitud del mensaje serializado
+    timestamps: np.ndarray   # Tiempo de grabación en nanosegundos
+
+
+class BagMessage(NamedTuple):
+    topic: str
+    data: memoryview        # Mensaje serializado (vista sobre el chunk)
+    timestamp: int          # Tiempo de grabación en nanosegundos
+    connection: Connection
+
+
+def to_nanoseconds(seconds: Optional[float]) -> Optional[int]:
+    """Convierte segundos (float) a nanosegundos enteros"""
+    return None if seconds is None else int(round(seconds * 1e9))
+
+
+def bag_file_path(bag_file) -> str:
+    """Ruta real de un archivo subido con Gradio o de una ruta normal"""
+    return os.fspath(bag_file.name if hasattr(bag_file, 'name') else bag_file)
+
+
+def _read_time(value: bytes) -> int:
+    secs, nsecs = _TIME.unpack(value)
+    return secs * 1_000_000_000 + nsecs
+
+
+def _gather_u32(raw: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Lee enteros uint32 little-endian en posiciones arbitrarias de un buffer"""
+    return (raw[positions].astype(np.int64)
+            | raw[positions + 1].astype(np.int64) << 8
+            | raw[positions + 2].astype(np.int64) << 16
+            | raw[positions + 3].astype(np.int64) << 24)
+
+
+def select_spans(spans: MessageSpans, selection) -> MessageSpans:
+    """Subconjunto de mensajes (máscara booleana o índices) sobre el mismo buffer"""
+    return MessageSpans(spans.buffer, spans.connections[selection], spans.positions[selection],
+                        spans.lengths[selection], spans.timestamps[selection])
+
+
+def filter_spans(spans: MessageSpans, start: Optional[int] = None, end: Optional[int] = None) -> MessageSpans:
+    """Aplica la ventana de tiempo y ordena los mensajes por tiempo"""
+    times = spans.timestamps
+    keep = np.ones(len(times), dtype=bool)
+    if start is not None:
+        keep &= times >= start
+    if end is not None:
+        keep &= times <= end
+    selected = np.flatnonzero(keep)
+    return select_spans(spans, selected[np.argsort(times[selected], kind='stable')])
+
+
+def _parse_header(buf, pos: int, end: int) -> Dict[bytes, bytes]:
+    """Decodifica los campos nombre=valor de la cabecera de un registro"""
+    fields = {}
+    while pos < end:
+        (length,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        name, _, value = bytes(buf[pos:pos + length]).partition(b'=')
+        fields[name] = value
+        pos += length
+    return fields
+
+
+def _decompress(compression: str, data: bytes) -> bytes:
+    if compression == 'none':
+        return data
+    if compression == 'bz2':
+        return bz2.decompress(data)
+    if compression == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("Se necesita el paquete 'lz4' para leer chunks comprimidos con lz4")
+        return lz4.frame.decompress(data)
+    raise ValueError(f"Compresión de chunk no soportada: {compression}")
+
+
+def _parse_connection(header: Dict[bytes, bytes], data: bytes) -> Connection:
+    fields = _parse_header(data, 0, len(data))
+    return Connection(
+        id=_U32.unpack(header[b'conn'])[0],
+        topic=header[b'topic'].decode('utf-8'),
+        msg_type=fields.get(b'type', b'').decode('utf-8'),
+        md5sum=fields.get(b'md5sum', b'').decode('utf-8'),
+        message_definition=fields.get(b'message_definition', b'').decode('utf-8', errors='replace'),
+        callerid=fields.get(b'callerid', b'').decode('utf-8', errors='replace'),
+        latching=fields.get(b'latching', b'0') == b'1',
+    )
+
+
+class BagReaderBase(ABC):
+    """
+    API común de los lectores de bags indexados (ROS1 y ROS 2).
+
+    Las subclases construyen `self.index` (conexiones y chunks con sus tiempos y
+    mensajes por conexión) e implementan read_chunk_spans; el resto (catálogo de
+    topics, lectura por ventana de tiempo, acceso aleatorio) se resuelve aquí.
+    """
+
+    # Codificación de los mensajes serializados (ver rosMessages)
+    message_encoding = 'ros1'
+
+    @abstractmethod
+    def read_chunk_spans(self, chunk: ChunkInfo, conn_ids, start: Optional[int] = None,
+                         end: Optional[int] = None) -> Optional[MessageSpans]:
+        """
+        Lee un chunk y ubica los mensajes de las conexiones dentro de [start, end]
+        (ns), ordenados por tiempo, o None si no tiene ninguno
+        """
+
+    def chunk_message_times(self, chunk: ChunkInfo, conn_ids) -> np.ndarray:
+        """
+        Tiempos de grabación (ns) de los mensajes de las conexiones en el chunk.
+        Las subclases pueden evitar leer el contenido usando los índices del formato.
+        """
+        spans = self.read_chunk_spans(chunk, conn_ids)
+        return spans.timestamps if spans is not None else np.empty(0, dtype=np.int64)
+
+    def _topic_bounds(self, conn_ids):
+        """
+        (primer, último) tiempo de grabación (ns) de las conexiones, leyendo solo
+        los chunks de los extremos (más de uno si se solapan)
+        """
+        chunks = [chunk for chunk in self.index.chunks if any(conn in conn_ids for conn in chunk.counts)]
+        start = end = None
+        for chunk in chunks:
+            if start is not None and chunk.start_time > start:
+                break
+            times = self.chunk_message_times(chunk, conn_ids)
+            if len(times):
+                start = int(times.min()) if start is None else min(start, int(times.min()))
+        for chunk in sorted(chunks, key=lambda chunk: chunk.end_time, reverse=True):
+            if end is not None and chunk.end_time < end:
+                break
+            times = self.chunk_message_times(chunk, conn_ids)
+            if len(times):
+                end = int(times.max()) if end is None else max(end, int(times.max()))
+        return start, end
+
+    def _read_chunk(self, chunk: ChunkInfo, conn_ids, start: Optional[int], end: Optional[int]) -> List[BagMessage]:
+        """Lee un chunk y devuelve sus mensajes filtrados, ordenados por tiempo"""
+        spans = self.read_chunk_spans(chunk, conn_ids, start, end)
+        if spans is None:
+            return []
+
+        view = memoryview(spans.buffer)
+        connections = self.index.connections
+        return [
+            BagMessage(connections[conn].topic, view[pos:pos + length], timestamp, connections[conn])
+            for conn, pos, length, timestamp in zip(spans.connections.tolist(), spans.positions.tolist(),
+                                                    spans.lengths.tolist(), spans.timestamps.tolist())
+        ]
+
+    # ------------------------------------------------------------------
+    # API pública
+
+    @property
+    def connections(self) -> Dict[int, Connection]:
+        return self.index.connections
+
+    @property
+    def topics(self) -> List[str]:
+        return sorted({connection.topic for connection in self.connections.values()})
+
+    def connection_ids(self, topics: Optional[Iterable[str]] = None) -> set:
+        """Ids de conexión de los topics indicados (todos si topics=None)"""
+        if topics is None:
+            return set(self.connections)
+        if isinstance(topics, str):
+            topics = [topics]
+        wanted = set(topics)
+        return {conn_id for conn_id, connection in self.connections.items() if connection.topic in wanted}
+
+    def message_count(self, topic: str) -> int:
+        conn_ids = self.connection_ids([topic])
+        return sum(count for chunk in self.index.chunks
+                   for conn, count in chunk.counts.items() if conn in conn_ids)
+
+    def messages_before(self, topic: str, start_time: Optional[float]) -> int:
+        """
+        Mensajes del topic grabados antes de start_time (segundos): posición dentro
+        del topic del primer mensaje que devuelve read_messages desde ese instante
+        """
+        start = to_nanoseconds(start_time)
+        if start is None:
+            return 0
+        conn_ids = self.connection_ids([topic])
+        count = 0
+        for chunk in self.index.chunks:
+            if chunk.start_time >= start or not any(conn in conn_ids for conn in chunk.counts):
+                continue
+            if chunk.end_time < start:
+                count += sum(chunk.counts.get(conn, 0) for conn in conn_ids)
+            else:
+                count += int((self.chunk_message_times(chunk, conn_ids) < start).sum())
+        return count
+
+    @property
+    def start_time(self) -> Optional[float]:
+        return self.index.chunks[0].start_time / 1e9 if self.index.chunks else None
+
+    @property
+    def end_time(self) -> Optional[float]:
+        return max(chunk.end_time for chunk in self.index.chunks) / 1e9 if self.index.chunks else None
+
+    def topic_table(self) -> pd.DataFrame:
+        """
+        Catálogo de topics con las mismas columnas que bagpy.bagreader.topic_table,
+        con los tiempos del primer y el último mensaje de cada topic
+        """
+        rows = []
+        for topic in self.topics:
+            conn_ids = self.connection_ids([topic])
+            msg_type = next(c.msg_type for c in self.connections.values() if c.topic == topic)
+            count = self.message_count(topic)
+            start, end = self._topic_bounds(conn_ids) if count else (None, None)
+
+            duration = (end - start) / 1e9 if count > 1 else 0.0
+            rows.append({
+                'Topics': topic,
+                'Types': msg_type,
+                'Message Count': count,
+                'Frequency': (count - 1) / duration if duration > 0 else float('nan'),
+                'Start Time': start / 1e9 if start is not None else float('nan'),
+                'End Time': end / 1e9 if end is not None else float('nan'),
+            })
+        return pd.DataFrame(rows, columns=['Topics', 'Types', 'Message Count', 'Frequency',
+                                           'Start Time', 'End Time'])
+
+    def select_chunks(self, conn_ids, start: Optional[int] = None, end: Optional[int] = None) -> List[ChunkInfo]:
+        """
+        Chunks que contienen alguna de las conexiones dentro del rango de tiempo
+        (nivel bajo: ids de conexión y tiempos en nanosegundos)
+        """
+        return [
+            chunk for chunk in self.index.chunks
+            if any(conn in conn_ids for conn in chunk.counts)
+            and (start is None or chunk.end_time >= start)
+            and (end is None or chunk.start_time <= end)
+        ]
+
+    def read_messages(self, topics: Optional[Iterable[str]] = None,
+                      start_time: Optional[float] = None,
+                      end_time: Optional[float] = None) -> Iterator[BagMessage]:
+        """
+        Devuelve los mensajes crudos (bytes serializados) de los topics pedidos en
+        orden de tiempo. Solo se leen los chunks que contienen esos topics dentro
+        del rango [start_time, end_time] (segundos).
+        """
+        conn_ids = self.connection_ids(topics)
+        start = to_nanoseconds(start_time)
+        end = to_nanoseconds(end_time)
+        pending = self.select_chunks(conn_ids, start, end)
+
+        # Mezcla por tiempo: solo se cargan a la vez los chunks que se solapan
+        heap = []
+        sequence = 0
+        next_chunk = 0
+        while next_chunk < len(pending) or heap:
+            if not heap:
+                messages = self._read_chunk(pending[next_chunk], conn_ids, start, end)
+                next_chunk += 1
+                if not messages:
+                    continue
+                if next_chunk >= len(pending) or pending[next_chunk].start_time > messages[-1].timestamp:
+                    # Caso habitual: el chunk no se solapa con el siguiente
+                    yield from messages
+                    continue
+                for message in messages:
+                    heapq.heappush(heap, (message.timestamp, sequence, message))
+                    sequence += 1
+
+            while next_chunk < len(pending) and pending[next_chunk].start_time <= heap[0][0]:
+                for message in self._read_chunk(pending[next_chunk], conn_ids, start, end):
+                    heapq.heappush(heap, (message.timestamp, sequence, message))
+                    sequence += 1
+                next_chunk += 1
+            yield heapq.heappop(heap)[2]
+
+    def read_message_spans(self, topics: Optional[Iterable[str]] = None,
+                           start_time: Optional[float] = None,
+                           end_time: Optional[float] = None) -> Iterator[MessageSpans]:
+        """
+        Igual que read_messages pero devuelve, chunk a chunk, los arreglos con la
+        ubicación de cada mensaje en el chunk descomprimido. Permite decodificar
+        mensajes de tamaño fijo de forma vectorizada. Los chunks se entregan por
+        orden de inicio (orden temporal salvo en bags con chunks solapados).
+        """
+        conn_ids = self.connection_ids(topics)
+        start = to_nanoseconds(start_time)
+        end = to_nanoseconds(end_time)
+        for chunk in self.select_chunks(conn_ids, start, end):
+            spans = self.read_chunk_spans(chunk, conn_ids, start, end)
+            if spans is not None and len(spans.positions):
+                yield spans
+
+    def read_message_at(self, topic: str, n: int) -> BagMessage:
+        """Devuelve el mensaje número n de un topic leyendo un único chunk"""
+        conn_ids = self.connection_ids([topic])
+        seen = 0
+        for chunk in self.index.chunks:
+            count = sum(chunk.counts.get(conn, 0) for conn in conn_ids)
+            if seen + count > n:
+                return self._read_chunk(chunk, conn_ids, None, None)[n - seen]
+            seen += count
+        raise IndexError(f"El topic {topic} solo tiene {seen} mensajes")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BagReader(BagReaderBase):
+    """
+    Lector indexado de archivos .bag de ROS1 con acceso aleatorio por tiempo.
+
+    Se puede pasar un BagIndex ya calculado para evitar volver a leer el índice.
+    """
+
+    def __init__(self, path, index: Optional[BagIndex] = None):
+        self.path = bag_file_path(path)
+        self._file = open(self.path, 'rb')
+        if self._file.read(len(BAG_MAGIC)) != BAG_MAGIC:
+            self._file.close()
+            raise ValueError(f"{self.path} no es un archivo .bag v2.0")
+        self.index = index if index is not None else self._read_index()
+
+    # ------------------------------------------------------------------
+    # Lectura de registros
+
+    def _read_record(self, position: Optional[int] = None):
+        """Lee un registro completo y devuelve (cabecera, datos)"""
+        if position is not None:
+            self._file.seek(position)
+        raw = self._file.read(4)
+        if len(raw) < 4:
+            return None, None
+        (header_len,) = _U32.unpack(raw)
+        header_bytes = self._file.read(header_len)
+        (data_len,) = _U32.unpack(self._file.read(4))
+        header = _parse_header(header_bytes, 0, header_len)
+        return header, self._file.read(data_len)
+
+    def _read_index(self) -> BagIndex:
+        header, _ = self._read_record(len(BAG_MAGIC))
+        if header is None or header.get(b'op') != bytes([OP_BAG_HEADER]):
+            raise ValueError("Cabecera del bag no encontrada")
+
+        (index_pos,) = _U64.unpack(header[b'index_pos'])
+        if index_pos == 0:
+            # Bag sin índice (grabación interrumpida): reconstruirlo recorriéndolo
+            return self._scan_index()
+
+        (conn_count,) = _U32.unpack(header[b'conn_count'])
+        (chunk_count,) = _U32.unpack(header[b'chunk_count'])
+
+        connections = {}
+        chunks = []
+        self._file.seek(index_pos)
+        for _ in range(conn_count + chunk_count):
+            record_header, data = self._read_record()
+            if record_header is None:
+                break
+            op = record_header.get(b'op')
+            if op == bytes([OP_CONNECTION]):
+                connection = _parse_connection(record_header, data)
+                connections[connection.id] = connection
+            elif op == bytes([OP_CHUNK_INFO]):
+                counts = {}
+                for offset in range(0, len(data), 8):
+                    conn, count = _CHUNK_COUNT.unpack_from(data, offset)
+                    counts[conn] = count
+                chunks.append(ChunkInfo(
+                    position=_U64.unpack(record_header[b'chunk_pos'])[0],
+                    start_time=_read_time(record_header[b'start_time']),
+                    end_time=_read_time(record_header[b'end_time']),
+                    counts=counts,
+                ))
+
+        chunks.sort(key=lambda chunk: (chunk.start_time, chunk.position))
+        return BagIndex(connections, chunks)
+
+    def _scan_index(self) -> BagIndex:
+        """Reconstruye el índice leyendo todos los chunks del archivo"""
+        connections = {}
+        chunks = []
+        position = self._file.tell()
+        while True:
+            try:
+                record_header, data = self._read_record(position)
+            except struct.error:
+                break  # Último registro truncado
+            if record_header is None:
+                break
+            op = record_header.get(b'op')
+            if op == bytes([OP_CONNECTION]):
+                connection = _parse_connection(record_header, data)
+                connections[connection.id] = connection
+            elif op == bytes([OP_CHUNK]):
+                counts = {}
+                start_time = end_time = None
+                buf, records = self._iter_chunk_records(record_header, data)
+                for msg_header, pos, length in records:
+                    msg_op = msg_header.get(b'op')
+                    if msg_op == bytes([OP_CONNECTION]):
+                        connection = _parse_connection(msg_header, buf[pos:pos + length])
+                        connections.setdefault(connection.id, connection)
+                    elif msg_op == bytes([OP_MSG_DATA]):
+                        conn = _U32.unpack(msg_header[b'conn'])[0]
+                        timestamp = _read_time(msg_header[b'time'])
+                        counts[conn] = counts.get(conn, 0) + 1
+                        start_time = timestamp if start_time is None else min(start_time, timestamp)
+                        end_time = timestamp if end_time is None else max(end_time, timestamp)
+                if counts:
+                    chunks.append(ChunkInfo(position, start_time, end_time, counts))
+            position = self._file.tell()
+
+        chunks.sort(key=lambda chunk: (chunk.start_time, chunk.position))
+        return BagIndex(connections, chunks)
+
+    def _iter_chunk_records(self, chunk_header: Dict[bytes, bytes], data: bytes):
+        """
+        Descomprime un chunk y devuelve (buffer, iterador de registros), donde cada
+        registro es (cabecera, posición del contenido, longitud del contenido)
+        """
+        compression = chunk_header.get(b'compression', b'none').decode('ascii')
+        buf = _decompress(compression, data)
+
+        def records():
+            pos = 0
+            end = len(buf)
+            while pos + 4 <= end:
+                (header_len,) = _U32.unpack_from(buf, pos)
+                pos += 4
+                header = _parse_header(buf, pos, pos + header_len)
+                pos += header_len
+                (data_len,) = _U32.unpack_from(buf, pos)
+                pos += 4
+                yield header, pos, data_len
+                pos += data_len
+
+        return buf, records()
+
+    def _read_chunk_index(self, chunk: ChunkInfo, conn_ids) -> Optional[Dict[int, np.ndarray]]:
+        """
+        Lee los registros IndexData que siguen al chunk (tiempo y offset de cada
+        mensaje por conexión). Debe llamarse justo después de leer el chunk.
+        Devuelve None si el bag no los tiene.
+        """
+        entries = {}
+        for _ in range(len(chunk.counts)):
+            header, data = self._read_record()
+            if header is None or header.get(b'op') != bytes([OP_INDEX_DATA]):
+                return None
+            conn = _U32.unpack(header[b'conn'])[0]
+            if conn in conn_ids:
+                entries[conn] = np.frombuffer(data, dtype=_INDEX_ENTRY)
+        return entries
+
+    def chunk_message_times(self, chunk: ChunkInfo, conn_ids) -> np.ndarray:
+        """Tiempos de los mensajes del chunk desde sus registros IndexData, sin descomprimirlo"""
+        self._file.seek(chunk.position)
+        (header_len,) = _U32.unpack(self._file.read(4))
+        self._file.seek(header_len, os.SEEK_CUR)
+        (data_len,) = _U32.unpack(self._file.read(4))
+        self._file.seek(data_len, os.SEEK_CUR)
+        entries = self._read_chunk_index(chunk, conn_ids)
+        if entries is None:
+            return super().chunk_message_times(chunk, conn_ids)
+        if not entries:
+            return np.empty(0, dtype=np.int64)
+        entry = np.concatenate(list(entries.values()))
+        return entry['secs'].astype(np.int64) * 1_000_000_000 + entry['nsecs']
+
+    def read_chunk_spans(self, chunk: ChunkInfo, conn_ids, start: Optional[int] = None,
+                         end: Optional[int] = None) -> Optional['MessageSpans']:
+        """
+        Lee un chunk y ubica sus mensajes filtrados, ordenados por tiempo
+        (nivel bajo: ids de conexión y tiempos en nanosegundos)
+        """
+        chunk_header, data = self._read_record(chunk.position)
+        entries = self._read_chunk_index(chunk, conn_ids)
+        if entries is None:
+            return self._walk_chunk(chunk_header, data, conn_ids, start, end)
+        if not entries:
+            return None
+
+        compression = chunk_header.get(b'compression', b'none').decode('ascii')
+        raw = np.frombuffer(_decompress(compression, data), dtype=np.uint8)
+
+        conns = np.concatenate([np.full(len(entry), conn, dtype=np.int64) for conn, entry in entries.items()])
+        entry = np.concatenate(list(entries.values()))
+        times = entry['secs'].astype(np.int64) * 1_000_000_000 + entry['nsecs']
+        offsets = entry['offset'].astype(np.int64)
+
+        # Ubicar el contenido de cada mensaje sin decodificar sus cabeceras
+        positions = offsets + 4 + _gather_u32(raw, offsets)
+        lengths = _gather_u32(raw, positions)
+        positions += 4
+        return filter_spans(MessageSpans(raw, conns, positions, lengths, times), start, end)
+
+    def _walk_chunk(self, chunk_header, data, conn_ids, start: Optional[int],
+                    end: Optional[int]) -> 'MessageSpans':
+        """Recorre el chunk registro a registro (bags sin registros IndexData)"""
+        buf, records = self._iter_chunk_records(chunk_header, data)
+        conns, positions, lengths, times = [], [], [], []
+        for header, pos, length in records:
+            if header.get(b'op') != bytes([OP_MSG_DATA]):
+                continue
+            conn = _U32.unpack(header[b'conn'])[0]
+            if conn not in conn_ids:
+                continue
+            conns.append(conn)
+            positions.append(pos)
+            lengths.append(length)
+            times.append(_read_time(header[b'time']))
+
+        spans = MessageSpans(
+            np.frombuffer(buf, dtype=np.uint8),
+            np.array(conns, dtype=np.int64),
+            np.array(positions, dtype=np.int64),
+            np.array(lengths, dtype=np.int64),
+            np.array(times, dtype=np.int64),
+        )
+        return filter_spans(spans, start, end)
+
+    def close(self):
+        self._file.close()
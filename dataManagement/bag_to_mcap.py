@@ -1,58 +1,119 @@
-import bagpy
-from bagpy import bagreader
-from mcap.writer import Writer
-import pandas as pd
+import argparse
+import os
 import time
+from typing import Optional
 
-# Ruta al archivo .bag
-bag_file = 'hall_02.bag'
+from mcap.writer import CompressionType, Writer
 
-# Leer el archivo .bag
-b = bagreader(bag_file)
+from dataManagement.bagCache import open_bag_file
 
-# Abrir archivo de salida .mcap
-with open('hall_02.mcap', 'wb') as f:
-    writer = Writer(f)
-    writer.start(profile='ros1')
+# Conversión de bags a MCAP (para Foxglove) en una sola pasada secuencial. Se
+# copian los bytes serializados de cada mensaje y las definiciones de cada
+# conexión tal cual, sin deserializar nada; en memoria solo están el chunk que
+# se está leyendo del bag y el que se está escribiendo en el MCAP.
+#
+# Uso: python -m dataManagement.bag_to_mcap hall_02.bag [otro.bag ...] [-o salida.mcap]
 
-    for topic in b.topics:
-        print(f'Procesando tópico: {topic}')
+COMPRESSION = {
+    'zstd': CompressionType.ZSTD,
+    'lz4': CompressionType.LZ4,
+    'none': CompressionType.NONE,
+}
 
-        # Leer los datos del tópico como DataFrame
-        csv_file = b.message_by_topic(topic)
-        df = pd.read_csv(csv_file)
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
 
-        # Obtener tipo de mensaje
-        msg_def = b.topic_msg_definition(topic)
-        schema_id = writer.register_schema(
-            name=topic.replace("/", "_"),
-            encoding="ros1msg",
-            data=msg_def.encode("utf-8")
-        )
+# Cada cuántos mensajes se actualiza el progreso
+PROGRESS_EVERY = 5000
 
-        channel_id = writer.register_channel(
-            topic=topic,
-            message_encoding="ros1",
-            schema_id=schema_id
-        )
 
-        # Escribir cada fila del DataFrame como mensaje (sin deserializar)
-        for _, row in df.iterrows():
-            # No tenemos acceso al binario original del mensaje,
-            # así que esto será más una exportación simbólica.
-            # Este paso es representativo; MCAP espera datos binarios ROS.
-            message_data = str(row.to_dict()).encode('utf-8')
+# Codificación del mensaje -> (perfil del MCAP, codificación del schema)
+PROFILES = {
+    'ros1': ('ros1', 'ros1msg'),
+    'cdr': ('ros2', 'ros2msg'),
+}
 
-            # Estimar timestamps
-            timestamp = int(row['Time'] * 1e9)
 
+def convert_bag_to_mcap(bag_path: str, mcap_path: Optional[str] = None, compression: str = 'zstd',
+                        chunk_size: int = DEFAULT_CHUNK_SIZE, progress: bool = True) -> str:
+    """
+    Convierte un bag (ROS1, o ROS 2 sqlite3) a MCAP con chunks comprimidos, índices
+    de chunks y de mensajes y sección de resumen. Devuelve la ruta del MCAP.
+    """
+    if compression not in COMPRESSION:
+        raise ValueError(f"Compresión no soportada: {compression} (opciones: {', '.join(COMPRESSION)})")
+    mcap_path = mcap_path or os.path.splitext(bag_path.rstrip(os.sep))[0] + '.mcap'
+
+    started = time.time()
+    with open_bag_file(bag_path) as reader, open(mcap_path, 'wb') as f:
+        writer = Writer(f, chunk_size=chunk_size, compression=COMPRESSION[compression])
+        profile, schema_encoding = PROFILES[reader.message_encoding]
+        writer.start(profile=profile, library='NovaLidar bag_to_mcap')
+
+        # Un schema por tipo de mensaje y un canal por conexión del bag
+        schemas = {}
+        channels = {}
+        for conn_id, connection in sorted(reader.connections.items()):
+            key = (connection.msg_type, connection.md5sum)
+            if key not in schemas:
+                schemas[key] = writer.register_schema(
+                    name=connection.msg_type,
+                    encoding=schema_encoding,
+                    data=connection.message_definition.encode('utf-8'),
+                )
+            metadata = {'md5sum': connection.md5sum, 'callerid': connection.callerid}
+            if connection.latching:
+                metadata['latching'] = '1'
+            channels[conn_id] = writer.register_channel(
+                topic=connection.topic,
+                message_encoding=reader.message_encoding,
+                schema_id=schemas[key],
+                metadata=metadata,
+            )
+
+        total = sum(sum(chunk.counts.values()) for chunk in reader.index.chunks)
+        written = 0
+        copied = 0
+        for message in reader.read_messages():
             writer.add_message(
-                channel_id=channel_id,
-                log_time=timestamp,
-                publish_time=timestamp,
-                data=message_data
+                channel_id=channels[message.connection.id],
+                log_time=message.timestamp,
+                publish_time=message.timestamp,
+                data=message.data,
             )
+            written += 1
+            copied += len(message.data)
+            if progress and written % PROGRESS_EVERY == 0:
+                elapsed = max(time.time() - started, 1e-9)
+                print(f"\r{os.path.basename(bag_path)}: {written}/{total} mensajes "
+                      f"({100.0 * written / max(total, 1):.1f}%, {copied / elapsed / 1e6:.1f} MB/s)",
+                      end='', flush=True)
+
+        writer.finish()
+
+    if progress:
+        elapsed = max(time.time() - started, 1e-9)
+        print(f"\r✅ {mcap_path}: {written} mensajes, {copied / 1e6:.1f} MB en {elapsed:.1f} s "
+              f"({copied / elapsed / 1e6:.1f} MB/s)")
+    return mcap_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte bags de ROS a MCAP sin deserializar los mensajes")
+    parser.add_argument('bags', nargs='*', default=['hall_02.bag'], help="Bags de entrada")
+    parser.add_argument('-o', '--output', help="Archivo .mcap de salida (solo con un bag de entrada)")
+    parser.add_argument('--compression', choices=sorted(COMPRESSION), default='zstd')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Tamaño de chunk en bytes")
+    args = parser.parse_args()
+
+    if args.output and len(args.bags) > 1:
+        parser.error("--output solo se puede usar con un único bag")
+
+    for bag_path in args.bags:
+        try:
+            convert_bag_to_mcap(bag_path, args.output, args.compression, args.chunk_size)
+        except Exception as e:
+            print(f"\nError convirtiendo {bag_path}: {str(e)}")
 
-    writer.finish()
 
-print("✅ Conversión completada: hall_02.mcap")
+if __name__ == '__main__':
+    main()
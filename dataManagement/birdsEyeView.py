@@ -0,0 +1,149 @@
+import struct
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+# Vista cenital (BEV) de un frame: la nube se proyecta en una rejilla 2D con
+# tres canales (altura máxima, densidad e intensidad media) acumulados con
+# np.maximum.at y np.bincount sobre el índice de celda de cada punto. No hay
+# bucles por punto ni por celda, así que un frame se rasteriza en milisegundos
+# y una miniatura en mucho menos, lo que permite una tira de todo el recorrido.
+# La imagen tiene el frente del sensor (+x) arriba y la izquierda (+y) a la izquierda.
+
+# Semilado del área representada alrededor del sensor (metros) y tamaño de celda
+BEV_RANGE = 50.0
+BEV_RESOLUTION = 0.2
+
+# Alturas que cubre la escala de color del canal de altura (metros, marco del sensor)
+BEV_HEIGHT_RANGE = (-3.0, 3.0)
+
+# Densidad que satura el canal de densidad (puntos por celda, escala logarítmica)
+BEV_MAX_DENSITY = 64
+
+# Miniaturas de la tira de todo el recorrido
+THUMBNAIL_PIXELS = 96
+STRIP_COLUMNS = 12
+MAX_STRIP_FRAMES = 600
+
+
+class BevRaster(NamedTuple):
+    """Rejilla cenital (H, W); las celdas sin puntos tienen altura NaN y densidad 0"""
+    height: np.ndarray      # (H, W) float32, z máxima
+    density: np.ndarray     # (H, W) int64, puntos por celda
+    intensity: np.ndarray   # (H, W) float32, intensidad media
+    extent: tuple           # (x_min, x_max, y_min, y_max) en metros
+    resolution: float
+
+
+def rasterize_bev(columns: Dict[str, np.ndarray], bev_range: float = BEV_RANGE,
+                  resolution: float = BEV_RESOLUTION, x_range=None, y_range=None) -> BevRaster:
+    """
+    Rasteriza la nube en una rejilla cenital de celdas de `resolution` metros.
+    Por defecto cubre [-bev_range, bev_range] en x e y; x_range / y_range
+    permiten un área no centrada. Los puntos fuera del área se ignoran.
+    """
+    x_min, x_max = x_range if x_range is not None else (-bev_range, bev_range)
+    y_min, y_max = y_range if y_range is not None else (-bev_range, bev_range)
+    rows = max(int(np.ceil((x_max - x_min) / resolution)), 1)
+    cols = max(int(np.ceil((y_max - y_min) / resolution)), 1)
+
+    x = np.asarray(columns['x'], dtype=np.float32)
+    y = np.asarray(columns['y'], dtype=np.float32)
+    z = np.asarray(columns['z'], dtype=np.float32)
+    scale = np.float32(1.0 / resolution)
+    # Fila 0 = x máxima (frente arriba), columna 0 = y máxima (izquierda)
+    row = np.floor((np.float32(x_max) - x) * scale)
+    col = np.floor((np.float32(y_max) - y) * scale)
+    inside = (row >= 0) & (row < rows) & (col >= 0) & (col < cols) & np.isfinite(z)
+    cell = row[inside].astype(np.int64) * cols + col[inside].astype(np.int64)
+
+    density = np.bincount(cell, minlength=rows * cols)
+    height = np.full(rows * cols, -np.inf, dtype=np.float32)
+    np.maximum.at(height, cell, z[inside])
+    height[density == 0] = np.nan
+    if 'intensity' in columns:
+        total = np.bincount(cell, np.asarray(columns['intensity'], dtype=np.float32)[inside], rows * cols)
+        intensity = (total / np.maximum(density, 1)).astype(np.float32)
+    else:
+        intensity = np.zeros(rows * cols, dtype=np.float32)
+
+    shape = (rows, cols)
+    return BevRaster(height.reshape(shape), density.reshape(shape), intensity.reshape(shape),
+                     (x_min, x_max, y_min, y_max), resolution)
+
+
+def _to_byte(values: np.ndarray, low: float, high: float) -> np.ndarray:
+    scaled = (values - low) * (255.0 / max(high - low, 1e-6))
+    return np.clip(np.nan_to_num(scaled, nan=0.0), 0, 255).astype(np.uint8)
+
+
+def bev_rgb(raster: BevRaster, height_range=BEV_HEIGHT_RANGE,
+            max_density: int = BEV_MAX_DENSITY) -> np.ndarray:
+    """
+    Imagen (H, W, 3) uint8 con un canal por capa: rojo = altura máxima, verde =
+    densidad (logarítmica) e azul = intensidad (normalizada a su percentil 99).
+    Las celdas vacías quedan negras.
+    """
+    occupied = raster.density > 0
+    red = _to_byte(raster.height, height_range[0], height_range[1])
+    green = _to_byte(np.log1p(raster.density.astype(np.float32)), 0.0, float(np.log1p(max_density)))
+    values = raster.intensity[occupied]
+    high = float(np.percentile(values, 99)) if len(values) else 1.0
+    blue = _to_byte(raster.intensity, 0.0, high)
+    image = np.stack((red, green, blue), axis=-1)
+    image[~occupied] = 0
+    # Una celda ocupada nunca queda negra del todo
+    image[occupied, 1] = np.maximum(image[occupied, 1], 40)
+    return image
+
+
+def thumbnail_strip(thumbnails: List[np.ndarray], columns: int = STRIP_COLUMNS,
+                    gap: int = 2) -> np.ndarray:
+    """Junta miniaturas del mismo tamaño en una cuadrícula de `columns` por fila"""
+    if not thumbnails:
+        return np.zeros((1, 1, 3), dtype=np.uint8)
+    size_y, size_x = thumbnails[0].shape[:2]
+    rows = -(-len(thumbnails) // columns)
+    columns = min(columns, len(thumbnails))
+    strip = np.full((rows * (size_y + gap) - gap, columns * (size_x + gap) - gap, 3), 255, dtype=np.uint8)
+    for k, image in enumerate(thumbnails):
+        top = (k // columns) * (size_y + gap)
+        left = (k % columns) * (size_x + gap)
+        strip[top:top + size_y, left:left + size_x] = image
+    return strip
+
+
+def bev_thumbnails(frames: Iterable[Dict[str, np.ndarray]], bev_range: float = BEV_RANGE,
+                   pixels: int = THUMBNAIL_PIXELS, max_frames: Optional[int] = MAX_STRIP_FRAMES) -> List[np.ndarray]:
+    """Miniatura BEV (pixels x pixels) de cada frame"""
+    resolution = 2.0 * bev_range / pixels
+    thumbnails = []
+    for columns in frames:
+        thumbnails.append(bev_rgb(rasterize_bev(columns, bev_range, resolution)))
+        if max_frames is not None and len(thumbnails) >= max_frames:
+            break
+    return thumbnails
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """PNG de una imagen (H, W, 3) o (H, W) uint8 sin dependencias externas"""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    color_type = 2 if image.ndim == 3 else 0
+    height, width = image.shape[:2]
+    # Cada fila empieza con el byte de filtro (0 = sin filtro)
+    raw = np.zeros((height, 1 + image[0].size), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def save_png(path: str, image: np.ndarray) -> str:
+    with open(path, 'wb') as f:
+        f.write(encode_png(image))
+    return path
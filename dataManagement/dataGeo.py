@@ -1,12 +1,16 @@
 import os
 import pandas as pd
 import numpy as np
-import bagpy
-from bagpy import bagreader
 import tempfile
 from typing import Optional, Tuple
 import folium
 import logging
+from dataManagement.bagCache import get_bag_metadata, get_topic_table, open_bag
+from dataManagement.rosMessages import NAVSATFIX_BODY_DTYPE, TABLE_DECODER_VERSION, decode_topic_columns
+from dataManagement.topicCache import load_table, store_table
+
+# Nombre de la tabla GPS en la caché en disco
+GPS_TABLE = 'gps'
 
 # Configurar logging básico
 logging.basicConfig(level=logging.WARNING)  # Reducir logging para velocidad
@@ -21,28 +25,44 @@ def get_gps_data(bag_file=None, topic_name=None):
 
     try:
         bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
-        b = bagreader(bag_path)
+        topic_table = get_topic_table(bag_path)
 
         # Buscar topic GPS
         if topic_name:
-            topic_table = b.topic_table
             if topic_name not in topic_table['Topics'].values:
                 return pd.DataFrame(), f"Topic '{topic_name}' not found."
             gps_topic = topic_name
         else:
-            gps_topic = find_gps_topic_fast(b.topic_table)
+            gps_topic = find_gps_topic_fast(topic_table)
             if not gps_topic:
                 return pd.DataFrame(), "No GPS topic found."
         
         # Extraer mensajes GPS
-        gps_csv = b.message_by_topic(gps_topic)
-        gps_df = pd.read_csv(gps_csv)
+        gps_df = read_gps_dataframe(bag_path, gps_topic)
         
         return process_gps_dataframe_fast(gps_df)
 
     except Exception as e:
         return pd.DataFrame(), f"Error: {str(e)}"
 
+def read_gps_dataframe(bag_path, gps_topic: str) -> pd.DataFrame:
+    """
+    Decodifica un topic sensor_msgs/NavSatFix directamente a columnas de NumPy,
+    con las mismas columnas que generaba bagpy (latitude, longitude, altitude, ...)
+    """
+    # Reutilizar la tabla si este bag ya se decodificó antes (en esta u otra sesión)
+    fingerprint = get_bag_metadata(bag_path).fingerprint
+    cached = load_table(fingerprint, gps_topic, GPS_TABLE, TABLE_DECODER_VERSION)
+    if cached is not None:
+        return cached
+
+    with open_bag(bag_path) as reader:
+        columns = decode_topic_columns(reader.read_message_spans([gps_topic]), NAVSATFIX_BODY_DTYPE,
+                                       reader.message_encoding)
+    table = pd.DataFrame(columns)
+    store_table(fingerprint, gps_topic, GPS_TABLE, TABLE_DECODER_VERSION, table)
+    return table
+
 def find_gps_topic_fast(topic_table) -> Optional[str]:
     """
     Búsqueda rápida de topic GPS
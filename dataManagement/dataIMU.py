@@ -2,16 +2,27 @@ import os
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import bagpy
-from bagpy import bagreader
 import numpy as np
 from scipy.spatial.transform import Rotation
+from dataManagement.bagCache import get_bag_metadata, get_topic_table, open_bag
+from dataManagement.rosMessages import IMU_BODY_DTYPE, TABLE_DECODER_VERSION, decode_topic_columns
+from dataManagement.timeSeriesDecimation import MIN_MAX, decimate
+from dataManagement.topicCache import load_table, store_table
 
-def get_imu_data(bag_file=None):
+# Nombre de la tabla IMU en la caché en disco
+IMU_TABLE = 'imu'
+
+# Ancho aproximado (px) de cada subgráfica: las series se reducen a este ancho
+# (la figura mide 1000 px con dos columnas)
+TRACE_PIXELS = 500
+
+def get_imu_data(bag_file=None, time_range=None, decimation: str = MIN_MAX):
     """
     Procesa el archivo .bag y devuelve:
     - DataFrame con los datos del IMU
     - Figura con 4 gráficas (aceleración, velocidad angular, orientación y magnitud)
+    `time_range` = (inicio, fin) en segundos desde la primera muestra limita la
+    figura a esa ventana, que se vuelve a reducir desde la resolución completa.
     """
     if bag_file is None:
         # Modo demo si no se proporciona archivo
@@ -20,23 +31,39 @@ def get_imu_data(bag_file=None):
     try:
         # Procesar el archivo .bag
         bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
-        b = bagreader(bag_path)
         
-        # Buscar el topic del IMU automáticamente
-        imu_topic = find_imu_topic(b.topic_table)
+        # Buscar el topic del IMU automáticamente (catálogo en caché)
+        imu_topic = find_imu_topic(get_topic_table(bag_path))
         if not imu_topic:
             return None, create_empty_plot("No se encontró ningún topic de IMU en el archivo .bag")
         
         # Extraer datos del IMU
-        imu_csv = b.message_by_topic(imu_topic)
-        imu_df = pd.read_csv(imu_csv)
+        imu_df = read_imu_dataframe(bag_path, imu_topic)
         
         # Procesar datos y crear visualizaciones
-        return process_imu_dataframe(imu_df)
+        return process_imu_dataframe(imu_df, time_range, decimation)
         
     except Exception as e:
         return None, create_empty_plot(f"Error procesando datos IMU: {str(e)}")
 
+def read_imu_dataframe(bag_path, imu_topic):
+    """
+    Decodifica un topic sensor_msgs/Imu directamente a columnas de NumPy, con las
+    mismas columnas que generaba bagpy (Time, header.*, orientation.x, ...)
+    """
+    # Reutilizar la tabla si este bag ya se decodificó antes (en esta u otra sesión)
+    fingerprint = get_bag_metadata(bag_path).fingerprint
+    cached = load_table(fingerprint, imu_topic, IMU_TABLE, TABLE_DECODER_VERSION)
+    if cached is not None:
+        return cached
+
+    with open_bag(bag_path) as reader:
+        columns = decode_topic_columns(reader.read_message_spans([imu_topic]), IMU_BODY_DTYPE,
+                                       reader.message_encoding)
+    table = pd.DataFrame(columns)
+    store_table(fingerprint, imu_topic, IMU_TABLE, TABLE_DECODER_VERSION, table)
+    return table
+
 def find_imu_topic(topic_table):
     """
     Busca automáticamente el topic del IMU en la tabla de topics
@@ -46,9 +73,11 @@ def find_imu_topic(topic_table):
             return row['Topics']
     return None
 
-def process_imu_dataframe(imu_df):
+def process_imu_dataframe(imu_df, time_range=None, decimation: str = MIN_MAX):
     """
-    Procesa el DataFrame del IMU y crea las visualizaciones
+    Procesa el DataFrame del IMU y crea las visualizaciones. Cada serie se
+    reduce a TRACE_PIXELS con `decimation` (ver timeSeriesDecimation); con
+    `time_range` (segundos desde la primera muestra) solo se dibuja esa ventana.
     """
     # Limpiar y preparar datos
     if 'Time' not in imu_df.columns and 'header.stamp.secs' in imu_df.columns:
@@ -84,6 +113,19 @@ def process_imu_dataframe(imu_df):
     imu_df['acc_mag'] = np.sqrt(imu_df['acc_x']**2 + imu_df['acc_y']**2 + imu_df['acc_z']**2)
     imu_df['gyro_mag'] = np.sqrt(imu_df['gyro_x']**2 + imu_df['gyro_y']**2 + imu_df['gyro_z']**2)
     
+    # Eje de tiempo desde la primera muestra (el mismo que usa time_range),
+    # ventana visible y reducción de cada serie al ancho de la gráfica
+    time = imu_df['Time'].to_numpy(dtype=np.float64)
+    time = time - time.min() if len(time) else time
+    visible = np.ones(len(time), dtype=bool)
+    if time_range is not None:
+        visible = (time >= time_range[0]) & (time <= time_range[1])
+    time = time[visible]
+
+    def line(column, name, color):
+        x, y = decimate(time, imu_df[column].to_numpy()[visible], TRACE_PIXELS, decimation or MIN_MAX)
+        return go.Scatter(x=x, y=y, name=name, line=dict(color=color))
+    
     # Crear figura con subplots
     fig = make_subplots(
         rows=2, cols=2,
@@ -99,44 +141,44 @@ def process_imu_dataframe(imu_df):
     
     # Gráfica de aceleración
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['acc_x'], name='Acc X', line=dict(color='red')),
+        line('acc_x', 'Acc X', 'red'),
         row=1, col=1
     )
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['acc_y'], name='Acc Y', line=dict(color='green')),
+        line('acc_y', 'Acc Y', 'green'),
         row=1, col=1
     )
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['acc_z'], name='Acc Z', line=dict(color='blue')),
+        line('acc_z', 'Acc Z', 'blue'),
         row=1, col=1
     )
     
     # Gráfica de velocidad angular
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['gyro_x'], name='Gyro X', line=dict(color='red')),
+        line('gyro_x', 'Gyro X', 'red'),
         row=1, col=2
     )
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['gyro_y'], name='Gyro Y', line=dict(color='green')),
+        line('gyro_y', 'Gyro Y', 'green'),
         row=1, col=2
     )
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['gyro_z'], name='Gyro Z', line=dict(color='blue')),
+        line('gyro_z', 'Gyro Z', 'blue'),
         row=1, col=2
     )
     
     # Gráfica de orientación (si está disponible)
     if all(col in imu_df.columns for col in ['roll', 'pitch', 'yaw']):
         fig.add_trace(
-            go.Scatter(x=imu_df['Time'], y=imu_df['roll'], name='Roll', line=dict(color='red')),
+            line('roll', 'Roll', 'red'),
             row=2, col=1
         )
         fig.add_trace(
-            go.Scatter(x=imu_df['Time'], y=imu_df['pitch'], name='Pitch', line=dict(color='green')),
+            line('pitch', 'Pitch', 'green'),
             row=2, col=1
         )
         fig.add_trace(
-            go.Scatter(x=imu_df['Time'], y=imu_df['yaw'], name='Yaw', line=dict(color='blue')),
+            line('yaw', 'Yaw', 'blue'),
             row=2, col=1
         )
     else:
@@ -149,19 +191,23 @@ def process_imu_dataframe(imu_df):
     
     # Gráfica de magnitudes
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['acc_mag'], name='Aceleración', line=dict(color='purple')),
+        line('acc_mag', 'Aceleración', 'purple'),
         row=2, col=2
     )
     fig.add_trace(
-        go.Scatter(x=imu_df['Time'], y=imu_df['gyro_mag'], name='Velocidad Angular', line=dict(color='orange')),
+        line('gyro_mag', 'Velocidad Angular', 'orange'),
         row=2, col=2
     )
     
+    title = "Análisis de Datos IMU"
+    if time_range is not None:
+        title += f" ({time_range[0]:g}-{time_range[1]:g} s, {len(time)} muestras)"
+
     # Actualizar diseño
     fig.update_layout(
         height=800,
         width=1000,
-        title_text="Análisis de Datos IMU",
+        title_text=title,
         showlegend=True,
         hovermode="x unified"
     )
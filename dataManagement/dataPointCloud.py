@@ -1,13 +1,43 @@
-import bagpy
-from bagpy import bagreader
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
-from typing import List
+from typing import Dict, Iterator, List, NamedTuple, Optional
 import tempfile
 import os
-import struct
+import time
+from dataManagement.bagCache import get_bag_metadata, get_topic_table, open_bag
+from dataManagement.bagReader import bag_file_path
+from dataManagement.frameScrubber import FrameScrubber, get_scrubber
+from dataManagement.birdsEyeView import (BEV_RANGE, BEV_RESOLUTION, MAX_STRIP_FRAMES, bev_rgb, bev_thumbnails,
+                                         rasterize_bev, thumbnail_strip)
+from dataManagement.pointCloudDecoder import (DEFAULT_EXTRA_FIELDS, POINTCLOUD_DECODER_VERSION, decode_pointcloud2,
+                                              empty_columns)
+from dataManagement.pointCloudFilters import DEFAULT_POINT_BUDGET, VOXEL_CENTROID, downsample_pointcloud
+from dataManagement.lasReader import PREVIEW_POINTS, LasReader, is_las_file, las_summary
+from dataManagement.lidarMapping import build_lidar_map, pair_velocity
+from dataManagement.motionDeskew import deskew_pointcloud, load_imu_track
+from dataManagement.groundSegmentation import GROUND_COLUMN, GROUND_PLANE, NO_GROUND, segment_ground
+from dataManagement.objectClustering import ObjectBoxes, box_edges, cluster_objects
+from dataManagement.outlierRemoval import NO_OUTLIER_REMOVAL, RADIUS_OUTLIERS, remove_outliers
+from dataManagement.rangeImage import project_range_image
+from dataManagement.pointCloudLOD import COARSE_POINTS, PointCloudLOD, get_lod
+from dataManagement.plotlyTransport import (COLOR_LEVELS, color_indices, colorbar_ticks, fit_quantization,
+                                            pointcloud_bounds, quantize_points, quantized_axis,
+                                            to_quantized_units)
+from dataManagement.rosMessages import deserialize_pointcloud2
+from dataManagement.topicCache import load_frame, store_frame
+
+# Canales de la vista previa de la imagen de rango
+RANGE_CHANNEL = 'range'
+INTENSITY_CHANNEL = 'intensity'
+RANGE_IMAGE_CHANNELS = (RANGE_CHANNEL, INTENSITY_CHANNEL)
+
+# Columnas máximas de la imagen de rango que se envían al navegador
+RANGE_IMAGE_MAX_COLUMNS = 1024
+
+# Lado máximo de la vista cenital (píxeles)
+BEV_MAX_PIXELS = 2048
 
 def get_pointcloud_topics(bag_file):
     """
@@ -17,9 +47,11 @@ def get_pointcloud_topics(bag_file):
         return None, "No hay archivo seleccionado"
     
     try:
-        bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
-        b = bagreader(bag_path)
-        topic_table = b.topic_table
+        bag_path = bag_file_path(bag_file)
+        if is_las_file(bag_path):
+            # Un .las/.laz no tiene topics: se usa el nombre del archivo como topic
+            return os.path.basename(bag_path), las_summary(bag_path)
+        topic_table = get_topic_table(bag_path)
         
         debug_info = "=== INFORMACIÓN DEL ARCHIVO BAG ===\n"
         debug_info += f"Archivo: {bag_path}\n"
@@ -50,64 +82,580 @@ def get_pointcloud_topics(bag_file):
         print(f"Error al leer el archivo .bag: {str(e)}")
         return []
 
-def visualize_pointcloud_topic(bag_file, selected_topic: str):
+def find_pointcloud_topic(topic_table):
+    """
+    Devuelve el primer topic de PointCloud2 de la tabla de topics
+    """
+    for _, row in topic_table.iterrows():
+        if 'PointCloud2' in row['Types']:
+            return row['Topics']
+    return None
+
+def visualize_pointcloud_topic(bag_file, selected_topic: str, downsample_method: str = VOXEL_CENTROID,
+                               leaf_size: float = 0.0, max_points: int = DEFAULT_POINT_BUDGET,
+                               quantize: bool = False, ground_method: str = NO_GROUND,
+                               hide_ground: bool = False, detect_objects: bool = False,
+                               outlier_method: str = RADIUS_OUTLIERS, deskew: bool = False):
+    """
+    Visualiza el topic de PointCloud2 seleccionado automáticamente (solo la
+    figura; ver render_pointcloud_topic)
+    """
+    return render_pointcloud_topic(bag_file, selected_topic, downsample_method, leaf_size, max_points, quantize,
+                                   ground_method, hide_ground, detect_objects, outlier_method, deskew)[0]
+
+def render_pointcloud_topic(bag_file, selected_topic: str, downsample_method: str = VOXEL_CENTROID,
+                            leaf_size: float = 0.0, max_points: int = DEFAULT_POINT_BUDGET,
+                            quantize: bool = False, ground_method: str = NO_GROUND,
+                            hide_ground: bool = False, detect_objects: bool = False,
+                            outlier_method: str = RADIUS_OUTLIERS, deskew: bool = False):
     """
-    Visualiza el topic de PointCloud2 seleccionado automáticamente
+    Figura del primer frame del topic y texto para el panel de debug.
+    Con deskew=True se corrige antes el movimiento durante el barrido con el IMU
+    del bag (ver deskew_pointcloud_frame). Después se elimina el ruido con
+    `outlier_method` (ver outlierRemoval).
+    La nube se reduce con `downsample_method` (ver pointCloudFilters); con
+    leaf_size=0 el lado del voxel se ajusta para no pasar de max_points.
+    quantize=True envía las coordenadas como int16 (ver plotlyTransport).
+    Con `ground_method` se separa el suelo (ver groundSegmentation) y se colorea
+    aparte, o se descarta antes de submuestrear con hide_ground=True. Con
+    detect_objects=True se agrupan los puntos que no son suelo en objetos y se
+    dibujan sus cajas orientadas (ver objectClustering).
     """
     if bag_file is None:
-        return create_empty_plot("No se ha seleccionado archivo")
+        return create_empty_plot("No se ha seleccionado archivo"), "No hay archivo seleccionado"
     
-    if selected_topic is None:
-        return create_empty_plot("No se encontraron topics de PointCloud2 en el archivo")
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if selected_topic is None and not is_las_file(bag_path):
+        message = "No se encontraron topics de PointCloud2 en el archivo"
+        return create_empty_plot(message), message
     
     try:
-        bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
-        points_x, points_y, points_z = extract_pointcloud_with_rosbag(bag_path, selected_topic)
-        
-        if not points_x or len(points_x) == 0:
-            return create_empty_plot(f"No se pudieron extraer puntos del topic {selected_topic}")
-        
-        # Submuestrear si hay demasiados puntos
-        if len(points_x) > 1000000:
-            indices = np.random.choice(len(points_x), 1000000, replace=False)
-            points_x = [points_x[i] for i in indices]
-            points_y = [points_y[i] for i in indices]
-            points_z = [points_z[i] for i in indices]
-        
-        # Crear visualización 3D
-        fig = go.Figure(data=[go.Scatter3d(
-            x=points_x,
-            y=points_y,
-            z=points_z,
-            mode='markers',
-            marker=dict(
-                size=1.5,
-                color=points_z,
-                colorscale='Viridis',
-                opacity=0.6,
-                colorbar=dict(title="Altura (Z)")
-            ),
-            name='Point Cloud'
-        )])
-        
-        fig.update_layout(
-            title=f'Nube de Puntos - {selected_topic}<br>Total puntos: {len(points_x)}',
-            scene=dict(
-                xaxis_title='X (metros)',
-                yaxis_title='Y (metros)',
-                zaxis_title='Z (metros)',
-                aspectmode='data',
-                camera=dict(eye=dict(x=1.2, y=1.2, z=1.2))
-            ),
-            width=900,
-            height=700,
-            showlegend=True
-        )
+        if is_las_file(bag_path):
+            # Nube LAS/LAZ: se parte de una muestra uniforme del archivo, que puede
+            # tener cientos de millones de puntos
+            with LasReader(bag_path) as reader:
+                total_points = len(reader)
+                columns = reader.sample(PREVIEW_POINTS)
+            selected_topic = os.path.basename(bag_path)
+        else:
+            frame = load_pointcloud_frame(bag_path, selected_topic, 0)
+            columns = frame.columns
+            total_points = len(columns['x'])
         
-        return fig
+        if total_points == 0:
+            message = f"No se pudieron extraer puntos del topic {selected_topic}"
+            return create_empty_plot(message), message
+
+        debug_info = ""
+        if deskew and not is_las_file(bag_path):
+            columns, debug_info = deskew_pointcloud_frame(bag_path, selected_topic, frame)
+
+        # Las nubes LAS están en coordenadas del mundo: el rango al origen no es el del sensor
+        columns, boxes, removed, ground_info, noise_debug = clean_and_segment(
+            columns, outlier_method, ground_method, hide_ground, detect_objects,
+            scale_with_range=not is_las_file(bag_path))
+        debug_info += noise_debug
+
+        # Reducir la nube con una rejilla de voxels (conserva estructuras finas)
+        columns, used_leaf = downsample_pointcloud(columns, downsample_method,
+                                                   leaf_size or None, int(max_points))
+        leaf_info = f" (voxel {used_leaf:.3f} m)" if used_leaf else ""
+        noise_info = f", {removed} de ruido" if removed else ""
+        title = (f'Nube de Puntos - {selected_topic}<br>Mostrando {len(columns["x"])} de {total_points} '
+                 f'puntos{leaf_info}{noise_info}{ground_info}')
+        return create_pointcloud_figure(columns, title, quantize=quantize, boxes=boxes), debug_info
         
     except Exception as e:
-        return create_empty_plot(f"Error al visualizar: {str(e)}")
+        return create_empty_plot(f"Error al visualizar: {str(e)}"), f"Error al visualizar: {str(e)}"
+
+def clean_and_segment(columns: Dict[str, np.ndarray], outlier_method: str = RADIUS_OUTLIERS,
+                      ground_method: str = NO_GROUND, hide_ground: bool = False,
+                      detect_objects: bool = False, scale_with_range: bool = True):
+    """
+    Filtro de ruido, segmentación del suelo y detección de objetos de un frame,
+    comunes a la vista del primer frame y al slider. Devuelve (columnas, cajas
+    o None, puntos eliminados como ruido, resumen para el título, texto de debug).
+    """
+    total_points = len(columns['x'])
+    outlier_method = outlier_method or NO_OUTLIER_REMOVAL
+    started = time.time()
+    columns, removed = remove_outliers(columns, outlier_method, scale_with_range=scale_with_range)
+    debug_info = "=== FILTRO DE RUIDO ===\n"
+    debug_info += f"Método: {outlier_method}\n"
+    debug_info += f"Puntos eliminados: {removed} de {total_points} ({100.0 * removed / max(total_points, 1):.2f}%)\n"
+    debug_info += f"Tiempo: {1000.0 * (time.time() - started):.0f} ms\n"
+
+    ground_info = ""
+    segment = ground_method and ground_method != NO_GROUND
+    is_ground = None
+    if segment or detect_objects:
+        # Los objetos se buscan siempre sin el suelo (por defecto, plano global)
+        is_ground = segment_ground(columns, ground_method if segment else GROUND_PLANE)
+
+    boxes = None
+    if detect_objects:
+        _, boxes = cluster_objects(columns, is_ground)
+        ground_info += f", {len(boxes)} objetos"
+
+    if segment:
+        ground_info += f", suelo {100.0 * is_ground.mean():.0f}%"
+        if hide_ground:
+            columns = {name: np.asarray(column)[~is_ground] for name, column in columns.items()}
+            ground_info += " (oculto)"
+        else:
+            columns = dict(columns)
+            columns[GROUND_COLUMN] = is_ground.astype(np.uint8)
+    return columns, boxes, removed, ground_info, debug_info
+
+def visualize_pointcloud_progressive(bag_file, selected_topic: str, downsample_method: str = VOXEL_CENTROID,
+                                     leaf_size: float = 0.0, max_points: int = DEFAULT_POINT_BUDGET,
+                                     quantize: bool = False, ground_method: str = NO_GROUND,
+                                     hide_ground: bool = False, detect_objects: bool = False,
+                                     outlier_method: str = RADIUS_OUTLIERS, deskew: bool = False):
+    """
+    Versión progresiva para Gradio (generador de (figura, texto de debug)):
+    primero envía un nivel grueso del octree, que se dibuja casi al instante, y
+    después la nube con el detalle pedido
+    """
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if bag_file is None or (selected_topic is None and not is_las_file(bag_path)):
+        yield render_pointcloud_topic(bag_file, selected_topic)
+        return
+
+    try:
+        if is_las_file(bag_path):
+            with LasReader(bag_path) as reader:
+                if len(reader) > COARSE_POINTS:
+                    coarse = reader.sample(COARSE_POINTS)
+                    yield create_pointcloud_figure(
+                        coarse, f'Nube de Puntos - {os.path.basename(bag_path)}<br>Vista previa: '
+                                f'{len(coarse["x"])} de {len(reader)} puntos', quantize=quantize), "Cargando..."
+        else:
+            lod = load_pointcloud_lod(bag_path, selected_topic, 0)
+            if len(lod) > COARSE_POINTS:
+                coarse = lod.level_for_budget(COARSE_POINTS)
+                yield create_pointcloud_figure(
+                    coarse, f'Nube de Puntos - {selected_topic}<br>Vista previa: {len(coarse["x"])} de {len(lod)} puntos',
+                    quantize=quantize), "Cargando..."
+    except Exception as e:
+        yield create_empty_plot(f"Error al visualizar: {str(e)}"), f"Error al visualizar: {str(e)}"
+        return
+
+    yield render_pointcloud_topic(bag_file, selected_topic, downsample_method, leaf_size, max_points, quantize,
+                                  ground_method, hide_ground, detect_objects, outlier_method, deskew)
+
+def pointcloud_frame_count(bag_file, selected_topic: str) -> int:
+    """Número de frames del topic según el catálogo del bag (0 si no hay topic)"""
+    if bag_file is None or selected_topic is None:
+        return 0
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if is_las_file(bag_path):
+        return 0
+    table = get_topic_table(bag_path)
+    counts = table.loc[table['Topics'] == selected_topic, 'Message Count']
+    return int(counts.iloc[0]) if len(counts) else 0
+
+def visualize_pointcloud_frame(bag_file, selected_topic: str, n: int = 0,
+                               downsample_method: str = VOXEL_CENTROID, leaf_size: float = 0.0,
+                               max_points: int = DEFAULT_POINT_BUDGET, quantize: bool = False,
+                               ground_method: str = NO_GROUND, hide_ground: bool = False,
+                               detect_objects: bool = False, outlier_method: str = RADIUS_OUTLIERS,
+                               deskew: bool = False):
+    """
+    Frame n del topic para el slider de tiempo, con el mismo procesado que la
+    vista del primer frame (deskew, ruido, suelo, objetos; ver
+    render_pointcloud_topic). Los frames salen del búfer de frameScrubber, que
+    ya los tiene procesados y submuestreados y prepara en segundo plano los
+    contiguos, así que avanzar o retroceder un frame solo cuesta construir la
+    figura. Devuelve (figura, texto para el panel de debug).
+    """
+    if bag_file is None or selected_topic is None:
+        return create_empty_plot("No hay archivo o topic seleccionado"), "No hay archivo o topic seleccionado"
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if is_las_file(bag_path):
+        message = "El slider de tiempo necesita un topic PointCloud2 con varios frames"
+        return create_empty_plot(message), message
+
+    try:
+        started = time.time()
+        leaf_size = leaf_size or None
+        max_points = int(max_points)
+        outlier_method = outlier_method or NO_OUTLIER_REMOVAL
+        ground_method = ground_method or NO_GROUND
+
+        def load(index):
+            frame = load_pointcloud_frame(bag_path, selected_topic, index)
+            return frame.timestamp, frame.columns
+
+        def prepare(index, timestamp, columns):
+            debug_info = ""
+            if deskew:
+                columns, debug_info = deskew_pointcloud_frame(bag_path, selected_topic,
+                                                              PointCloudFrame(index, timestamp, columns))
+            columns, boxes, removed, summary, noise_debug = clean_and_segment(
+                columns, outlier_method, ground_method, hide_ground, detect_objects)
+            columns = downsample_pointcloud(columns, downsample_method, leaf_size, max_points)[0]
+            return columns, {'boxes': boxes, 'removed': removed, 'summary': summary,
+                             'debug': debug_info + noise_debug}
+
+        key = (get_bag_metadata(bag_path).fingerprint, selected_topic, downsample_method, leaf_size,
+               max_points, outlier_method, ground_method, bool(hide_ground), bool(detect_objects), bool(deskew))
+        scrubber = get_scrubber(key, lambda: FrameScrubber(
+            load, prepare, pointcloud_frame_count(bag_path, selected_topic)))
+        if len(scrubber) == 0:
+            message = f"No se encontraron frames en el topic {selected_topic}"
+            return create_empty_plot(message), message
+
+        was_cached = int(n) in scrubber.cached_indices()
+        frame = scrubber.get(int(n))
+        loaded = time.time()
+        if frame.total_points == 0:
+            message = f"Frame {frame.index} del topic {selected_topic} sin puntos"
+            return create_empty_plot(message), message
+
+        details = frame.details
+        noise_info = f", {details['removed']} de ruido" if details['removed'] else ""
+        title = (f'Nube de Puntos - {selected_topic}<br>Frame {frame.index + 1} de {len(scrubber)} '
+                 f'(t = {frame.timestamp:.3f} s) - {len(frame.columns["x"])} de {frame.total_points} puntos'
+                 f'{noise_info}{details["summary"]}')
+        fig = create_pointcloud_figure(frame.columns, title, quantize=quantize, boxes=details['boxes'])
+        finished = time.time()
+
+        cached = scrubber.cached_indices()
+        info = f"=== FRAME {frame.index} - {selected_topic} ===\n"
+        info += f"Tiempo: {frame.timestamp:.3f} s\n"
+        info += f"Origen: {'búfer' if was_cached else 'bag'} ({1000.0 * (loaded - started):.0f} ms)\n"
+        info += f"Figura: {1000.0 * (finished - loaded):.0f} ms\n"
+        info += (f"Búfer: {len(cached)} frames ({min(cached)}-{max(cached)}), "
+                 f"{scrubber.cached_bytes / 1024 ** 2:.1f} MB\n")
+        info += details['debug']
+        return fig, info
+    except Exception as e:
+        return create_empty_plot(f"Error al visualizar: {str(e)}"), f"Error al visualizar: {str(e)}"
+
+def refine_pointcloud_region(bag_file, selected_topic: str, center_x: float, center_y: float, center_z: float,
+                             radius: float, max_points: int = DEFAULT_POINT_BUDGET, quantize: bool = False):
+    """
+    Muestra con más detalle la región cúbica alrededor de un centro (semilado
+    `radius`), sobre un nivel grueso del resto de la nube como contexto
+    """
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if bag_file is None or (selected_topic is None and not is_las_file(bag_path)):
+        return visualize_pointcloud_topic(bag_file, selected_topic)
+
+    try:
+        center = np.array([center_x, center_y, center_z], dtype=np.float64)
+        if is_las_file(bag_path):
+            # Recorte directo sobre el archivo: solo se escalan los puntos de la caja
+            with LasReader(bag_path) as reader:
+                region = reader.crop(center - float(radius), center + float(radius))
+                context = reader.sample(COARSE_POINTS)
+            region, _ = downsample_pointcloud(region, VOXEL_CENTROID, None, int(max_points))
+            selected_topic = os.path.basename(bag_path)
+        else:
+            lod = load_pointcloud_lod(bag_path, selected_topic, 0)
+            region = lod.region(center, float(radius), int(max_points))
+            context = lod.level_for_budget(COARSE_POINTS)
+        if len(region['x']) == 0:
+            return create_empty_plot("No hay puntos en la región indicada")
+
+        title = (f'Nube de Puntos - {selected_topic}<br>Región ({center_x:g}, {center_y:g}, {center_z:g}) '
+                 f'± {float(radius):g} m: {len(region["x"])} puntos')
+        return create_pointcloud_figure(region, title, context=context, quantize=quantize)
+    except Exception as e:
+        return create_empty_plot(f"Error al refinar la región: {str(e)}")
+
+def visualize_pointcloud_map(bag_file, selected_topic: str, stride: int = 1, max_frames: int = 0,
+                             max_points: int = DEFAULT_POINT_BUDGET, quantize: bool = False,
+                             deskew: bool = False):
+    """
+    Registra todos los frames del topic (ICP punto-a-plano, ver lidarMapping) y
+    muestra el mapa acumulado con la trayectoria del sensor. Con deskew=True
+    cada frame se corrige antes con el IMU del bag (ver motionDeskew).
+    Devuelve (figura, resumen para el panel de debug).
+    """
+    if bag_file is None or selected_topic is None:
+        return visualize_pointcloud_topic(bag_file, selected_topic), "No hay archivo o topic seleccionado"
+
+    try:
+        bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+        imu = load_imu_track(bag_path) if deskew else None
+        result = build_lidar_map(bag_path, selected_topic, stride=int(stride or 1),
+                                 max_frames=int(max_frames) or None, imu=imu)
+        total_points = len(result.map_columns['x'])
+        if total_points == 0:
+            return create_empty_plot(f"No se pudo construir el mapa del topic {selected_topic}"), ""
+
+        columns, _ = downsample_pointcloud(result.map_columns, VOXEL_CENTROID, None, int(max_points))
+        trajectory = result.poses[:, :3, 3]
+        length = float(np.linalg.norm(np.diff(trajectory, axis=0), axis=1).sum()) if len(trajectory) > 1 else 0.0
+        title = (f'Mapa - {selected_topic}<br>{len(result.poses)} frames, {length:.1f} m recorridos, '
+                 f'mostrando {len(columns["x"])} de {total_points} puntos')
+
+        summary = "=== MAPA LIDAR (ICP punto-a-plano) ===\n"
+        summary += f"Frames registrados: {len(result.poses)}\n"
+        summary += f"Keyframes: {result.keyframes}\n"
+        summary += f"Frames sin convergencia: {result.failed}\n"
+        if deskew:
+            summary += f"Deskew (IMU): {'sí' if imu is not None else 'no, el bag no tiene IMU'}\n"
+        summary += f"Longitud de la trayectoria: {length:.1f} m\n"
+        summary += f"Puntos en el mapa: {total_points}\n"
+        if result.load_time is not None:
+            summary += f"Cargado de la caché en {result.load_time:.2f} s (el cálculo tardó {result.elapsed:.1f} s)\n"
+        else:
+            summary += f"Tiempo de cálculo: {result.elapsed:.1f} s\n"
+        return create_pointcloud_figure(columns, title, quantize=quantize, trajectory=trajectory), summary
+
+    except Exception as e:
+        return create_empty_plot(f"Error al construir el mapa: {str(e)}"), f"Error al construir el mapa: {str(e)}"
+
+def visualize_range_image(bag_file, selected_topic: str, channel: str = RANGE_CHANNEL):
+    """
+    Vista previa 2D del primer frame como imagen de rango (filas = anillos,
+    columnas = azimut). Pesa muy poco: un valor por píxel, sin coordenadas.
+    """
+    if bag_file is None or selected_topic is None:
+        return visualize_pointcloud_topic(bag_file, selected_topic)
+
+    try:
+        bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+        if is_las_file(bag_path):
+            return create_empty_plot("La imagen de rango necesita un frame de un sensor (topic PointCloud2)")
+        frame = load_pointcloud_frame(bag_path, selected_topic, 0)
+        if len(frame.columns['x']) == 0:
+            return create_empty_plot(f"No se pudieron extraer puntos del topic {selected_topic}")
+
+        image = project_range_image(frame.columns)
+        return create_range_image_figure(image, f'Imagen de rango - {selected_topic}', channel)
+    except Exception as e:
+        return create_empty_plot(f"Error al crear la imagen de rango: {str(e)}")
+
+def visualize_bev(bag_file, selected_topic: str, bev_range: float = BEV_RANGE,
+                  resolution: float = BEV_RESOLUTION):
+    """
+    Vista cenital del primer frame (ver birdsEyeView) como imagen RGB:
+    rojo = altura máxima, verde = densidad, azul = intensidad. Devuelve
+    (imagen, texto para el panel de debug).
+    """
+    if bag_file is None:
+        return None, "No hay archivo seleccionado"
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if selected_topic is None and not is_las_file(bag_path):
+        return None, "No se encontraron topics de PointCloud2 en el archivo"
+
+    try:
+        bev_range = float(bev_range or BEV_RANGE)
+        resolution = float(resolution or BEV_RESOLUTION)
+        if is_las_file(bag_path):
+            with LasReader(bag_path) as reader:
+                columns = reader.sample(PREVIEW_POINTS)
+                low, high = reader.bounds()
+            # Todo el archivo, sin pasar de BEV_MAX_PIXELS por lado
+            resolution = max(resolution, float(max(high[0] - low[0], high[1] - low[1])) / BEV_MAX_PIXELS)
+            x_range, y_range = (low[0], high[0]), (low[1], high[1])
+            selected_topic = os.path.basename(bag_path)
+        else:
+            columns = load_pointcloud_frame(bag_path, selected_topic, 0).columns
+            resolution = max(resolution, 2.0 * bev_range / BEV_MAX_PIXELS)
+            x_range = y_range = None
+
+        started = time.time()
+        raster = rasterize_bev(columns, bev_range, resolution, x_range, y_range)
+        image = bev_rgb(raster)
+        elapsed = time.time() - started
+
+        info = f"=== VISTA CENITAL (BEV) - {selected_topic} ===\n"
+        info += f"Imagen: {image.shape[0]} x {image.shape[1]} px, celda {resolution:.2f} m\n"
+        info += f"Celdas ocupadas: {int((raster.density > 0).sum())}\n"
+        info += "Canales: rojo = altura máxima, verde = densidad, azul = intensidad\n"
+        info += f"Tiempo: {1000.0 * elapsed:.0f} ms\n"
+        return image, info
+    except Exception as e:
+        return None, f"Error al crear la vista cenital: {str(e)}"
+
+def visualize_bev_strip(bag_file, selected_topic: str, bev_range: float = BEV_RANGE, stride: int = 1):
+    """
+    Tira de miniaturas cenitales de todo el recorrido (uno de cada `stride`
+    frames, como mucho MAX_STRIP_FRAMES). Devuelve (imagen, texto de debug).
+    """
+    if bag_file is None or selected_topic is None:
+        return None, "No hay archivo o topic seleccionado"
+    bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+    if is_las_file(bag_path):
+        return None, "La tira de miniaturas necesita un topic PointCloud2 con varios frames"
+
+    try:
+        started = time.time()
+        frames = iter_pointcloud_frames(bag_path, selected_topic, stride=int(stride or 1),
+                                        max_frames=MAX_STRIP_FRAMES, fields=('intensity',))
+        thumbnails = bev_thumbnails((frame.columns for frame in frames), float(bev_range or BEV_RANGE))
+        elapsed = max(time.time() - started, 1e-9)
+        if not thumbnails:
+            return None, f"No se encontraron frames en el topic {selected_topic}"
+
+        info = f"=== TIRA CENITAL (BEV) - {selected_topic} ===\n"
+        info += f"Frames: {len(thumbnails)} (uno de cada {int(stride or 1)})\n"
+        info += f"Tiempo: {elapsed:.2f} s ({len(thumbnails) / elapsed:.0f} frames/s)\n"
+        return thumbnail_strip(thumbnails), info
+    except Exception as e:
+        return None, f"Error al crear la tira cenital: {str(e)}"
+
+def create_range_image_figure(image, title: str, channel: str = RANGE_CHANNEL):
+    """Heatmap de un canal de la imagen de rango; los píxeles vacíos quedan transparentes"""
+    values = image.intensity if channel == INTENSITY_CHANNEL else image.range
+    values = np.where(image.valid, values, np.nan).astype(np.float32)
+    height, width = values.shape
+    # Limitar el ancho enviado al navegador (una columna de cada `step`)
+    step = max(-(-width // RANGE_IMAGE_MAX_COLUMNS), 1)
+    values = values[:, ::step]
+    azimuth = (180.0 - (np.arange(0, width, step) + 0.5) * 360.0 / width).astype(np.float32)
+
+    fig = go.Figure(go.Heatmap(
+        z=values, x=azimuth, colorscale='Viridis',
+        colorbar=dict(title='m' if channel != INTENSITY_CHANNEL else 'intensidad'),
+        hovertemplate='azimut %{x:.1f}°<br>fila %{y}<br>%{z:.2f}<extra></extra>'
+    ))
+    fig.update_layout(
+        title=f'{title}<br>{height} x {width} píxeles, {100.0 * image.valid.mean():.0f}% ocupados',
+        xaxis=dict(title='Azimut (°)', autorange='reversed'),
+        yaxis=dict(title='Anillo', autorange='reversed'),
+        height=max(250, min(600, 120 + 6 * height))
+    )
+    return fig
+
+def create_pointcloud_figure(columns: Dict[str, np.ndarray], title: str,
+                             context: Optional[Dict[str, np.ndarray]] = None, quantize: bool = False,
+                             trajectory: Optional[np.ndarray] = None, boxes: Optional[ObjectBoxes] = None):
+    """
+    Figura 3D de una nube de puntos coloreada por altura (opcionalmente con una
+    nube de contexto en gris, una trayectoria (N, 3) como línea y las aristas de
+    cajas de objetos). Si la nube
+    trae la columna `ground` el suelo se dibuja aparte en un color fijo. Los
+    datos se pasan como arreglos de NumPy (float32, o int16 con quantize=True) y
+    el color como índice uint8, de modo que Plotly los serializa como typed
+    arrays binarios en vez de texto decimal.
+    """
+    ground = None
+    if GROUND_COLUMN in columns:
+        is_ground = np.asarray(columns[GROUND_COLUMN]).astype(bool)
+        ground = {name: np.asarray(column)[is_ground] for name, column in columns.items()}
+        columns = {name: np.asarray(column)[~is_ground] for name, column in columns.items()}
+
+    clouds = [columns] if context is None else [columns, context]
+    if ground is not None:
+        clouds.append(ground)
+    path = None
+    if trajectory is not None and len(trajectory):
+        path = {'x': trajectory[:, 0], 'y': trajectory[:, 1], 'z': trajectory[:, 2]}
+        clouds.append(path)
+    z_low = float(columns['z'].min()) if len(columns['z']) else 0.0
+    z_high = float(columns['z'].max()) if len(columns['z']) else 0.0
+
+    quantization = fit_quantization(*clouds) if quantize else None
+
+    def coordinates(cloud):
+        if quantization is not None:
+            return quantize_points(cloud, quantization)
+        return tuple(np.asarray(cloud[name], dtype=np.float32) for name in ('x', 'y', 'z'))
+
+    # Con coordenadas cuantizadas el hover mostraría enteros: se desactiva
+    hoverinfo = 'skip' if quantize else None
+
+    traces = []
+    if context is not None:
+        x, y, z = coordinates(context)
+        traces.append(go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode='markers',
+            marker=dict(size=1, color='lightgray', opacity=0.3),
+            hoverinfo=hoverinfo,
+            name='Contexto'
+        ))
+
+    if ground is not None and len(ground['x']):
+        x, y, z = coordinates(ground)
+        traces.append(go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode='markers',
+            marker=dict(size=1.5, color='saddlebrown', opacity=0.4),
+            hoverinfo=hoverinfo,
+            name='Suelo'
+        ))
+
+    # Crear visualización 3D
+    x, y, z = coordinates(columns)
+    traces.append(go.Scatter3d(
+        x=x,
+        y=y,
+        z=z,
+        mode='markers',
+        marker=dict(
+            size=1.5,
+            color=color_indices(columns['z'], z_low, z_high),
+            cmin=0,
+            cmax=COLOR_LEVELS - 1,
+            colorscale='Viridis',
+            opacity=0.6,
+            colorbar=dict(title="Altura (Z)", **colorbar_ticks(z_low, z_high))
+        ),
+        hoverinfo=hoverinfo,
+        name='Point Cloud'
+    ))
+
+    if path is not None:
+        x, y, z = coordinates(path)
+        traces.append(go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode='lines',
+            line=dict(color='red', width=4),
+            hoverinfo=hoverinfo,
+            name='Trayectoria'
+        ))
+
+    if boxes is not None and len(boxes):
+        edges = box_edges(boxes)
+        if quantization is not None:
+            x, y, z = to_quantized_units(edges, quantization)
+        else:
+            x, y, z = edges[:, 0], edges[:, 1], edges[:, 2]
+        traces.append(go.Scatter3d(
+            x=x,
+            y=y,
+            z=z,
+            mode='lines',
+            line=dict(color='orange', width=3),
+            connectgaps=False,
+            hoverinfo='skip',
+            name=f'Objetos ({len(boxes)})'
+        ))
+
+    axes = [dict(title=f'{name} (metros)') for name in ('X', 'Y', 'Z')]
+    if quantization is not None:
+        low, high = pointcloud_bounds(clouds)
+        for axis in range(3):
+            axes[axis].update(quantized_axis(quantization, axis, low[axis], high[axis]))
+
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        title=title,
+        scene=dict(
+            xaxis=axes[0],
+            yaxis=axes[1],
+            zaxis=axes[2],
+            aspectmode='data',
+            camera=dict(eye=dict(x=1.2, y=1.2, z=1.2))
+        ),
+        width=900,
+        height=700,
+        showlegend=True
+    )
+    return fig
 
 def create_empty_plot(message: str):
     """Crea un gráfico vacío con un mensaje"""
@@ -137,12 +685,11 @@ def debug_bag_file(bag_file):
     try:
         # Usar directamente la ruta del archivo de Gradio
         bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
+        if is_las_file(bag_path):
+            return las_summary(bag_path)
         
-        # Leer el archivo .bag con bagpy
-        b = bagreader(bag_path)
-        
-        # Obtener la tabla de topics
-        topic_table = b.topic_table
+        # Catálogo de topics (compartido con las demás pestañas)
+        topic_table = get_topic_table(bag_path)
         
         # Crear el texto de salida
         result = f"=== INFORMACIÓN DEL ARCHIVO BAG ===\n"
@@ -175,40 +722,121 @@ def debug_bag_file(bag_file):
     except Exception as e:
         return f"Error al leer el archivo .bag: {str(e)}\nTipo de error: {type(e).__name__}"
 
-def extract_pointcloud_with_rosbag(bag_path: str, topic: str):
-    """Extrae puntos de PointCloud2 usando rosbag de Python"""
+class PointCloudFrame(NamedTuple):
+    """Frame decodificado de un topic PointCloud2"""
+    index: int                      # Posición del mensaje dentro del topic
+    timestamp: float                # Tiempo de grabación en segundos
+    columns: Dict[str, np.ndarray]  # Columnas x, y, z (+ intensity, ring, time)
+
+def iter_pointcloud_frames(bag_path, topic: str, stride: int = 1,
+                           start_time: Optional[float] = None,
+                           end_time: Optional[float] = None,
+                           max_frames: Optional[int] = None,
+                           fields=DEFAULT_EXTRA_FIELDS) -> Iterator[PointCloudFrame]:
+    """
+    Recorre un topic PointCloud2 completo y devuelve los frames uno a uno.
+
+    Solo se mantiene en memoria el frame actual. `stride` toma uno de cada N
+    mensajes, `start_time`/`end_time` (segundos, mismo reloj que el bag) acotan
+    la ventana temporal y `max_frames` corta la iteración.
+    """
+    stride = max(int(stride), 1)
+    if max_frames is not None and max_frames <= 0:
+        return
+
+    yielded = 0
+    with open_bag(bag_path) as reader:
+        # Las posiciones son dentro del topic completo aunque se acote la ventana
+        first = reader.messages_before(topic, start_time)
+        messages = reader.read_messages([topic], start_time=start_time, end_time=end_time)
+        for index, message in enumerate(messages, start=first):
+            if (index - first) % stride or message.connection.msg_type != 'sensor_msgs/PointCloud2':
+                continue
+
+            cloud = deserialize_pointcloud2(message.data, reader.message_encoding)
+            columns = decode_pointcloud2(cloud, fields=fields)
+            yield PointCloudFrame(index, message.timestamp / 1e9, columns)
+            yielded += 1
+            if max_frames is not None and yielded >= max_frames:
+                break
+
+def frame_cache_name(n: int, fields) -> str:
+    """Nombre de la entrada de caché de un frame según los campos decodificados"""
+    tag = 'all' if fields is None else '+'.join(fields) or 'xyz'
+    return f"frame-{n:07d}-{tag}"
+
+def load_pointcloud_frame(bag_path, topic: str, n: int = 0,
+                          fields=DEFAULT_EXTRA_FIELDS) -> PointCloudFrame:
+    """
+    Devuelve el frame número n de un topic PointCloud2. Si ya se decodificó antes
+    se abre desde la caché en disco (mmap); si no, se lee solo el chunk que lo
+    contiene y se guarda en la caché.
+    """
+    fingerprint = get_bag_metadata(bag_path).fingerprint
+    name = frame_cache_name(n, fields)
+    cached = load_frame(fingerprint, topic, name, POINTCLOUD_DECODER_VERSION)
+    if cached is not None:
+        timestamp, columns = cached
+        return PointCloudFrame(n, timestamp, columns)
+
+    with open_bag(bag_path) as reader:
+        message = reader.read_message_at(topic, n)
+        cloud = deserialize_pointcloud2(message.data, reader.message_encoding)
+        columns = decode_pointcloud2(cloud, fields=fields)
+
+    timestamp = message.timestamp / 1e9
+    store_frame(fingerprint, topic, name, POINTCLOUD_DECODER_VERSION, timestamp, columns)
+    return PointCloudFrame(n, timestamp, columns)
+
+def load_pointcloud_lod(bag_path, topic: str, n: int = 0) -> PointCloudLOD:
+    """Pirámide de niveles de detalle del frame n (se construye una vez y queda en memoria)"""
+    key = (get_bag_metadata(bag_path).fingerprint, topic, n)
+    lod = get_lod(key)
+    if lod is None:
+        lod = get_lod(key, load_pointcloud_frame(bag_path, topic, n).columns)
+    return lod
+
+def deskew_pointcloud_frame(bag_path, topic: str, frame: PointCloudFrame):
+    """
+    Corrige el movimiento durante el barrido del frame con el IMU del bag (ver
+    motionDeskew). La velocidad se estima registrando con ICP el frame y el
+    siguiente (o el anterior, si es el último). Devuelve (columnas, texto para
+    el panel de debug).
+    """
+    started = time.time()
+    info = "=== DESKEW (IMU) ===\n"
+    imu = load_imu_track(bag_path)
+    if imu is None:
+        return frame.columns, info + "No aplicado: el bag no tiene topic de IMU\n"
+    other = frame.index + 1 if frame.index + 1 < pointcloud_frame_count(bag_path, topic) else frame.index - 1
+    velocity = pair_velocity(frame, load_pointcloud_frame(bag_path, topic, other), imu) if other >= 0 else None
+    columns, applied = deskew_pointcloud(frame.columns, frame.timestamp, imu, velocity)
+    if not applied:
+        return frame.columns, info + "No aplicado: la nube no tiene campo time o el IMU no cubre el barrido\n"
+    if velocity is not None:
+        info += f"Velocidad estimada: {np.linalg.norm(velocity):.2f} m/s\n"
+    else:
+        info += "Velocidad desconocida: solo se corrige la rotación\n"
+    info += f"Tiempo: {1000.0 * (time.time() - started):.0f} ms\n"
+    return columns, info
+
+def extract_pointcloud_with_rosbag(bag_path: str, topic: str, max_frames: int = 1):
+    """Extrae puntos de PointCloud2 con el lector de bags del proyecto (no requiere ROS)"""
     try:
-        import rosbag
-        
-        points_x, points_y, points_z = [], [], []
-        message_count = 0
-        max_messages = 1  # Solo procesamos el primer mensaje para mayor velocidad
-        
-        # Manejar el archivo temporal de Gradio
-        if hasattr(bag_path, 'name'):
-            actual_path = bag_path.name
-        else:
-            actual_path = bag_path
-            
-        with rosbag.Bag(actual_path, 'r') as bag:
-            for topic_name, msg, timestamp in bag.read_messages(topics=[topic]):
-                if message_count >= max_messages:
-                    break
-                    
-                if msg._type == 'sensor_msgs/PointCloud2':
-                    x, y, z = extract_points_from_pointcloud2_msg(msg)
-                    points_x.extend(x)
-                    points_y.extend(y)
-                    points_z.extend(z)
-                    message_count += 1
+        chunks_x, chunks_y, chunks_z = [], [], []
+
+        # Por defecto solo el primer mensaje para mayor velocidad
+        for frame in iter_pointcloud_frames(bag_path, topic, max_frames=max_frames, fields=()):
+            chunks_x.append(frame.columns['x'])
+            chunks_y.append(frame.columns['y'])
+            chunks_z.append(frame.columns['z'])
         
-        return points_x, points_y, points_z
+        if not chunks_x:
+            return [], [], []
+        return np.concatenate(chunks_x), np.concatenate(chunks_y), np.concatenate(chunks_z)
         
-    except ImportError:
-        print("rosbag no disponible, usando método alternativo")
-        return [], [], []
     except Exception as e:
-        print(f"Error con rosbag: {str(e)}")
+        print(f"Error leyendo el bag: {str(e)}")
         return [], [], []
 
 def extract_pointcloud_with_bagpy(bag_path: str, topic: str):
@@ -216,6 +844,8 @@ def extract_pointcloud_with_bagpy(bag_path: str, topic: str):
     Método alternativo usando bagpy (puede ser limitado para PointCloud2)
     """
     try:
+        from bagpy import bagreader
+
         print("Intentando extraer con bagpy...")
         b = bagreader(bag_path)
         
@@ -239,82 +869,13 @@ def extract_pointcloud_with_bagpy(bag_path: str, topic: str):
 
 def extract_points_from_pointcloud2_msg(msg):
     """
-    Extrae puntos x, y, z de un mensaje PointCloud2 de ROS1
+    Extrae puntos x, y, z de un mensaje PointCloud2 de ROS1 como arreglos float32
     """
     try:
-        # Información del mensaje PointCloud2
-        width = msg.width
-        height = msg.height  
-        point_step = msg.point_step
-        data = msg.data
-        
-        print(f"PointCloud2 info: width={width}, height={height}, point_step={point_step}")
-        
-        # Buscar los campos x, y, z en los field descriptors
-        x_offset = y_offset = z_offset = None
-        for field in msg.fields:
-            if field.name == 'x':
-                x_offset = field.offset
-            elif field.name == 'y':
-                y_offset = field.offset
-            elif field.name == 'z':
-                z_offset = field.offset
-        
-        if x_offset is None or y_offset is None or z_offset is None:
-            print("Campos x, y, z no encontrados en el mensaje")
-            return [], [], []
-        
-        print(f"Offsets encontrados: x={x_offset}, y={y_offset}, z={z_offset}")
-        
-        # Extraer puntos
-        points_x, points_y, points_z = [], [], []
-        
-        # Manejar diferentes tipos de datos
-        if isinstance(data, str):
-            data = data.encode('latin-1')
-        elif hasattr(data, 'tobytes'):
-            data = data.tobytes()
-        
-        total_points = len(data) // point_step
-        print(f"Procesando {total_points} puntos...")
-        
-        # Procesar cada punto
-        for i in range(0, len(data), point_step):
-            if i + 12 <= len(data):  # Asegurar suficientes bytes para x,y,z (4 bytes cada uno)
-                try:
-                    # Leer valores float32 en little-endian
-                    x = struct.unpack_from('<f', data, i + x_offset)[0]
-                    y = struct.unpack_from('<f', data, i + y_offset)[0]
-                    z = struct.unpack_from('<f', data, i + z_offset)[0]
-                    
-                    # Filtrar puntos inválidos
-                    if not (np.isnan(x) or np.isnan(y) or np.isnan(z) or 
-                           np.isinf(x) or np.isinf(y) or np.isinf(z)):
-                        points_x.append(x)
-                        points_y.append(y)
-                        points_z.append(z)
-                        
-                except struct.error as e:
-                    continue
-        
-        print(f"Puntos válidos extraídos: {len(points_x)}")
-        return points_x, points_y, points_z
-        
+        columns = decode_pointcloud2(msg, fields=())
+        return columns['x'], columns['y'], columns['z']
+
     except Exception as e:
         print(f"Error extrayendo puntos: {str(e)}")
-        return [], [], []
-    """
-    Obtiene todos los topics del archivo bag
-    """
-    if bag_file is None:
-        return []
-    
-    try:
-        bag_path = bag_file.name if hasattr(bag_file, 'name') else bag_file
-        b = bagreader(bag_path)
-        topic_table = b.topic_table
-        return topic_table['Topics'].tolist()
-        
-    except Exception as e:
-        print(f"Error al obtener topics: {str(e)}")
-        return []
\ No newline at end of file
+        empty = empty_columns()
+        return empty['x'], empty['y'], empty['z']
@@ -0,0 +1,183 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+
+import numpy as np
+
+# Caché de frames para recorrer un topic PointCloud2 con un slider. Los frames
+# se guardan ya decodificados y submuestreados (listos para dibujar) en un búfer
+# alrededor del frame que se está viendo. Un hilo en segundo plano prepara los
+# N frames siguientes y anteriores mientras el usuario mira el actual, así que
+# pasar al frame contiguo no vuelve a abrir el bag. Cuando el búfer supera el
+# límite de memoria se descartan primero los frames más alejados del actual.
+
+# Frames que se preparan a cada lado del actual
+SCRUBBER_PREFETCH = 5
+
+# Memoria máxima del búfer de frames (bytes)
+SCRUBBER_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ScrubberFrame(NamedTuple):
+    index: int
+    timestamp: float
+    columns: Dict[str, np.ndarray]  # Columnas ya preparadas para dibujar
+    total_points: int               # Puntos del frame antes de prepararlo
+    nbytes: int
+    details: dict                   # Lo que devuelve `prepare` además de las columnas (cajas, debug)
+
+
+class FrameScrubber:
+    """
+    Búfer de frames preparados alrededor del frame actual con prefetch en un
+    hilo. `load(n)` devuelve (timestamp, columnas decodificadas) del frame n y
+    `prepare(n, timestamp, columnas)` las deja listas para dibujar (deskew,
+    filtros, submuestreo) y devuelve (columnas, detalles).
+    """
+
+    def __init__(self, load: Callable, prepare: Callable, frame_count: int,
+                 prefetch: int = SCRUBBER_PREFETCH, max_bytes: int = SCRUBBER_MAX_BYTES):
+        self._load = load
+        self._prepare = prepare
+        self.frame_count = frame_count
+        self.prefetch = prefetch
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._loading = set()
+        self._errors = {}
+        self._current = 0
+        # Distancia hasta la que se hace prefetch; baja si el límite de memoria no da para más
+        self._reach = prefetch
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    @property
+    def cached_bytes(self) -> int:
+        with self._condition:
+            return sum(frame.nbytes for frame in self._frames.values())
+
+    def cached_indices(self):
+        with self._condition:
+            return sorted(self._frames)
+
+    def get(self, n: int) -> ScrubberFrame:
+        """Frame n (del búfer si ya está; si no, se prepara ahora) y prefetch a su alrededor"""
+        n = int(np.clip(n, 0, max(self.frame_count - 1, 0)))
+        with self._condition:
+            if n != self._current:
+                self._current = n
+                self._reach = self.prefetch
+            self._condition.notify_all()
+            while n in self._loading:
+                self._condition.wait()
+            frame = self._frames.get(n)
+            if frame is None:
+                self._loading.add(n)
+        if frame is not None:
+            return frame
+        try:
+            return self._build(n)
+        finally:
+            with self._condition:
+                self._loading.discard(n)
+                self._condition.notify_all()
+
+    def _build(self, n: int) -> ScrubberFrame:
+        timestamp, columns = self._load(n)
+        total_points = len(columns['x'])
+        columns, details = self._prepare(n, timestamp, columns)
+        frame = ScrubberFrame(n, timestamp, columns, total_points,
+                              sum(np.asarray(column).nbytes for column in columns.values()), details)
+        with self._condition:
+            self._frames[n] = frame
+            self._evict()
+        return frame
+
+    def _evict(self):
+        """Descarta los frames más alejados del actual mientras se pase del límite"""
+        total = sum(frame.nbytes for frame in self._frames.values())
+        while len(self._frames) > 1 and total > self.max_bytes:
+            farthest = max(self._frames, key=lambda index: abs(index - self._current))
+            if farthest == self._current:
+                break
+            total -= self._frames.pop(farthest).nbytes
+            # Sin esto el prefetch volvería a leer el frame que se acaba de descartar
+            self._reach = min(self._reach, abs(farthest - self._current) - 1)
+
+    def _next_wanted(self) -> Optional[int]:
+        """Siguiente frame que falta en la ventana: n+1, n-1, n+2, n-2, ..."""
+        for distance in range(1, self._reach + 1):
+            for n in (self._current + distance, self._current - distance):
+                if (0 <= n < self.frame_count and n not in self._frames and n not in self._loading
+                        and n not in self._errors):
+                    return n
+        return None
+
+    def _prefetch_loop(self):
+        while True:
+            with self._condition:
+                n = self._next_wanted()
+                while n is None and not self._closed:
+                    self._condition.wait()
+                    n = self._next_wanted()
+                if self._closed:
+                    return
+                self._loading.add(n)
+            try:
+                self._build(n)
+            except Exception as e:
+                # No reintentar en bucle un frame que no se puede leer
+                with self._condition:
+                    self._errors[n] = e
+            finally:
+                with self._condition:
+                    self._loading.discard(n)
+                    self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._frames.clear()
+            self._condition.notify_all()
+
+
+class _ScrubberRegistry:
+    """Un único scrubber activo: al cambiar de bag, topic o ajustes se reemplaza"""
+
+    def __init__(self):
+        self._key = None
+        self._scrubber = None
+        self._lock = threading.Lock()
+
+    def get(self, key, factory: Callable[[], FrameScrubber]) -> FrameScrubber:
+        with self._lock:
+            if self._scrubber is None or self._key != key:
+                if self._scrubber is not None:
+                    self._scrubber.close()
+                self._scrubber = factory()
+                self._key = key
+            return self._scrubber
+
+    def clear(self):
+        with self._lock:
+            if self._scrubber is not None:
+                self._scrubber.close()
+            self._scrubber = None
+            self._key = None
+
+
+_registry = _ScrubberRegistry()
+
+
+def get_scrubber(key, factory: Callable[[], FrameScrubber]) -> FrameScrubber:
+    """Scrubber asociado a `key`; se crea con `factory` si el activo es de otra configuración"""
+    return _registry.get(key, factory)
+
+
+def clear_scrubber():
+    _registry.clear()
@@ -0,0 +1,238 @@
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from dataManagement.rangeImage import pixel_values, project_range_image, range_image_ground
+
+# Segmentación suelo / no suelo con RANSAC vectorizado. Todas las hipótesis de
+# plano se generan y se evalúan a la vez como operaciones matriciales: se
+# muestrean H tríos de puntos por zona, se calculan los H planos con productos
+# vectoriales y se cuentan los inliers de una muestra de la zona con un único
+# producto (M puntos x H planos). El plano ganador se reajusta por PCA sobre sus
+# inliers. Con el modo por sectores cada zona polar (sector x anillo de
+# distancia) tiene su propio plano, lo que sigue mejor las calles en pendiente.
+# El modo por imagen de rango no ajusta planos: recorre cada columna de la
+# imagen de rango (ver rangeImage) de abajo arriba comparando pendientes.
+
+# Métodos de segmentación
+NO_GROUND = 'none'
+GROUND_PLANE = 'plane'
+GROUND_SECTORS = 'sectors'
+GROUND_RANGE_IMAGE = 'range image'
+GROUND_METHODS = (NO_GROUND, GROUND_PLANE, GROUND_SECTORS, GROUND_RANGE_IMAGE)
+
+# Columna que se añade a la nube con la clase de cada punto (1 = suelo)
+GROUND_COLUMN = 'ground'
+
+# Distancia máxima al plano para considerar un punto como suelo (metros)
+GROUND_THRESHOLD = 0.2
+
+# Hipótesis por zona y puntos de la zona con los que se puntúan
+RANSAC_HYPOTHESES = 128
+RANSAC_SCORE_POINTS = 1024
+
+# Inclinación máxima del suelo respecto a la horizontal
+MAX_GROUND_SLOPE = np.deg2rad(20.0)
+
+# Zonas polares del modo por sectores
+SECTORS = 8
+RANGE_EDGES = (0.0, 10.0, 25.0, np.inf)
+
+# Puntos mínimos para ajustar un plano propio en una zona
+MIN_ZONE_POINTS = 200
+
+# Fracción máxima de puntos de la zona por debajo de un plano de suelo (descarta
+# techos de vehículos o cajas, que en una zona pequeña pueden tener más inliers)
+MAX_BELOW_FRACTION = 0.05
+
+# Una zona solo usa un plano propio si explica claramente más puntos que el de la
+# zona interior y enlaza con él: sin saltos de altura en el borde ni giros bruscos
+PRIOR_MARGIN = 1.2
+MAX_ZONE_STEP = 0.3
+MAX_ZONE_TILT = np.deg2rad(10.0)
+
+
+def _xyz(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+
+
+def zone_labels(xyz: np.ndarray, sectors: int = SECTORS, range_edges=RANGE_EDGES) -> Tuple[np.ndarray, int]:
+    """Zona polar (sector x anillo de distancia alrededor del sensor) de cada punto"""
+    azimuth = np.arctan2(xyz[:, 1], xyz[:, 0])
+    sector = ((azimuth + np.pi) * (sectors / (2 * np.pi))).astype(np.int64)
+    np.clip(sector, 0, sectors - 1, out=sector)
+    ring = np.searchsorted(np.asarray(range_edges[1:-1]), np.hypot(xyz[:, 0], xyz[:, 1]), side='right')
+    rings = len(range_edges) - 1
+    return ring * sectors + sector, rings * sectors
+
+
+def _sample_zones(labels: np.ndarray, zones: int, size: int,
+                  rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `size` índices aleatorios (con reemplazo) de puntos de cada zona: (zonas, size).
+    Devuelve también qué zonas tienen suficientes puntos.
+    """
+    order = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels, minlength=zones)
+    starts = np.cumsum(counts) - counts
+    usable = counts >= MIN_ZONE_POINTS
+    offsets = (rng.random((zones, size)) * np.maximum(counts, 1)[:, None]).astype(np.int64)
+    picks = order[np.minimum(starts[:, None] + offsets, len(order) - 1)] if len(order) else offsets
+    return picks, usable
+
+
+def _hypotheses(xyz: np.ndarray, triplets: np.ndarray) -> np.ndarray:
+    """Planos (n, d) con n·p + d = 0 por cada trío de puntos (..., 3) -> (..., 4)"""
+    p0, p1, p2 = (xyz[triplets[..., i]].astype(np.float64) for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+    norms = np.linalg.norm(normals, axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normals = normals / norms
+    normals *= np.where(normals[..., 2:3] < 0, -1.0, 1.0)  # Normal hacia arriba
+    d = -np.einsum('...i,...i->...', normals, p0)
+    return np.concatenate((normals, d[..., None]), axis=-1)
+
+
+def _refine(xyz: np.ndarray, labels: np.ndarray, inliers: np.ndarray, zones: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reajuste por PCA del plano de cada zona con sus inliers (todas las zonas a la vez)"""
+    points = xyz[inliers].astype(np.float64)
+    owner = labels[inliers]
+    counts = np.bincount(owner, minlength=zones).astype(np.float64)
+    safe = np.maximum(counts, 1.0)
+    means = np.stack([np.bincount(owner, points[:, axis], zones) for axis in range(3)], axis=1) / safe[:, None]
+
+    centered = points - means[owner]
+    covariance = np.empty((zones, 3, 3))
+    for i in range(3):
+        for j in range(i, 3):
+            covariance[:, i, j] = covariance[:, j, i] = np.bincount(owner, centered[:, i] * centered[:, j], zones)
+    _, vectors = np.linalg.eigh(covariance)
+    normals = vectors[:, :, 0]
+    normals *= np.where(normals[:, 2:3] < 0, -1.0, 1.0)
+    d = -np.einsum('ij,ij->i', normals, means)
+    return np.concatenate((normals, d[:, None]), axis=1), counts >= 3
+
+
+def ransac_planes(xyz: np.ndarray, labels: np.ndarray, zones: int,
+                  hypotheses: int = RANSAC_HYPOTHESES, threshold: float = GROUND_THRESHOLD,
+                  max_slope: float = MAX_GROUND_SLOPE, seed: int = 0,
+                  prior: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Plano de suelo (nx, ny, nz, d) de cada zona, NaN si la zona no tiene puntos
+    suficientes o ningún plano con la inclinación admitida. Con `prior` (un plano
+    por zona) el plano a priori se conserva salvo que el mejor de RANSAC tenga
+    PRIOR_MARGIN veces más inliers.
+    """
+    rng = np.random.default_rng(seed)
+    triplets, usable = _sample_zones(labels, zones, 3 * hypotheses, rng)
+    planes = _hypotheses(xyz, triplets.reshape(zones, hypotheses, 3))           # (Z, H, 4)
+    plausible = np.isfinite(planes).all(axis=2) & (planes[:, :, 2] >= np.cos(max_slope))
+
+    # Conteo de inliers de todas las hipótesis de todas las zonas a la vez
+    scored, _ = _sample_zones(labels, zones, RANSAC_SCORE_POINTS, rng)
+    sample = xyz[scored]                                                        # (Z, M, 3)
+    normals = np.nan_to_num(planes[:, :, :3]).astype(np.float32).transpose(0, 2, 1)
+    distances = np.matmul(sample, normals) + planes[:, None, :, 3].astype(np.float32)
+    below = np.count_nonzero(distances < -threshold, axis=1)                    # (Z, H)
+    votes = np.count_nonzero(distances <= threshold, axis=1) - below
+    votes[~plausible | (below > MAX_BELOW_FRACTION * RANSAC_SCORE_POINTS)] = -1
+    best = planes[np.arange(zones), np.argmax(votes, axis=1)]
+    found = usable & (votes.max(axis=1) > 0)
+
+    if prior is not None:
+        prior_distances = np.einsum('zmi,zi->zm', sample, prior[:, :3].astype(np.float32)) + prior[:, None, 3]
+        prior_votes = np.count_nonzero(np.abs(prior_distances) <= threshold, axis=1)
+        keep_prior = ~found | (votes.max(axis=1) < PRIOR_MARGIN * prior_votes)
+        best = np.where(keep_prior[:, None], prior, best)
+        found = usable
+
+    # Reajuste con los inliers de la nube completa
+    point_planes = best[labels]
+    inliers = found[labels] & (np.abs(np.einsum('ij,ij->i', xyz, point_planes[:, :3]) + point_planes[:, 3])
+                               <= threshold)
+    refined, enough = _refine(xyz, labels, inliers, zones)
+    keep_refined = enough & (refined[:, 2] >= np.cos(max_slope))
+    best = np.where(keep_refined[:, None], refined, best)
+    best[~found] = np.nan
+    return best
+
+
+def _height_at(planes: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Altura z de cada plano en (x, y)"""
+    return -(planes[:, 0] * x + planes[:, 1] * y + planes[:, 3]) / planes[:, 2]
+
+
+def sector_planes(xyz: np.ndarray, plane: np.ndarray, sectors: int = SECTORS, range_edges=RANGE_EDGES,
+                  threshold: float = GROUND_THRESHOLD) -> np.ndarray:
+    """
+    Plano de cada zona polar, de dentro hacia fuera: los sectores de un anillo se
+    ajustan todos a la vez tomando como referencia el plano de la zona interior
+    (el global para el primer anillo), que se conserva si el nuevo no lo mejora
+    claramente o no enlaza con él en el borde.
+    """
+    labels, zones = zone_labels(xyz, sectors, range_edges)
+    rings = zones // sectors
+    azimuth = -np.pi + (np.arange(sectors) + 0.5) * (2 * np.pi / sectors)
+    planes = np.empty((zones, 4))
+    reference = np.tile(plane, (sectors, 1))
+    for ring in range(rings):
+        inside = (labels >= ring * sectors) & (labels < (ring + 1) * sectors)
+        candidates = ransac_planes(xyz[inside], labels[inside] - ring * sectors, sectors,
+                                   threshold=threshold, prior=reference, seed=ring)
+        radius = range_edges[ring]
+        x, y = radius * np.cos(azimuth), radius * np.sin(azimuth)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.abs(_height_at(candidates, x, y) - _height_at(reference, x, y))
+            tilt = np.arccos(np.clip(np.einsum('ij,ij->i', candidates[:, :3], reference[:, :3]), -1.0, 1.0))
+        linked = np.isfinite(candidates).all(axis=1) & (step <= MAX_ZONE_STEP) & (tilt <= MAX_ZONE_TILT)
+        reference = np.where(linked[:, None], candidates, reference)
+        planes[ring * sectors:(ring + 1) * sectors] = reference
+    return planes
+
+
+def segment_ground(columns: Dict[str, np.ndarray], method: str = GROUND_PLANE,
+                   threshold: float = GROUND_THRESHOLD, sectors: int = SECTORS,
+                   range_edges=RANGE_EDGES) -> np.ndarray:
+    """
+    Máscara booleana de puntos de suelo. Con method='sectors' cada zona polar
+    puede tener su propio plano (ver sector_planes); con 'range image' se
+    decide sobre la imagen de rango del frame (ver rangeImage).
+    """
+    xyz = _xyz(columns)
+    if method == NO_GROUND or len(xyz) == 0:
+        return np.zeros(len(xyz), dtype=bool)
+    if method == GROUND_RANGE_IMAGE:
+        image = project_range_image(columns)
+        return pixel_values(image, range_image_ground(image, threshold, MAX_GROUND_SLOPE), False)
+    if method not in (GROUND_PLANE, GROUND_SECTORS):
+        raise ValueError(f"Método de segmentación de suelo no soportado: {method}")
+
+    finite = np.isfinite(xyz).all(axis=1)
+    points = xyz[finite]
+    plane = ransac_planes(points, np.zeros(len(points), dtype=np.int64), 1, threshold=threshold)[0]
+    plane_per_point = np.broadcast_to(plane, (len(points), 4))
+    if method == GROUND_SECTORS and np.isfinite(plane).all():
+        planes = sector_planes(points, plane, sectors, range_edges, threshold)
+        labels, _ = zone_labels(points, sectors, range_edges)
+        plane_per_point = planes[labels]
+
+    distances = np.einsum('ij,ij->i', points, plane_per_point[:, :3]) + plane_per_point[:, 3]
+    ground = np.zeros(len(xyz), dtype=bool)
+    # Sin plano (NaN) ningún punto es suelo
+    ground[finite] = np.abs(distances) <= threshold
+    return ground
+
+
+def label_ground(columns: Dict[str, np.ndarray], method: str = GROUND_PLANE,
+                 threshold: float = GROUND_THRESHOLD) -> Dict[str, np.ndarray]:
+    """Devuelve la nube con la columna `ground` (uint8, 1 = suelo)"""
+    labeled = dict(columns)
+    labeled[GROUND_COLUMN] = segment_ground(columns, method, threshold).astype(np.uint8)
+    return labeled
+
+
+def remove_ground(columns: Dict[str, np.ndarray], method: str = GROUND_PLANE,
+                  threshold: float = GROUND_THRESHOLD,
+                  ground: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Nube sin los puntos de suelo"""
+    ground = segment_ground(columns, method, threshold) if ground is None else ground
+    return {name: np.asarray(column)[~ground] for name, column in columns.items()}
@@ -0,0 +1,263 @@
+import os
+import struct
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from dataManagement.bagReader import bag_file_path
+
+# Lector de nubes LAS 1.0-1.4 (y LAZ si laspy está instalado). Los registros de
+# puntos de un .las se mapean en memoria como un arreglo estructurado de NumPy,
+# así que abrir un archivo de cientos de millones de puntos no lee nada todavía;
+# los puntos se leen por bloques (iter_chunks), por recorte (crop) o con un
+# muestreo uniforme para la vista previa (sample). Las columnas devueltas usan
+# el mismo formato que pointCloudDecoder: x, y, z en float32 relativas a
+# `origin` (la esquina mínima del header), porque en coordenadas UTM un float32
+# absoluto perdería la precisión centimétrica.
+
+LAS_EXTENSIONS = ('.las', '.laz')
+
+# Puntos por bloque al recorrer el archivo
+CHUNK_POINTS = 2_000_000
+
+# Puntos que se leen como máximo para la vista previa
+PREVIEW_POINTS = 2_000_000
+
+# Campos que se conservan por defecto además de x, y, z
+DEFAULT_LAS_FIELDS = ('intensity', 'classification')
+
+# Campos comunes de los formatos de punto 0-5 y 6-10 (nombre, tipo, offset)
+_LEGACY_BASE = [('X', '<i4', 0), ('Y', '<i4', 4), ('Z', '<i4', 8), ('intensity', '<u2', 12),
+                ('return_bits', 'u1', 14), ('classification', 'u1', 15), ('scan_angle_rank', 'i1', 16),
+                ('user_data', 'u1', 17), ('point_source_id', '<u2', 18)]
+_EXTENDED_BASE = [('X', '<i4', 0), ('Y', '<i4', 4), ('Z', '<i4', 8), ('intensity', '<u2', 12),
+                  ('return_bits', 'u1', 14), ('flag_bits', 'u1', 15), ('classification', 'u1', 16),
+                  ('user_data', 'u1', 17), ('scan_angle', '<i2', 18), ('point_source_id', '<u2', 20),
+                  ('gps_time', '<f8', 22)]
+_RGB = [('red', '<u2', 0), ('green', '<u2', 2), ('blue', '<u2', 4)]
+
+# Formato de punto -> (campos base, campos añadidos a partir del offset dado)
+_POINT_FORMATS = {
+    0: (_LEGACY_BASE, 20, []),
+    1: (_LEGACY_BASE, 20, [('gps_time', '<f8', 0)]),
+    2: (_LEGACY_BASE, 20, _RGB),
+    3: (_LEGACY_BASE, 20, [('gps_time', '<f8', 0)] + [(n, t, o + 8) for n, t, o in _RGB]),
+    4: (_LEGACY_BASE, 20, [('gps_time', '<f8', 0)]),
+    5: (_LEGACY_BASE, 20, [('gps_time', '<f8', 0)] + [(n, t, o + 8) for n, t, o in _RGB]),
+    6: (_EXTENDED_BASE, 30, []),
+    7: (_EXTENDED_BASE, 30, _RGB),
+    8: (_EXTENDED_BASE, 30, _RGB + [('nir', '<u2', 6)]),
+    9: (_EXTENDED_BASE, 30, []),
+    10: (_EXTENDED_BASE, 30, _RGB + [('nir', '<u2', 6)]),
+}
+
+
+class LasHeader(NamedTuple):
+    version: Tuple[int, int]
+    point_format: int
+    record_length: int
+    point_count: int
+    point_offset: int          # Byte donde empiezan los registros de puntos
+    scales: np.ndarray         # (3,)
+    offsets: np.ndarray        # (3,)
+    mins: np.ndarray           # (3,) límites del header
+    maxs: np.ndarray
+    compressed: bool           # LAZ
+
+
+def is_las_file(path) -> bool:
+    if path is None:
+        return False
+    path = bag_file_path(path)
+    return isinstance(path, str) and os.path.splitext(path)[1].lower() in LAS_EXTENSIONS
+
+
+def read_las_header(path: str) -> LasHeader:
+    """Lee el bloque de cabecera pública de un .las o .laz"""
+    with open(path, 'rb') as f:
+        raw = f.read(375)
+    if len(raw) < 227 or raw[:4] != b'LASF':
+        raise ValueError(f"No es un archivo LAS: {path}")
+
+    major, minor = raw[24], raw[25]
+    if (major, minor) > (1, 4):
+        raise ValueError(f"Versión de LAS no soportada: {major}.{minor}")
+    point_offset, = struct.unpack_from('<I', raw, 96)
+    format_id, record_length, legacy_count = struct.unpack_from('<BHI', raw, 104)
+    scales = np.array(struct.unpack_from('<3d', raw, 131))
+    offsets = np.array(struct.unpack_from('<3d', raw, 155))
+    max_x, min_x, max_y, min_y, max_z, min_z = struct.unpack_from('<6d', raw, 179)
+
+    point_count = legacy_count
+    if (major, minor) >= (1, 4) and len(raw) >= 255:
+        point_count = struct.unpack_from('<Q', raw, 247)[0] or legacy_count
+
+    # En LAZ los bits 6 y 7 del formato marcan la compresión
+    compressed = bool(format_id & 0xC0)
+    return LasHeader((major, minor), format_id & 0x3F, record_length, point_count, point_offset,
+                     scales, offsets, np.array([min_x, min_y, min_z]), np.array([max_x, max_y, max_z]),
+                     compressed)
+
+
+def las_point_dtype(point_format: int, record_length: int) -> np.dtype:
+    """dtype estructurado de un registro de punto (los bytes extra quedan sin nombre)"""
+    if point_format not in _POINT_FORMATS:
+        raise ValueError(f"Formato de punto LAS no soportado: {point_format}")
+    base, base_size, extra = _POINT_FORMATS[point_format]
+    fields = list(base) + [(name, code, base_size + offset) for name, code, offset in extra]
+    fields = [field for field in fields if field[2] + np.dtype(field[1]).itemsize <= record_length]
+    return np.dtype({
+        'names': [name for name, _, _ in fields],
+        'formats': [code for _, code, _ in fields],
+        'offsets': [offset for _, _, offset in fields],
+        'itemsize': record_length,
+    })
+
+
+class LasReader:
+    """
+    Acceso por bloques a los puntos de un .las (memoria mapeada) o .laz (laspy).
+    Las coordenadas de las columnas son relativas a `origin`.
+    """
+
+    def __init__(self, path):
+        self.path = bag_file_path(path)
+        self.header = read_las_header(self.path)
+        self.origin = self.header.mins.copy()
+        self.dtype = las_point_dtype(self.header.point_format, self.header.record_length)
+        self.points = None
+        if not self.header.compressed:
+            available = (os.path.getsize(self.path) - self.header.point_offset) // self.header.record_length
+            count = min(self.header.point_count, max(available, 0))
+            self.points = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.header.point_offset,
+                                    shape=(count,)) if count else np.zeros(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return len(self.points) if self.points is not None else self.header.point_count
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Límites del header relativos a `origin`"""
+        return self.header.mins - self.origin, self.header.maxs - self.origin
+
+    def _columns(self, records: np.ndarray, fields) -> Dict[str, np.ndarray]:
+        """Registros crudos -> columnas escaladas (x, y, z relativas a origin)"""
+        scales, offsets = self.header.scales, self.header.offsets
+        columns = {
+            axis: ((records[raw].astype(np.float64) * scales[i] + (offsets[i] - self.origin[i]))
+                   .astype(np.float32))
+            for i, (axis, raw) in enumerate((('x', 'X'), ('y', 'Y'), ('z', 'Z')))
+        }
+        names = records.dtype.names
+        wanted = [name for name in names if name not in ('X', 'Y', 'Z')] if fields is None else fields
+        for name in wanted:
+            if name in names:
+                columns[name] = np.ascontiguousarray(records[name])
+        if 'classification' in columns and self.header.point_format < 6:
+            # En los formatos 0-5 los 3 bits altos son banderas, no la clase
+            columns['classification'] = columns['classification'] & np.uint8(0x1F)
+        return columns
+
+    def _empty(self, fields) -> Dict[str, np.ndarray]:
+        return self._columns(np.zeros(0, dtype=self.dtype), fields)
+
+    def _laz_chunks(self, chunk_points: int):
+        """Bloques descomprimidos de un .laz como arreglos estructurados"""
+        try:
+            import laspy
+        except ImportError:
+            raise ImportError("Para leer archivos .laz instale laspy con un backend LAZ (pip install 'laspy[lazrs]')")
+        with laspy.open(self.path) as reader:
+            for chunk in reader.chunk_iterator(chunk_points):
+                # Los mismos bytes del registro, leídos con el dtype propio
+                yield np.ascontiguousarray(chunk.array).view(np.uint8).view(self.dtype)
+
+    def _raw_chunks(self, chunk_points: int):
+        if self.points is not None:
+            for start in range(0, len(self.points), chunk_points):
+                yield self.points[start:start + chunk_points]
+        else:
+            yield from self._laz_chunks(chunk_points)
+
+    def iter_chunks(self, chunk_points: int = CHUNK_POINTS, fields=DEFAULT_LAS_FIELDS) -> Iterator[Dict[str, np.ndarray]]:
+        """Recorre todos los puntos por bloques de chunk_points (solo un bloque en memoria)"""
+        for records in self._raw_chunks(chunk_points):
+            yield self._columns(records, fields)
+
+    def crop(self, low, high, fields=DEFAULT_LAS_FIELDS, chunk_points: int = CHUNK_POINTS,
+             max_points: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Puntos dentro de la caja [low, high] (coordenadas relativas a origin). Si
+        la caja no toca los límites del header no se lee nada; si los contiene se
+        devuelve todo. La comparación se hace sobre los enteros crudos de X, Y, Z,
+        sin escalar cada punto. Con max_points se para al llegar a ese número.
+        """
+        low = np.asarray(low, dtype=np.float64) + self.origin
+        high = np.asarray(high, dtype=np.float64) + self.origin
+        if np.any(low > self.header.maxs) or np.any(high < self.header.mins):
+            return self._empty(fields)
+        whole = np.all(low <= self.header.mins) and np.all(high >= self.header.maxs)
+
+        raw_low = np.floor((low - self.header.offsets) / self.header.scales)
+        raw_high = np.ceil((high - self.header.offsets) / self.header.scales)
+        parts, total = [], 0
+        for records in self._raw_chunks(chunk_points):
+            if not whole:
+                inside = np.ones(len(records), dtype=bool)
+                for axis, raw in enumerate(('X', 'Y', 'Z')):
+                    values = records[raw]
+                    inside &= (values >= raw_low[axis]) & (values <= raw_high[axis])
+                records = records[inside]
+            if len(records):
+                parts.append(self._columns(records, fields))
+                total += len(records)
+            if max_points is not None and total >= max_points:
+                break
+        return _concatenate(parts, self._empty(fields))
+
+    def sample(self, max_points: int = PREVIEW_POINTS, fields=DEFAULT_LAS_FIELDS,
+               chunk_points: int = CHUNK_POINTS) -> Dict[str, np.ndarray]:
+        """
+        Muestra uniforme de como mucho max_points (uno de cada N en el orden del
+        archivo). En un .las solo se tocan los registros elegidos.
+        """
+        stride = max(int(np.ceil(len(self) / max(max_points, 1))), 1)
+        if self.points is not None:
+            return self._columns(self.points[::stride], fields)
+        parts, seen = [], 0
+        for records in self._laz_chunks(chunk_points):
+            # Mantener la fase del muestreo entre bloques
+            first = (-seen) % stride
+            parts.append(self._columns(records[first::stride], fields))
+            seen += len(records)
+        return _concatenate(parts, self._empty(fields))
+
+    def close(self):
+        if isinstance(self.points, np.memmap):
+            self.points._mmap.close()
+        self.points = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _concatenate(parts, empty: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    if not parts:
+        return empty
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def las_summary(path) -> str:
+    """Texto con los datos del header para el panel de debug"""
+    header = read_las_header(bag_file_path(path))
+    extent = header.maxs - header.mins
+    summary = "=== INFORMACIÓN DEL ARCHIVO LAS ===\n"
+    summary += f"Archivo: {bag_file_path(path)}\n"
+    summary += f"Versión: {header.version[0]}.{header.version[1]}{' (LAZ)' if header.compressed else ''}\n"
+    summary += f"Formato de punto: {header.point_format} ({header.record_length} bytes)\n"
+    summary += f"Puntos: {header.point_count}\n"
+    summary += f"Mínimo: ({header.mins[0]:.3f}, {header.mins[1]:.3f}, {header.mins[2]:.3f})\n"
+    summary += f"Extensión: {extent[0]:.1f} x {extent[1]:.1f} x {extent[2]:.1f} m\n"
+    return summary
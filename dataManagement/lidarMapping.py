@@ -0,0 +1,429 @@
+import time
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from dataManagement.bagCache import get_bag_metadata
+from dataManagement.motionDeskew import ImuTrack, deskew_pointcloud
+from dataManagement.pointCloudFilters import group_keys, voxel_downsample
+from dataManagement.spatialIndex import SpatialIndex, as_xyz
+from dataManagement.topicCache import load_arrays, store_arrays
+
+# Mapeo LiDAR por acumulación de frames: cada frame PointCloud2 se registra con
+# ICP punto-a-plano contra un mapa local móvil (los últimos keyframes ya
+# registrados) y los keyframes se acumulan en un mapa global de voxels con
+# memoria acotada. Todo el bucle de ICP es vectorizado y las correspondencias se
+# buscan con el índice espacial (ver spatialIndex).
+
+# Versión del formato de los mapas guardados en la caché
+MAPPING_VERSION = 4
+
+# Lados de voxel (metros): entrada del registro, mapa local y mapa global
+REGISTRATION_VOXEL = 0.5
+LOCAL_MAP_VOXEL = 0.25
+MAP_VOXEL = 0.2
+
+# Rango útil del sensor: se descartan el propio vehículo y los puntos lejanos
+MIN_RANGE = 1.0
+MAX_RANGE = 80.0
+
+# Parámetros del ICP
+ICP_ITERATIONS = 20
+MAX_CORRESPONDENCE_DISTANCE = 1.0
+MIN_CORRESPONDENCES = 100
+NORMAL_NEIGHBORS = 10
+
+# Vecindarios casi lineales (p. ej. un solo anillo sobre el suelo) no definen un
+# plano: se exige que el segundo autovalor sea al menos esta fracción del mayor
+MIN_PLANARITY = 0.05
+
+# Un frame pasa a ser keyframe si se movió más de esto desde el último
+KEYFRAME_DISTANCE = 1.0
+KEYFRAME_ANGLE = np.deg2rad(10.0)
+LOCAL_MAP_KEYFRAMES = 10
+
+# Puntos máximos del mapa global (al superarlos se duplica el lado del voxel)
+MAX_MAP_POINTS = 2_000_000
+
+# Puntos pendientes antes de fusionarlos en el mapa global
+MAP_MERGE_POINTS = 500_000
+
+# Bits por eje de la clave de voxel del mapa global
+_KEY_BITS = 21
+_KEY_OFFSET = 1 << (_KEY_BITS - 1)
+
+
+class IcpResult(NamedTuple):
+    pose: np.ndarray        # Matriz 4x4 sensor -> mundo
+    iterations: int
+    correspondences: int
+    rmse: float             # Error punto-a-plano de las correspondencias (m)
+    converged: bool
+
+
+class MappingResult(NamedTuple):
+    timestamps: np.ndarray             # (N,) segundos
+    poses: np.ndarray                  # (N, 4, 4) pose del sensor en cada frame
+    map_columns: Dict[str, np.ndarray]  # Mapa global: x, y, z (centroides de voxel)
+    keyframes: int
+    failed: int                        # Frames sin registrar o en los que el ICP no convergió
+    elapsed: float                     # Segundos que tardó el cálculo del mapa
+    load_time: Optional[float] = None  # Segundos en leerlo de la caché (None si se acaba de calcular)
+
+
+def transform_points(xyz: np.ndarray, pose: np.ndarray) -> np.ndarray:
+    """Aplica una transformación 4x4 a puntos (N, 3)"""
+    return (xyz @ pose[:3, :3].T.astype(xyz.dtype)) + pose[:3, 3].astype(xyz.dtype)
+
+
+def crop_range(xyz: np.ndarray, min_range: float = MIN_RANGE, max_range: float = MAX_RANGE) -> np.ndarray:
+    """Puntos finitos con distancia al sensor entre min_range y max_range"""
+    r2 = np.einsum('ij,ij->i', xyz, xyz)
+    return xyz[np.isfinite(r2) & (r2 >= min_range ** 2) & (r2 <= max_range ** 2)]
+
+
+def downsample_xyz(xyz: np.ndarray, leaf_size: float) -> np.ndarray:
+    """Centroide por voxel de puntos (N, 3)"""
+    if len(xyz) == 0:
+        return xyz
+    reduced = voxel_downsample({'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2]}, leaf_size)
+    return as_xyz(reduced)
+
+
+def estimate_normals(xyz: np.ndarray, index: Optional[SpatialIndex] = None, queries: Optional[np.ndarray] = None,
+                     k: int = NORMAL_NEIGHBORS, max_distance: float = 2.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Normal de cada punto de `queries` (por defecto la propia nube) por PCA de sus
+    k vecinos en `xyz`. Devuelve (normales, válidas): no son válidas las de
+    puntos con menos de k vecinos a max_distance ni las de vecindarios lineales.
+    """
+    index = index or SpatialIndex(xyz)
+    _, neighbors = index.knn(queries, k=k, max_distance=max_distance)
+    valid = np.all(neighbors < len(xyz), axis=1)
+    normals = np.zeros((len(neighbors), 3), dtype=np.float32)
+    if not valid.any():
+        return normals, valid
+
+    patches = xyz[neighbors[valid]].astype(np.float64)
+    patches -= patches.mean(axis=1, keepdims=True)
+    covariance = np.einsum('nki,nkj->nij', patches, patches)
+    values, vectors = np.linalg.eigh(covariance)  # Autovalores en orden ascendente
+    normals[valid] = vectors[:, :, 0]
+    valid[valid] = values[:, 1] >= MIN_PLANARITY * values[:, 2]
+    return normals, valid
+
+
+def _small_motion(delta: np.ndarray, center: np.ndarray) -> np.ndarray:
+    """Transformación 4x4 de un giro `delta[:3]` alrededor de `center` más una traslación `delta[3:]`"""
+    step = np.eye(4)
+    step[:3, :3] = Rotation.from_rotvec(delta[:3]).as_matrix()
+    step[:3, 3] = center - step[:3, :3] @ center + delta[3:]
+    return step
+
+
+def icp_point_to_plane(source: np.ndarray, target: np.ndarray, target_normals: np.ndarray,
+                       target_index: SpatialIndex, initial_pose: np.ndarray,
+                       max_iterations: int = ICP_ITERATIONS,
+                       max_distance: float = MAX_CORRESPONDENCE_DISTANCE) -> IcpResult:
+    """
+    Registra `source` (marco del sensor) contra `target` (marco del mundo, con
+    normales) minimizando la distancia punto-a-plano. Cada iteración busca el
+    vecino más cercano de todos los puntos a la vez y resuelve un sistema 6x6
+    linealizado, con pesos de Huber para atenuar correspondencias malas.
+    Si se agotan las iteraciones sin que el paso baje del umbral se devuelve la
+    última pose (suele ser mejor que la inicial), pero marcada como no convergida.
+    """
+    pose = initial_pose.copy()
+    huber = max_distance / 4.0
+    rmse = np.inf
+    correspondences = 0
+    for iteration in range(1, max_iterations + 1):
+        moved = transform_points(source, pose)
+        distances, nearest = target_index.knn(moved, k=1, max_distance=max_distance)
+        found = nearest[:, 0] < len(target)
+        correspondences = int(found.sum())
+        if correspondences < MIN_CORRESPONDENCES:
+            return IcpResult(initial_pose, iteration, correspondences, np.inf, False)
+
+        points = moved[found].astype(np.float64)
+        normals = target_normals[nearest[found, 0]].astype(np.float64)
+        residuals = np.einsum('ij,ij->i', points - target[nearest[found, 0]], normals)
+
+        # Linealizar alrededor del centroide mejora el condicionamiento
+        center = points.mean(axis=0)
+        jacobian = np.hstack((np.cross(points - center, normals), normals))
+        weights = np.minimum(1.0, huber / np.maximum(np.abs(residuals), 1e-12))
+        weighted = jacobian * weights[:, None]
+        hessian = weighted.T @ jacobian
+        gradient = weighted.T @ residuals
+        try:
+            delta = -np.linalg.solve(hessian, gradient)
+        except np.linalg.LinAlgError:
+            return IcpResult(initial_pose, iteration, correspondences, np.inf, False)
+
+        pose = _small_motion(delta, center) @ pose
+        rmse = float(np.sqrt(np.mean(residuals ** 2)))
+        if np.linalg.norm(delta[:3]) < 1e-4 and np.linalg.norm(delta[3:]) < 1e-3:
+            return IcpResult(pose, iteration, correspondences, rmse, True)
+    return IcpResult(pose, max_iterations, correspondences, rmse, False)
+
+
+class VoxelMap:
+    """
+    Mapa global de voxels con memoria acotada: guarda suma y cuenta de puntos por
+    voxel. Los puntos nuevos se acumulan y se fusionan por lotes; si el mapa pasa
+    de max_points voxels se duplica el lado del voxel.
+    """
+
+    def __init__(self, voxel_size: float = MAP_VOXEL, max_points: int = MAX_MAP_POINTS):
+        self.voxel_size = float(voxel_size)
+        self.max_points = int(max_points)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, 3), dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._pending: List[np.ndarray] = []
+        self._pending_points = 0
+
+    def __len__(self) -> int:
+        self._merge()
+        return len(self.keys)
+
+    def _keys(self, xyz: np.ndarray) -> np.ndarray:
+        cells = np.floor(xyz / self.voxel_size).astype(np.int64) + _KEY_OFFSET
+        np.clip(cells, 0, (1 << _KEY_BITS) - 1, out=cells)
+        return (cells[:, 0] << (2 * _KEY_BITS)) | (cells[:, 1] << _KEY_BITS) | cells[:, 2]
+
+    def insert(self, xyz: np.ndarray):
+        """Añade puntos en el marco del mundo"""
+        self._pending.append(np.asarray(xyz, dtype=np.float64))
+        self._pending_points += len(xyz)
+        if self._pending_points >= MAP_MERGE_POINTS:
+            self._merge()
+
+    def _reduce(self, keys: np.ndarray, sums: np.ndarray, counts: np.ndarray):
+        order, starts = group_keys(keys)
+        self.keys = keys[order][starts]
+        self.sums = np.add.reduceat(sums[order], starts, axis=0) if len(keys) else sums
+        self.counts = np.add.reduceat(counts[order], starts) if len(keys) else counts
+
+    def _merge(self):
+        if self._pending:
+            pending = np.concatenate(self._pending)
+            self._pending = []
+            self._pending_points = 0
+            self._reduce(np.concatenate((self.keys, self._keys(pending))),
+                         np.concatenate((self.sums, pending)),
+                         np.concatenate((self.counts, np.ones(len(pending), dtype=np.int64))))
+
+        while len(self.keys) > self.max_points:
+            # Rejilla más gruesa: se reagrupan los voxels por su centroide
+            self.voxel_size *= 2.0
+            self._reduce(self._keys(self.sums / self.counts[:, None]), self.sums, self.counts)
+
+    def points(self) -> np.ndarray:
+        """Centroides de los voxels ocupados (N, 3) float32"""
+        self._merge()
+        return (self.sums / np.maximum(self.counts, 1)[:, None]).astype(np.float32)
+
+
+class LidarMapper:
+    """Registro incremental de frames y acumulación del mapa"""
+
+    def __init__(self, registration_voxel: float = REGISTRATION_VOXEL, local_map_voxel: float = LOCAL_MAP_VOXEL,
+                 map_voxel: float = MAP_VOXEL, local_map_keyframes: int = LOCAL_MAP_KEYFRAMES,
+                 max_map_points: int = MAX_MAP_POINTS):
+        self.registration_voxel = registration_voxel
+        self.local_map_voxel = local_map_voxel
+        self.global_map = VoxelMap(map_voxel, max_map_points)
+        self.timestamps: List[float] = []
+        self.poses: List[np.ndarray] = []
+        self.keyframes = 0
+        self.failed = 0
+        self._local_clouds = deque(maxlen=local_map_keyframes)  # (puntos, normales) por keyframe
+        self._last_keyframe_pose = None
+        self._local_map = None  # (puntos, normales, índice)
+
+    def _add_keyframe(self, world: np.ndarray):
+        """
+        Añade un keyframe al mapa local. Solo se calculan las normales de los puntos
+        nuevos, con vecinos del mapa local ya acumulado (un barrido solo es
+        demasiado disperso entre anillos); las de los keyframes anteriores se reutilizan.
+        """
+        points = downsample_xyz(world, self.local_map_voxel)
+        neighborhood = np.concatenate([cloud for cloud, _ in self._local_clouds] + [points])
+        normals, valid = estimate_normals(neighborhood, queries=points)
+        self._local_clouds.append((points[valid], normals[valid]))
+
+        points = np.concatenate([cloud for cloud, _ in self._local_clouds])
+        normals = np.concatenate([cloud_normals for _, cloud_normals in self._local_clouds])
+        if len(points):
+            self._local_map = (points, normals, SpatialIndex(points))
+
+    def _initial_guess(self) -> np.ndarray:
+        """Modelo de velocidad constante: repetir el último desplazamiento relativo"""
+        if len(self.poses) < 2:
+            return self.poses[-1].copy()
+        motion = np.linalg.inv(self.poses[-2]) @ self.poses[-1]
+        return self.poses[-1] @ motion
+
+    def velocity(self) -> Optional[np.ndarray]:
+        """
+        Velocidad prevista para el frame siguiente (m/s, ejes del sensor) con el
+        modelo de velocidad constante; None hasta tener dos poses
+        """
+        if len(self.poses) < 2 or self.timestamps[-1] <= self.timestamps[-2]:
+            return None
+        motion = np.linalg.inv(self.poses[-2]) @ self.poses[-1]
+        return motion[:3, 3] / (self.timestamps[-1] - self.timestamps[-2])
+
+    def _is_keyframe(self, pose: np.ndarray) -> bool:
+        if self._last_keyframe_pose is None:
+            return True
+        relative = np.linalg.inv(self._last_keyframe_pose) @ pose
+        angle = np.linalg.norm(Rotation.from_matrix(relative[:3, :3]).as_rotvec())
+        return np.linalg.norm(relative[:3, 3]) > KEYFRAME_DISTANCE or angle > KEYFRAME_ANGLE
+
+    def add_frame(self, timestamp: float, xyz: np.ndarray) -> np.ndarray:
+        """Registra un frame (puntos en el marco del sensor) y devuelve su pose"""
+        xyz = crop_range(np.asarray(xyz, dtype=np.float32))
+        source = downsample_xyz(xyz, self.registration_voxel)
+        if self._local_map is None:
+            # Aún no hay mapa con el que registrar (frames vacíos o fuera de rango
+            # al principio): el frame es el primero del mapa
+            pose = self.poses[-1].copy() if self.poses else np.eye(4)
+        elif len(source) == 0:
+            # Frame sin puntos útiles: no se puede registrar, se extrapola la pose
+            pose = self._initial_guess()
+            self.failed += 1
+        else:
+            points, normals, index = self._local_map
+            result = icp_point_to_plane(source, points, normals, index, self._initial_guess())
+            if not result.converged:
+                self.failed += 1
+            pose = result.pose
+
+        self.timestamps.append(timestamp)
+        self.poses.append(pose)
+        if self._is_keyframe(pose) and len(xyz):
+            world = transform_points(xyz, pose)
+            self._add_keyframe(world)
+            self.global_map.insert(world)
+            self._last_keyframe_pose = pose
+            self.keyframes += 1
+        return pose
+
+    def trajectory(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.poses:
+            return np.zeros(0), np.zeros((0, 4, 4))
+        return np.array(self.timestamps), np.stack(self.poses)
+
+
+def pair_velocity(first, second, imu: Optional[ImuTrack] = None) -> Optional[np.ndarray]:
+    """
+    Velocidad del sensor (m/s, ejes del sensor) registrando con ICP dos frames
+    consecutivos (con timestamp y columns), corregidos antes solo de rotación
+    si hay IMU. None si los dos frames tienen el mismo tiempo.
+    """
+    mapper = LidarMapper()
+    for frame in sorted((first, second), key=lambda item: item.timestamp):
+        columns = deskew_pointcloud(frame.columns, frame.timestamp, imu)[0] if imu is not None else frame.columns
+        mapper.add_frame(frame.timestamp, as_xyz(columns))
+    return mapper.velocity()
+
+
+def _deskew_frames(frames, imu: ImuTrack, mapper: LidarMapper):
+    """
+    (timestamp, xyz) de cada frame corregido con el IMU y la velocidad del mapper.
+    El mapper aún no tiene velocidad en los dos primeros frames: se estima
+    registrando el primero con el segundo.
+    """
+    first = None
+    initial_velocity = None
+    for frame in frames:
+        if first is None and not mapper.poses:
+            first = frame
+            continue
+        if first is not None:
+            initial_velocity = pair_velocity(first, frame, imu)
+            yield first.timestamp, as_xyz(deskew_pointcloud(first.columns, first.timestamp, imu,
+                                                            initial_velocity)[0])
+            first = None
+        velocity = mapper.velocity()
+        velocity = initial_velocity if velocity is None else velocity
+        yield frame.timestamp, as_xyz(deskew_pointcloud(frame.columns, frame.timestamp, imu, velocity)[0])
+    if first is not None:
+        yield first.timestamp, as_xyz(deskew_pointcloud(first.columns, first.timestamp, imu)[0])
+
+
+def _cache_name(stride: int, max_frames: Optional[int], deskew: bool = False) -> str:
+    return f"map-s{int(stride)}-n{int(max_frames or 0)}" + ("-deskew" if deskew else "")
+
+
+def load_cached_map(bag_path, topic: str, stride: int = 1, max_frames: Optional[int] = None,
+                    deskew: bool = False) -> Optional[MappingResult]:
+    """Mapa ya calculado para estos parámetros (None si no está en la caché)"""
+    started = time.time()
+    fingerprint = get_bag_metadata(bag_path).fingerprint
+    cached = load_arrays(fingerprint, topic, _cache_name(stride, max_frames, deskew), MAPPING_VERSION)
+    if cached is None:
+        return None
+    meta, arrays = cached
+    map_columns = {axis: arrays[axis] for axis in ('x', 'y', 'z')}
+    return MappingResult(arrays['timestamps'], arrays['poses'], map_columns, meta['keyframes'], meta['failed'],
+                         meta['elapsed'], time.time() - started)
+
+
+def build_lidar_map(bag_path, topic: str, stride: int = 1, max_frames: Optional[int] = None,
+                    workers: int = 1, progress: Optional[Callable[[int, float], None]] = None,
+                    mapper: Optional[LidarMapper] = None, use_cache: bool = True,
+                    imu: Optional[ImuTrack] = None) -> MappingResult:
+    """
+    Recorre un topic PointCloud2, registra cada frame y devuelve la trayectoria y
+    el mapa global. Con workers > 1 los frames se decodifican en paralelo (ver
+    parallelDecode) mientras el proceso principal registra. `progress` recibe
+    (frames procesados, segundos) cada cierto número de frames. Con `imu` cada
+    frame se corrige antes de registrarlo (ver motionDeskew), con la velocidad
+    del modelo de velocidad constante del mapper.
+    """
+    deskew = imu is not None
+    if use_cache and mapper is None:
+        cached = load_cached_map(bag_path, topic, stride, max_frames, deskew)
+        if cached is not None:
+            return cached
+
+    from dataManagement.dataPointCloud import iter_pointcloud_frames
+    from dataManagement.parallelDecode import iter_pointcloud_frames_parallel
+
+    started = time.time()
+    mapper = mapper or LidarMapper()
+    fields = ('time',) if deskew else ()
+    if workers and workers > 1:
+        frames = iter_pointcloud_frames_parallel(bag_path, topic, stride=stride, max_frames=max_frames,
+                                                 fields=fields, workers=workers)
+    else:
+        frames = iter_pointcloud_frames(bag_path, topic, stride=stride, max_frames=max_frames, fields=fields)
+
+    if deskew:
+        clouds = _deskew_frames(frames, imu, mapper)
+    else:
+        clouds = ((frame.timestamp, as_xyz(frame.columns)) for frame in frames)
+
+    for count, (timestamp, xyz) in enumerate(clouds, start=1):
+        mapper.add_frame(timestamp, xyz)
+        if progress is not None and count % 50 == 0:
+            progress(count, time.time() - started)
+
+    timestamps, poses = mapper.trajectory()
+    points = mapper.global_map.points()
+    map_columns = {'x': points[:, 0], 'y': points[:, 1], 'z': points[:, 2]}
+    elapsed = time.time() - started
+    result = MappingResult(timestamps, poses, map_columns, mapper.keyframes, mapper.failed, elapsed)
+
+    if use_cache:
+        fingerprint = get_bag_metadata(bag_path).fingerprint
+        store_arrays(fingerprint, topic, _cache_name(stride, max_frames, deskew), MAPPING_VERSION,
+                     dict(map_columns, timestamps=timestamps, poses=poses),
+                     {'keyframes': mapper.keyframes, 'failed': mapper.failed, 'elapsed': elapsed})
+    return result
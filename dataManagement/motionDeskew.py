@@ -0,0 +1,175 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation, Slerp
+
+from dataManagement.bagCache import get_topic_table
+from dataManagement.dataIMU import find_imu_topic, read_imu_dataframe
+
+# Corrección del movimiento durante el barrido (deskew). Un LiDAR giratorio tarda
+# ~0.1 s en dar una vuelta y, si el vehículo se mueve, cada punto queda medido
+# desde una pose distinta. Con el campo `time` de cada punto y el IMU se calcula
+# la pose del sensor en el instante de cada punto respecto a la pose del final
+# del barrido (orientación con Slerp entre las muestras del IMU y traslación
+# integrando la aceleración) y se llevan todos los puntos a esa pose con una
+# sola operación sobre arreglos (N, 3). La rotación se interpola en pasos de
+# DESKEW_TIME_STEP, no punto a punto: un barrido de 0.1 s son ~1000 rotaciones
+# aunque tenga cientos de miles de puntos.
+# Supuestos: el mensaje se graba al terminar el barrido (el último punto se
+# alinea con el tiempo del mensaje) y el IMU y el LiDAR comparten ejes.
+
+# Gravedad (m/s²) que se resta a la aceleración medida cuando el IMU da orientación
+GRAVITY = 9.80665
+
+# Duración máxima de un barrido (s): con un rango de tiempos mayor, el campo está en ns
+MAX_SWEEP_DURATION = 1.0
+
+# Resolución temporal de la corrección (s): a 30 m/s, medio paso son 1.5 mm
+DESKEW_TIME_STEP = 1e-4
+
+# Huecos del IMU admitidos en los extremos del barrido (s)
+MAX_IMU_GAP = 0.05
+
+
+class ImuTrack(NamedTuple):
+    """Muestras del IMU ordenadas por tiempo, como arreglos"""
+    times: np.ndarray                   # (K,) segundos (mismo reloj que los frames)
+    orientation: Optional[np.ndarray]   # (K, 4) cuaterniones x, y, z, w (None si el IMU no la publica)
+    angular_velocity: np.ndarray        # (K, 3) rad/s
+    acceleration: np.ndarray            # (K, 3) m/s², con la gravedad
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+
+def imu_track(imu_df: pd.DataFrame) -> ImuTrack:
+    """ImuTrack a partir de la tabla de read_imu_dataframe (columnas Time, orientation.x, ...)"""
+    imu_df = imu_df.sort_values('Time').drop_duplicates('Time')
+    # Copias: las tablas de la caché en disco son de solo lectura
+    times = np.array(imu_df['Time'], dtype=np.float64)
+    orientation = np.array(imu_df[['orientation.x', 'orientation.y', 'orientation.z', 'orientation.w']],
+                           dtype=np.float64)
+    # Muchos IMU sin filtro de orientación publican el cuaternión a cero
+    if not (np.linalg.norm(orientation, axis=1) > 0.5).all():
+        orientation = None
+    angular_velocity = np.array(imu_df[['angular_velocity.x', 'angular_velocity.y', 'angular_velocity.z']],
+                                dtype=np.float64)
+    acceleration = np.array(imu_df[['linear_acceleration.x', 'linear_acceleration.y', 'linear_acceleration.z']],
+                            dtype=np.float64)
+    return ImuTrack(times, orientation, angular_velocity, acceleration)
+
+
+def load_imu_track(bag_path) -> Optional[ImuTrack]:
+    """IMU del bag (tabla en caché, ver dataIMU) o None si no tiene topic sensor_msgs/Imu"""
+    imu_topic = find_imu_topic(get_topic_table(bag_path))
+    if imu_topic is None:
+        return None
+    track = imu_track(read_imu_dataframe(bag_path, imu_topic))
+    return track if len(track) >= 2 else None
+
+
+def point_times(columns: Dict[str, np.ndarray], frame_time: float) -> Optional[np.ndarray]:
+    """
+    Tiempo absoluto (s) de cada punto a partir del campo `time`, sea relativo o
+    absoluto, en segundos o en ns (enteros o rangos de más de MAX_SWEEP_DURATION).
+    El último punto del barrido se alinea con frame_time. None si no hay campo.
+    """
+    if 'time' not in columns or len(columns['time']) == 0:
+        return None
+    raw = np.asarray(columns['time'])
+    times = raw.astype(np.float64)
+    if np.issubdtype(raw.dtype, np.integer) or np.ptp(times) > MAX_SWEEP_DURATION:
+        times = times * 1e-9
+    return frame_time - (times.max() - times)
+
+
+def _integrate_gyro(times: np.ndarray, angular_velocity: np.ndarray) -> Rotation:
+    """Orientaciones relativas a la primera muestra integrando la velocidad angular"""
+    steps = Rotation.from_rotvec(angular_velocity[:-1] * np.diff(times)[:, None])
+    rotations = [Rotation.identity()]
+    for step in steps:
+        rotations.append(rotations[-1] * step)
+    return Rotation.concatenate(rotations)
+
+
+def _backward_integral(times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Integral (trapecios) de cada muestra hasta la última: ∫_{t_k}^{t_end} values"""
+    steps = 0.5 * (values[1:] + values[:-1]) * np.diff(times)[:, None]
+    integral = np.zeros_like(values)
+    integral[:-1] = np.cumsum(steps[::-1], axis=0)[::-1]
+    return integral
+
+
+def sweep_motion(imu: ImuTrack, start: float, end: float,
+                 velocity: Optional[np.ndarray] = None) -> Optional[Tuple[np.ndarray, Slerp, np.ndarray]]:
+    """
+    Movimiento del sensor durante [start, end] respecto a la pose final: devuelve
+    (tiempos, Slerp de la rotación relativa, posición relativa (K, 3)) en las
+    muestras del IMU que cubren el barrido. `velocity` es la velocidad al final
+    del barrido en los ejes del sensor (m/s); sin ella se supone cero y solo se
+    integra la aceleración dentro del barrido. None si el IMU no cubre el barrido.
+    """
+    if len(imu) < 2 or imu.times[0] > start + MAX_IMU_GAP or imu.times[-1] < end - MAX_IMU_GAP:
+        return None
+    first = max(int(np.searchsorted(imu.times, start, side='right')) - 1, 0)
+    last = min(int(np.searchsorted(imu.times, end, side='left')) + 1, len(imu))
+    times = imu.times[first:last]
+    if len(times) < 2:
+        return None
+
+    if imu.orientation is not None:
+        rotations = Rotation.from_quat(imu.orientation[first:last])
+    else:
+        rotations = _integrate_gyro(times, imu.angular_velocity[first:last])
+    # Rotación relativa a la pose del final del barrido
+    end_time = float(np.clip(end, times[0], times[-1]))
+    end_rotation = Slerp(times, rotations)([end_time])[0]
+    relative = end_rotation.inv() * rotations
+
+    # Aceleración en los ejes del final del barrido, sin la gravedad. Sin orientación
+    # absoluta no se puede separar la gravedad y se supone velocidad constante
+    if imu.orientation is not None:
+        gravity = end_rotation.inv().apply([0.0, 0.0, GRAVITY])
+        acceleration = relative.apply(imu.acceleration[first:last]) - gravity
+    else:
+        acceleration = np.zeros((len(times), 3))
+
+    # Rejilla con el final del barrido como última muestra
+    keep = times < end_time
+    grid = np.append(times[keep], end_time)
+    acceleration = np.vstack((acceleration[keep], [np.interp(end_time, times, acceleration[:, axis])
+                                                   for axis in range(3)]))
+    end_velocity = np.zeros(3) if velocity is None else np.asarray(velocity, dtype=np.float64)
+    velocities = end_velocity - _backward_integral(grid, acceleration)
+    positions = -_backward_integral(grid, velocities)
+    return grid, Slerp(times, relative), positions
+
+
+def deskew_pointcloud(columns: Dict[str, np.ndarray], frame_time: float, imu: ImuTrack,
+                      velocity: Optional[np.ndarray] = None) -> Tuple[Dict[str, np.ndarray], bool]:
+    """
+    Lleva todos los puntos a la pose del sensor al final del barrido. Devuelve
+    (columnas corregidas, True) o las columnas sin cambios y False si la nube no
+    tiene campo `time` o el IMU no cubre el barrido.
+    """
+    times = point_times(columns, frame_time)
+    if times is None:
+        return columns, False
+    motion = sweep_motion(imu, float(times.min()), float(frame_time), velocity)
+    if motion is None:
+        return columns, False
+    grid, rotation, positions = motion
+
+    # Pose relativa en cada paso de DESKEW_TIME_STEP y, por punto, la de su paso
+    steps = np.rint((np.clip(times, grid[0], grid[-1]) - grid[0]) / DESKEW_TIME_STEP).astype(np.int64)
+    step_times = np.minimum(grid[0] + np.arange(int(steps.max()) + 1) * DESKEW_TIME_STEP, grid[-1])
+    matrices = rotation(step_times).as_matrix().astype(np.float32)
+    offsets = np.column_stack([np.interp(step_times, grid, positions[:, axis])
+                               for axis in range(3)]).astype(np.float32)
+    xyz = np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+    corrected = np.einsum('nij,nj->ni', matrices[steps], xyz) + offsets[steps]
+
+    columns = dict(columns)
+    columns['x'], columns['y'], columns['z'] = corrected[:, 0], corrected[:, 1], corrected[:, 2]
+    return columns, True
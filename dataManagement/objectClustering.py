@@ -0,0 +1,226 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import ConvexHull
+
+from dataManagement.pointCloudFilters import group_keys
+
+# Extracción de objetos: clustering euclídeo por componentes conexas de voxels
+# sobre los puntos que no son suelo (ver groundSegmentation) y cajas orientadas
+# (giro alrededor de z, rectángulo de área mínima en planta) de cada cluster. La
+# vecindad se resuelve sobre la rejilla (cada voxel ocupado solo mira sus 26
+# vecinos), así que el coste es lineal en el número de puntos en vez de cuadrático.
+
+# Lado del voxel de conexión: puntos en voxels vecinos pertenecen al mismo objeto
+CLUSTER_TOLERANCE = 0.5
+
+# Tamaño admitido de un cluster (puntos)
+MIN_CLUSTER_POINTS = 15
+MAX_CLUSTER_POINTS = 50000
+
+# Rectángulos con un área hasta un 5% mayor que la mínima empatan con ella: una
+# vista en L (dos caras) tiene dos rectángulos de área mínima, el alineado con
+# las caras y el alineado con la diagonal, y se elige el de puntos más pegados a los lados
+BOX_AREA_TOLERANCE = 0.05
+
+# Mitad de los 26 desplazamientos a voxels vecinos (cada arista se genera una vez)
+_HALF_OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                          if (dx, dy, dz) > (0, 0, 0)], dtype=np.int64)
+
+# Aristas de una caja por índices de sus 8 esquinas (ver box_corners)
+_BOX_EDGES = ((0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (0, 4), (1, 5), (2, 6), (3, 7))
+
+
+class ObjectBoxes(NamedTuple):
+    """Cajas orientadas de los clusters (una fila por objeto)"""
+    centers: np.ndarray   # (K, 3)
+    sizes: np.ndarray     # (K, 3) largo, ancho y alto en el marco de la caja
+    yaws: np.ndarray      # (K,) giro alrededor de z (radianes)
+    counts: np.ndarray    # (K,) puntos de cada cluster
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+def _xyz(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+
+
+def voxel_components(xyz: np.ndarray, tolerance: float = CLUSTER_TOLERANCE) -> np.ndarray:
+    """
+    Componente conexa de cada punto: dos puntos se conectan si caen en el mismo
+    voxel de lado `tolerance` o en voxels vecinos (26-vecindad).
+    """
+    if len(xyz) == 0:
+        return np.zeros(0, dtype=np.int64)
+    low = np.array([xyz[:, axis].min() for axis in range(3)])
+    # Margen de una celda a cada lado: los vecinos nunca salen de la rejilla
+    cells = np.floor((xyz - low) / tolerance).astype(np.int64) + 1
+    dims = np.array([cells[:, axis].max() for axis in range(3)]) + 2
+
+    def linear(c):
+        return (c[:, 0] * dims[1] + c[:, 1]) * dims[2] + c[:, 2]
+
+    order, starts = group_keys(linear(cells))
+    voxel_cells = cells[order[starts]]
+    voxel_keys = linear(voxel_cells)
+    counts = np.diff(np.append(starts, len(order)))
+    voxel_of_point = np.empty(len(xyz), dtype=np.int64)
+    voxel_of_point[order] = np.repeat(np.arange(len(starts)), counts)
+
+    rows, cols = [], []
+    for offset in _HALF_OFFSETS:
+        neighbor_keys = linear(voxel_cells + offset)
+        pos = np.minimum(np.searchsorted(voxel_keys, neighbor_keys), len(voxel_keys) - 1)
+        hit = voxel_keys[pos] == neighbor_keys
+        rows.append(np.flatnonzero(hit))
+        cols.append(pos[hit])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(starts), len(starts)))
+    _, component = connected_components(graph, directed=False)
+    return component[voxel_of_point]
+
+
+def cluster_points(xyz: np.ndarray, tolerance: float = CLUSTER_TOLERANCE,
+                   min_points: int = MIN_CLUSTER_POINTS,
+                   max_points: int = MAX_CLUSTER_POINTS) -> np.ndarray:
+    """Etiqueta de cluster de cada punto (0..K-1), -1 si su cluster es demasiado pequeño o grande"""
+    components = voxel_components(xyz, tolerance)
+    if len(components) == 0:
+        return components
+    sizes = np.bincount(components)
+    kept = (sizes >= min_points) & (sizes <= max_points)
+    relabel = np.full(len(sizes), -1, dtype=np.int64)
+    relabel[kept] = np.arange(int(kept.sum()))
+    return relabel[components]
+
+
+def _min_area_yaws(dx: np.ndarray, dy: np.ndarray, owner: np.ndarray, order: np.ndarray,
+                   starts: np.ndarray, yaws: np.ndarray) -> np.ndarray:
+    """
+    Orientación del rectángulo de área mínima que contiene cada cluster en el
+    plano xy. Ese rectángulo tiene un lado sobre una arista de la envolvente
+    convexa, así que basta probar los ángulos de sus aristas (pocas decenas).
+    Entre los que empatan en área (BOX_AREA_TOLERANCE) se queda el de menor
+    distancia media de los puntos a su lado más cercano. Los clusters sin
+    envolvente (puntos alineados) conservan el valor de `yaws`.
+    """
+    yaws = yaws.copy()
+    ends = np.append(starts[1:], len(order))
+    for first, last in zip(starts.tolist(), ends.tolist()):
+        members = order[first:last]
+        xy = np.column_stack((dx[members], dy[members]))
+        try:
+            hull = xy[ConvexHull(xy).vertices]
+        except (RuntimeError, ValueError):  # QhullError: puntos alineados o repetidos
+            continue
+        edges = np.roll(hull, -1, axis=0) - hull
+        angles = np.mod(np.arctan2(edges[:, 1], edges[:, 0]), np.pi / 2)
+        cos, sin = np.cos(angles), np.sin(angles)
+        u = hull[:, :1] * cos + hull[:, 1:] * sin       # (vértices, ángulos)
+        v = -hull[:, :1] * sin + hull[:, 1:] * cos
+        area = np.ptp(u, axis=0) * np.ptp(v, axis=0)
+        candidates = angles[area <= area.min() * (1 + BOX_AREA_TOLERANCE)]
+        if len(candidates) > 1:
+            cos, sin = np.cos(candidates), np.sin(candidates)
+            u = xy[:, :1] * cos + xy[:, 1:] * sin       # (puntos, candidatos)
+            v = -xy[:, :1] * sin + xy[:, 1:] * cos
+            gap = np.minimum(np.minimum(u - u.min(axis=0), u.max(axis=0) - u),
+                             np.minimum(v - v.min(axis=0), v.max(axis=0) - v))
+            yaws[owner[members[0]]] = candidates[gap.mean(axis=0).argmin()]
+        else:
+            yaws[owner[members[0]]] = candidates[0]
+    return yaws
+
+
+def oriented_boxes(xyz: np.ndarray, labels: np.ndarray) -> ObjectBoxes:
+    """
+    Caja orientada de cada cluster: en el plano xy es el rectángulo de área
+    mínima sobre su envolvente convexa (el eje principal de PCA si los puntos
+    están alineados) y la altura sale de su rango en z. El largo va siempre en
+    la dirección del giro. Las extensiones se calculan a la vez con reduceat.
+    """
+    valid = labels >= 0
+    points = xyz[valid].astype(np.float64)
+    owner = labels[valid]
+    clusters = int(owner.max()) + 1 if len(owner) else 0
+    if clusters == 0:
+        return ObjectBoxes(np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0), np.zeros(0, dtype=np.int64))
+
+    counts = np.bincount(owner, minlength=clusters)
+    means = np.stack([np.bincount(owner, points[:, axis], clusters) for axis in range(2)], axis=1) / counts[:, None]
+    dx = points[:, 0] - means[owner, 0]
+    dy = points[:, 1] - means[owner, 1]
+    cxx = np.bincount(owner, dx * dx, clusters)
+    cyy = np.bincount(owner, dy * dy, clusters)
+    cxy = np.bincount(owner, dx * dy, clusters)
+    order, starts = group_keys(owner)
+    yaws = _min_area_yaws(dx, dy, owner, order, starts, 0.5 * np.arctan2(2 * cxy, cxx - cyy))
+
+    cos, sin = np.cos(yaws)[owner], np.sin(yaws)[owner]
+    u = dx * cos + dy * sin
+    v = -dx * sin + dy * cos
+
+    def extent(values):
+        ordered = values[order]
+        return np.minimum.reduceat(ordered, starts), np.maximum.reduceat(ordered, starts)
+
+    u_low, u_high = extent(u)
+    v_low, v_high = extent(v)
+    z_low, z_high = extent(points[:, 2])
+
+    u_mid, v_mid = (u_low + u_high) / 2, (v_low + v_high) / 2
+    cos, sin = np.cos(yaws), np.sin(yaws)
+    centers = np.column_stack((means[:, 0] + u_mid * cos - v_mid * sin,
+                               means[:, 1] + u_mid * sin + v_mid * cos,
+                               (z_low + z_high) / 2))
+    sizes = np.column_stack((u_high - u_low, v_high - v_low, z_high - z_low))
+    # El largo en la dirección del giro, con el giro en [-π/2, π/2)
+    swap = sizes[:, 1] > sizes[:, 0]
+    sizes[swap, :2] = sizes[swap, 1::-1]
+    yaws = np.mod(np.where(swap, yaws + np.pi / 2, yaws) + np.pi / 2, np.pi) - np.pi / 2
+    return ObjectBoxes(centers, sizes, yaws, counts)
+
+
+def cluster_objects(columns: Dict[str, np.ndarray], ground: Optional[np.ndarray] = None,
+                    tolerance: float = CLUSTER_TOLERANCE, min_points: int = MIN_CLUSTER_POINTS,
+                    max_points: int = MAX_CLUSTER_POINTS) -> Tuple[np.ndarray, ObjectBoxes]:
+    """
+    Agrupa en objetos los puntos que no son suelo (máscara `ground`, ver
+    groundSegmentation). Devuelve (etiqueta por punto, -1 para suelo y ruido; cajas).
+    """
+    xyz = _xyz(columns)
+    labels = np.full(len(xyz), -1, dtype=np.int64)
+    candidates = np.isfinite(xyz).all(axis=1)
+    if ground is not None:
+        candidates &= ~ground
+    labels[candidates] = cluster_points(xyz[candidates], tolerance, min_points, max_points)
+    return labels, oriented_boxes(xyz, labels)
+
+
+def box_corners(boxes: ObjectBoxes) -> np.ndarray:
+    """Las 8 esquinas de cada caja (K, 8, 3): primero las 4 de abajo y luego las 4 de arriba"""
+    signs = np.array([(-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),
+                      (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)], dtype=np.float64)
+    local = signs[None, :, :] * (boxes.sizes[:, None, :] / 2)
+    cos, sin = np.cos(boxes.yaws)[:, None], np.sin(boxes.yaws)[:, None]
+    x = local[:, :, 0] * cos - local[:, :, 1] * sin
+    y = local[:, :, 0] * sin + local[:, :, 1] * cos
+    return np.stack((x, y, local[:, :, 2]), axis=2) + boxes.centers[:, None, :]
+
+
+def box_edges(boxes: ObjectBoxes) -> np.ndarray:
+    """
+    Aristas de todas las cajas como una sola polilínea (M, 3) con filas NaN entre
+    segmentos, para dibujarlas con una única traza de Plotly
+    """
+    if len(boxes) == 0:
+        return np.zeros((0, 3), dtype=np.float32)
+    corners = box_corners(boxes)
+    edges = np.array(_BOX_EDGES)
+    segments = corners[:, edges]                                    # (K, 12, 2, 3)
+    gaps = np.full(segments.shape[:2] + (1, 3), np.nan)
+    return np.concatenate((segments, gaps), axis=2).reshape(-1, 3).astype(np.float32)
@@ -0,0 +1,163 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from dataManagement.pointCloudFilters import MAX_GRID_CELLS, group_keys, voxel_keys
+from dataManagement.spatialIndex import QUERY_BATCH, SpatialIndex
+
+# Eliminación de ruido (lluvia, polvo, rebotes multitrayecto) en nubes decodificadas.
+# - Estadístico: un punto es atípico si la distancia media a sus k vecinos supera
+#   media + std_ratio * desviación de esa distancia en toda la nube.
+# - Por radio: un punto es atípico si tiene menos de min_neighbors vecinos a
+#   menos de `radius`.
+# La separación entre puntos de un LiDAR giratorio crece linealmente con la
+# distancia al sensor, así que en los frames de los bags ambos umbrales se
+# escalan con el rango de cada punto a partir de OUTLIER_REFERENCE_RANGE; sin
+# esto los retornos lejanos, dispersos pero válidos, se tomarían por ruido.
+# Buscar vecinos para todos los puntos es lo caro, así que primero se descartan
+# con una rejilla los puntos que seguro se quedan: si el voxel de un punto (con
+# diagonal igual al umbral de distancia) tiene suficientes puntos, todos ellos
+# están a menos del umbral. Solo los puntos de voxels poco poblados (los
+# candidatos a ruido) se consultan en el KD-tree, por lotes de QUERY_BATCH.
+
+NO_OUTLIER_REMOVAL = 'none'
+STATISTICAL_OUTLIERS = 'statistical'
+RADIUS_OUTLIERS = 'radius'
+OUTLIER_METHODS = (STATISTICAL_OUTLIERS, RADIUS_OUTLIERS, NO_OUTLIER_REMOVAL)
+
+# Filtro estadístico: vecinos por punto y desviaciones admitidas sobre la media
+STATISTICAL_NEIGHBORS = 8
+STD_RATIO = 2.0
+
+# Puntos con los que se estiman la media y la desviación de la distancia a los vecinos
+STATISTICS_SAMPLE = 50000
+
+# Filtro por radio (radio hasta OUTLIER_REFERENCE_RANGE)
+OUTLIER_RADIUS = 0.5
+MIN_RADIUS_NEIGHBORS = 2
+
+# Rango (m) a partir del cual los umbrales crecen en proporción a la distancia:
+# a 80 m el radio es 0.5 * 80 / 25 = 1.6 m
+OUTLIER_REFERENCE_RANGE = 25.0
+
+
+def _xyz(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+
+
+def range_scale(xyz: np.ndarray, reference_range: float = OUTLIER_REFERENCE_RANGE) -> np.ndarray:
+    """Factor de cada punto: 1 hasta reference_range y rango / reference_range a partir de ahí"""
+    ranges = np.sqrt(np.einsum('ij,ij->i', xyz, xyz, dtype=np.float64))
+    return np.maximum(ranges / reference_range, 1.0)
+
+
+def _crowded(xyz: np.ndarray, distance: float, min_points: int) -> np.ndarray:
+    """
+    Puntos cuyo voxel de diagonal `distance` tiene al menos min_points puntos
+    (entre ellos hay min_points - 1 vecinos a menos de `distance`)
+    """
+    side = distance / np.sqrt(3.0)
+    extent = float(np.ptp(xyz, axis=0).max()) if len(xyz) else 0.0
+    if not np.isfinite(side) or side <= 0 or extent / side >= MAX_GRID_CELLS:
+        # La rejilla desbordaría la clave: se consultan todos los puntos
+        return np.zeros(len(xyz), dtype=bool)
+    order, starts = group_keys(voxel_keys(xyz, side))
+    counts = np.diff(np.append(starts, len(order)))
+    crowded = np.empty(len(xyz), dtype=bool)
+    crowded[order] = np.repeat(counts >= min_points, counts)
+    return crowded
+
+
+def _knn_distances(index: SpatialIndex, xyz: np.ndarray, queries: np.ndarray, k: int,
+                   max_distance) -> np.ndarray:
+    """
+    Distancias (M, k) a los k vecinos de los puntos `queries` (índices), por
+    lotes. `max_distance` es un valor o uno por consulta (cada lote busca hasta
+    el mayor de los suyos).
+    """
+    limits = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (len(queries),))
+    distances = np.empty((len(queries), k), dtype=np.float64)
+    for first in range(0, len(queries), QUERY_BATCH):
+        batch = queries[first:first + QUERY_BATCH]
+        distances[first:first + len(batch)] = index.knn(xyz[batch], k, float(limits[first:first + len(batch)].max()))[0]
+    return distances
+
+
+def statistical_outlier_mask(xyz: np.ndarray, k: int = STATISTICAL_NEIGHBORS, std_ratio: float = STD_RATIO,
+                             index: Optional[SpatialIndex] = None, sample: int = STATISTICS_SAMPLE,
+                             scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Máscara de puntos que se conservan con el filtro estadístico. La media y la
+    desviación de la distancia a los k vecinos se estiman con `sample` puntos.
+    Con `scale` (un factor por punto, ver range_scale) se comparan las
+    distancias divididas por el factor de cada punto.
+    """
+    keep = np.isfinite(xyz).all(axis=1)
+    points = np.flatnonzero(keep)
+    if len(points) <= k:
+        return keep
+    index = index or SpatialIndex(xyz[points])
+    local = xyz[points]
+    factor = np.ones(len(points)) if scale is None else np.asarray(scale, dtype=np.float64)[points]
+
+    rng = np.random.default_rng(0)
+    probes = rng.choice(len(points), sample, replace=False) if len(points) > sample else np.arange(len(points))
+    # El primer vecino es el propio punto
+    mean_distance = _knn_distances(index, local, probes, k + 1, np.inf)[:, 1:].mean(axis=1) / factor[probes]
+    limit = float(mean_distance.mean() + std_ratio * mean_distance.std())
+
+    # El factor es >= 1: un voxel poblado con el límite sin escalar basta para conservar
+    candidates = np.flatnonzero(~_crowded(local, limit, k + 1))
+    # Con un vecino a más de k * límite la media ya lo supera
+    distances = _knn_distances(index, local, candidates, k + 1, k * limit * factor[candidates])[:, 1:]
+    keep[points[candidates]] = distances.mean(axis=1) <= limit * factor[candidates]
+    return keep
+
+
+def radius_outlier_mask(xyz: np.ndarray, radius: float = OUTLIER_RADIUS,
+                        min_neighbors: int = MIN_RADIUS_NEIGHBORS,
+                        index: Optional[SpatialIndex] = None,
+                        scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Máscara de puntos con al menos min_neighbors vecinos a menos de `radius`
+    (multiplicado por el factor de cada punto si se pasa `scale`)
+    """
+    keep = np.isfinite(xyz).all(axis=1)
+    points = np.flatnonzero(keep)
+    if min_neighbors <= 0 or len(points) == 0:
+        return keep
+    index = index or SpatialIndex(xyz[points])
+    local = xyz[points]
+    radii = np.full(len(points), float(radius)) if scale is None else radius * np.asarray(scale)[points]
+
+    # El factor es >= 1: un voxel poblado con el radio sin escalar basta para conservar
+    candidates = np.flatnonzero(~_crowded(local, radius, min_neighbors + 1))
+    # Basta con mirar si el vecino número min_neighbors (sin contar el propio punto) está dentro
+    distances = _knn_distances(index, local, candidates, min_neighbors + 1, radii[candidates])
+    keep[points[candidates]] = distances[:, -1] <= radii[candidates]
+    return keep
+
+
+def remove_outliers(columns: Dict[str, np.ndarray], method: str = STATISTICAL_OUTLIERS,
+                    k: int = STATISTICAL_NEIGHBORS, std_ratio: float = STD_RATIO,
+                    radius: float = OUTLIER_RADIUS, min_neighbors: int = MIN_RADIUS_NEIGHBORS,
+                    scale_with_range: bool = True) -> Tuple[Dict[str, np.ndarray], int]:
+    """
+    Devuelve (nube sin los puntos atípicos, número de puntos eliminados).
+    scale_with_range=True supone la nube en el marco del sensor (frames de un
+    bag); para nubes en coordenadas del mundo (LAS, mapas) usar False.
+    """
+    if method == NO_OUTLIER_REMOVAL or len(columns['x']) == 0:
+        return columns, 0
+    xyz = _xyz(columns)
+    scale = range_scale(xyz) if scale_with_range else None
+    if method == STATISTICAL_OUTLIERS:
+        keep = statistical_outlier_mask(xyz, k, std_ratio, scale=scale)
+    elif method == RADIUS_OUTLIERS:
+        keep = radius_outlier_mask(xyz, radius, min_neighbors, scale=scale)
+    else:
+        raise ValueError(f"Método de eliminación de ruido no soportado: {method}")
+    removed = int(len(keep) - keep.sum())
+    if removed == 0:
+        return columns, 0
+    return {name: np.asarray(column)[keep] for name, column in columns.items()}, removed
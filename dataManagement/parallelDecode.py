@@ -0,0 +1,187 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from dataManagement.bagCache import open_bag
+from dataManagement.dataPointCloud import PointCloudFrame
+from dataManagement.pointCloudDecoder import DEFAULT_EXTRA_FIELDS, decode_pointcloud2
+from dataManagement.rosMessages import deserialize_pointcloud2
+
+# Decodificación de frames PointCloud2 en paralelo con un pool de procesos. El
+# proceso principal lee los mensajes crudos del bag en orden y los deja en
+# memoria compartida; cada worker los decodifica y devuelve las columnas en otro
+# bloque de memoria compartida (solo viaja por pickle una descripción pequeña).
+# Los frames se entregan en el orden del bag y con un número acotado en vuelo.
+# El mismo esquema (map_pointcloud_messages) sirve para otros trabajos por
+# frame, como la exportación a PCD/LAS (ver pointCloudExport).
+
+
+class _ColumnLayout(NamedTuple):
+    name: str
+    dtype: str
+    offset: int
+    count: int
+
+
+class _DecodedFrame(NamedTuple):
+    shm_name: Optional[str]         # Bloque con las columnas (None si no hay datos)
+    columns: List[_ColumnLayout]
+
+
+def default_workers() -> int:
+    return max((os.cpu_count() or 1) - 1, 1)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(name=name)
+
+
+def decode_shared_message(shm_name: str, length: int, encoding: str, fields) -> Dict[str, np.ndarray]:
+    """Decodifica un mensaje que está en memoria compartida (se ejecuta en el worker)"""
+    source = _attach(shm_name)
+    try:
+        cloud = deserialize_pointcloud2(source.buf[:length], encoding)
+        columns = decode_pointcloud2(cloud, fields=fields)
+        # Copias propias: las columnas no pueden seguir apuntando al bloque de entrada
+        columns = {name: np.array(column, copy=True) for name, column in columns.items()}
+        del cloud
+    finally:
+        source.close()
+    return columns
+
+
+def _decode_in_worker(shm_name: str, length: int, encoding: str, index: int, timestamp: float,
+                      fields) -> _DecodedFrame:
+    """Decodifica un mensaje y deja las columnas en un bloque compartido nuevo"""
+    columns = decode_shared_message(shm_name, length, encoding, fields)
+    total = sum(column.nbytes for column in columns.values())
+    if total == 0:
+        return _DecodedFrame(None, [_ColumnLayout(name, column.dtype.str, 0, 0)
+                                    for name, column in columns.items()])
+
+    output = shared_memory.SharedMemory(create=True, size=total)
+    layout = []
+    offset = 0
+    for name, column in columns.items():
+        target = np.ndarray(column.shape, dtype=column.dtype, buffer=output.buf, offset=offset)
+        target[...] = column
+        layout.append(_ColumnLayout(name, column.dtype.str, offset, len(column)))
+        offset += column.nbytes
+        del target
+    output.close()  # El proceso principal lo libera después de copiarlo
+    return _DecodedFrame(output.name, layout)
+
+
+def _collect(decoded: _DecodedFrame) -> Dict[str, np.ndarray]:
+    """Copia las columnas del bloque compartido a arreglos propios y libera el bloque"""
+    if decoded.shm_name is None:
+        return {column.name: np.empty(0, dtype=column.dtype) for column in decoded.columns}
+
+    block = _attach(decoded.shm_name)
+    try:
+        return {
+            column.name: np.ndarray((column.count,), dtype=column.dtype, buffer=block.buf,
+                                    offset=column.offset).copy()
+            for column in decoded.columns
+        }
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _share_message(data) -> Tuple[shared_memory.SharedMemory, int]:
+    """Copia un mensaje crudo a un bloque de memoria compartida"""
+    length = len(data)
+    block = shared_memory.SharedMemory(create=True, size=max(length, 1))
+    block.buf[:length] = data
+    return block, length
+
+
+def map_pointcloud_messages(bag_path, topic: str, work: Callable, args: tuple = (),
+                            finish: Optional[Callable] = None, stride: int = 1,
+                            start_time: Optional[float] = None,
+                            end_time: Optional[float] = None,
+                            max_frames: Optional[int] = None,
+                            workers: Optional[int] = None,
+                            max_in_flight: Optional[int] = None) -> Iterator[Tuple[int, float, object]]:
+    """
+    Ejecuta `work(nombre_shm, longitud, encoding, índice, timestamp, *args)` en
+    el pool para cada mensaje PointCloud2 del topic y entrega (índice, timestamp,
+    resultado) en el orden del bag. `finish` se aplica al resultado en el proceso
+    principal (también a los que quedan en vuelo si se corta la iteración). Como
+    mucho hay `max_in_flight` mensajes leídos y aún no entregados (por defecto 2
+    por worker), lo que acota la memoria.
+    """
+    stride = max(int(stride), 1)
+    workers = workers or default_workers()
+    max_in_flight = max(int(max_in_flight or 2 * workers), 1)
+    if max_frames is not None and max_frames <= 0:
+        return
+
+    pending = deque()  # (índice, timestamp, bloque de entrada, future) en orden del bag
+
+    def finish_oldest():
+        index, timestamp, source, future = pending.popleft()
+        try:
+            result = future.result()
+            if finish is not None:
+                result = finish(result)
+        finally:
+            source.close()
+            source.unlink()
+        return index, timestamp, result
+
+    submitted = 0
+    with open_bag(bag_path) as reader, ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            # Las posiciones son dentro del topic completo aunque se acote la ventana
+            first = reader.messages_before(topic, start_time)
+            messages = reader.read_messages([topic], start_time=start_time, end_time=end_time)
+            for index, message in enumerate(messages, start=first):
+                if (index - first) % stride or message.connection.msg_type != 'sensor_msgs/PointCloud2':
+                    continue
+                if max_frames is not None and submitted >= max_frames:
+                    break
+
+                timestamp = message.timestamp / 1e9
+                source, length = _share_message(message.data)
+                future = executor.submit(work, source.name, length, reader.message_encoding, index, timestamp, *args)
+                pending.append((index, timestamp, source, future))
+                submitted += 1
+
+                while len(pending) >= max_in_flight:
+                    yield finish_oldest()
+
+            while pending:
+                yield finish_oldest()
+        finally:
+            # Si el consumidor corta la iteración, liberar lo que quede en vuelo
+            while pending:
+                try:
+                    finish_oldest()
+                except Exception:
+                    pass
+
+
+def iter_pointcloud_frames_parallel(bag_path, topic: str, stride: int = 1,
+                                    start_time: Optional[float] = None,
+                                    end_time: Optional[float] = None,
+                                    max_frames: Optional[int] = None,
+                                    fields=DEFAULT_EXTRA_FIELDS,
+                                    workers: Optional[int] = None,
+                                    max_in_flight: Optional[int] = None) -> Iterator[PointCloudFrame]:
+    """
+    Igual que dataPointCloud.iter_pointcloud_frames pero decodificando en
+    `workers` procesos (ver map_pointcloud_messages)
+    """
+    results = map_pointcloud_messages(bag_path, topic, _decode_in_worker, (fields,), _collect, stride,
+                                      start_time, end_time, max_frames, workers, max_in_flight)
+    try:
+        for index, timestamp, columns in results:
+            yield PointCloudFrame(index, timestamp, columns)
+    finally:
+        results.close()
@@ -0,0 +1,99 @@
+import numpy as np
+from typing import Dict, List, NamedTuple, Tuple
+
+# Preparación compacta de nubes de puntos para figuras de Plotly. Desde plotly 6
+# los arreglos de NumPy se serializan como typed arrays en base64 ({"dtype",
+# "bdata"}) conservando su tipo, así que basta con mantener los datos como
+# arreglos pequeños de principio a fin: float32 o int16 cuantizado para las
+# coordenadas y uint8 para el color (un índice en la escala de colores).
+
+QUANTIZE_LEVELS = 32767      # int16 simétrico
+COLOR_LEVELS = 256           # uint8
+AXIS_TICKS = 6
+
+
+class Quantization(NamedTuple):
+    """Transformación coordenada = center + valor_int16 * scale (la misma escala en los tres ejes)"""
+    center: np.ndarray
+    scale: float
+
+
+def pointcloud_bounds(clouds: List[Dict[str, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Caja envolvente (mínimo, máximo por eje) de varias nubes"""
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    for columns in clouds:
+        if len(columns['x']):
+            for axis, name in enumerate(('x', 'y', 'z')):
+                low[axis] = min(low[axis], float(columns[name].min()))
+                high[axis] = max(high[axis], float(columns[name].max()))
+    if not np.isfinite(low).all():
+        return np.zeros(3), np.zeros(3)
+    return low, high
+
+
+def fit_quantization(*clouds: Dict[str, np.ndarray]) -> Quantization:
+    """
+    Cuantización int16 ajustada a la caja envolvente de todas las nubes. Se usa
+    una escala única para que aspectmode='data' conserve la geometría.
+    """
+    low, high = pointcloud_bounds(list(clouds))
+    extent = float((high - low).max())
+    return Quantization((low + high) / 2.0, max(extent, 1e-6) / (2 * QUANTIZE_LEVELS))
+
+
+def quantize_points(columns: Dict[str, np.ndarray], quantization: Quantization) -> Tuple[np.ndarray, ...]:
+    """Coordenadas x, y, z como int16 en el marco de `quantization`"""
+    return tuple(
+        np.clip(np.rint((columns[name] - quantization.center[axis]) / quantization.scale),
+                -QUANTIZE_LEVELS, QUANTIZE_LEVELS).astype(np.int16)
+        for axis, name in enumerate(('x', 'y', 'z'))
+    )
+
+
+def to_quantized_units(points: np.ndarray, quantization: Quantization) -> Tuple[np.ndarray, ...]:
+    """
+    Coordenadas (N, 3) en las unidades de `quantization` pero como float32, para
+    trazas pequeñas con huecos NaN (líneas) que no admiten int16
+    """
+    scaled = (np.asarray(points, dtype=np.float64) - quantization.center) / quantization.scale
+    return tuple(scaled[:, axis].astype(np.float32) for axis in range(3))
+
+
+def _nice_ticks(low: float, high: float, count: int = AXIS_TICKS) -> np.ndarray:
+    """Valores redondos (1, 2, 5 x 10^k) que cubren [low, high]"""
+    span = high - low
+    if span <= 0:
+        return np.array([low])
+    raw = span / max(count - 1, 1)
+    magnitude = 10 ** np.floor(np.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw)
+    return np.arange(np.ceil(low / step) * step, high + step * 1e-9, step)
+
+
+def quantized_axis(quantization: Quantization, axis: int, low: float, high: float) -> dict:
+    """Ejes de la escena con etiquetas en metros para coordenadas cuantizadas"""
+    ticks = _nice_ticks(low, high)
+    return dict(
+        tickvals=((ticks - quantization.center[axis]) / quantization.scale).tolist(),
+        ticktext=[f"{tick:g}" for tick in ticks],
+    )
+
+
+def color_indices(values: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Índice uint8 en la escala de colores (un byte por punto en vez de un float)"""
+    if high <= low:
+        return np.zeros(len(values), dtype=np.uint8)
+    scaled = (values - low) * ((COLOR_LEVELS - 1) / (high - low))
+    return np.clip(np.rint(scaled), 0, COLOR_LEVELS - 1).astype(np.uint8)
+
+
+def colorbar_ticks(low: float, high: float) -> dict:
+    """Etiquetas de la barra de color en las unidades originales"""
+    ticks = _nice_ticks(low, high)
+    if high <= low:
+        return dict(tickvals=[0], ticktext=[f"{low:g}"])
+    return dict(
+        tickvals=((ticks - low) * ((COLOR_LEVELS - 1) / (high - low))).tolist(),
+        ticktext=[f"{tick:g}" for tick in ticks],
+    )
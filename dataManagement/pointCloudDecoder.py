@@ -0,0 +1,146 @@
+import numpy as np
+from typing import Dict, Iterable, Optional
+
+# Versión de los frames de nubes de puntos decodificados: incrementar cuando cambie
+# el formato de sus columnas (invalida esos frames de la caché en disco; las tablas
+# de IMU y GPS tienen su propia versión, ver rosMessages.TABLE_DECODER_VERSION)
+POINTCLOUD_DECODER_VERSION = 1
+
+# Tipos de sensor_msgs/PointField -> código de NumPy (sin orden de bytes)
+POINTFIELD_DTYPES = {
+    1: 'i1',  # INT8
+    2: 'u1',  # UINT8
+    3: 'i2',  # INT16
+    4: 'u2',  # UINT16
+    5: 'i4',  # INT32
+    6: 'u4',  # UINT32
+    7: 'f4',  # FLOAT32
+    8: 'f8',  # FLOAT64
+}
+
+# Campos opcionales que se conservan por defecto además de x, y, z
+DEFAULT_EXTRA_FIELDS = ('intensity', 'ring', 'time')
+
+# Nombres alternativos que usan los distintos drivers para el mismo campo
+FIELD_ALIASES = {
+    'intensity': ('intensity', 'reflectivity', 'i'),
+    'ring': ('ring', 'channel', 'laser_id'),
+    'time': ('time', 't', 'timestamp', 'offset_time'),
+}
+
+
+def pointcloud2_dtype(fields, point_step: int, is_bigendian: bool = False) -> np.dtype:
+    """
+    Construye un dtype estructurado de NumPy a partir de los PointField de un PointCloud2
+    """
+    byte_order = '>' if is_bigendian else '<'
+    names, formats, offsets = [], [], []
+
+    for field in fields:
+        code = POINTFIELD_DTYPES.get(field.datatype)
+        if code is None or not field.name or field.name in names:
+            continue
+
+        count = max(int(getattr(field, 'count', 1) or 1), 1)
+        size = np.dtype(code).itemsize * count
+        # Ignorar campos que se salen del punto (mensajes mal formados)
+        if field.offset + size > point_step:
+            continue
+
+        names.append(field.name)
+        offsets.append(field.offset)
+        formats.append((byte_order + code, (count,)) if count > 1 else byte_order + code)
+
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': point_step,
+    })
+
+
+def pointcloud2_records(msg) -> np.ndarray:
+    """
+    Devuelve los puntos de un PointCloud2 como un arreglo estructurado (N,) que
+    comparte memoria con msg.data (solo se copia si las filas tienen relleno)
+    """
+    data = msg.data
+    if isinstance(data, str):
+        data = data.encode('latin-1')
+
+    point_step = msg.point_step
+    dtype = pointcloud2_dtype(msg.fields, point_step, bool(msg.is_bigendian))
+    height = max(int(msg.height), 1)
+    width = int(msg.width)
+    row_step = int(msg.row_step) or width * point_step
+
+    if height == 1 or row_step == width * point_step:
+        count = min(width * height, len(data) // point_step) if point_step else 0
+        return np.frombuffer(data, dtype=dtype, count=count)
+
+    # Nube organizada con relleno al final de cada fila
+    height = min(height, (len(data) - width * point_step) // row_step + 1)
+    records = np.ndarray(
+        shape=(height, width),
+        dtype=dtype,
+        buffer=data,
+        strides=(row_step, point_step),
+    )
+    return records.reshape(-1)
+
+
+def resolve_field_name(names: Iterable[str], field: str) -> Optional[str]:
+    """Busca el nombre real de un campo considerando sus alias"""
+    names = set(names)
+    for candidate in FIELD_ALIASES.get(field, (field,)):
+        if candidate in names:
+            return candidate
+    return None
+
+
+def decode_pointcloud2(msg, fields: Optional[Iterable[str]] = DEFAULT_EXTRA_FIELDS,
+                       remove_invalid: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Decodifica un PointCloud2 en columnas contiguas de NumPy.
+
+    Siempre devuelve 'x', 'y', 'z' en float32; los campos de `fields` que existan
+    en el mensaje se añaden con su tipo nativo. Con fields=None se conservan todos.
+    Los puntos con coordenadas NaN o infinitas se descartan si remove_invalid=True.
+    """
+    records = pointcloud2_records(msg)
+    names = records.dtype.names or ()
+
+    if not all(axis in names for axis in ('x', 'y', 'z')):
+        raise ValueError("Campos x, y, z no encontrados en el mensaje")
+
+    columns = {axis: np.ascontiguousarray(records[axis], dtype=np.float32) for axis in ('x', 'y', 'z')}
+
+    if fields is None:
+        extra = {name: name for name in names if name not in columns}
+    else:
+        extra = {}
+        for field in fields:
+            source = resolve_field_name(names, field)
+            if source is not None:
+                extra[field] = source
+
+    for name, source in extra.items():
+        column = records[source]
+        columns[name] = column.astype(column.dtype.newbyteorder('='))
+
+    if remove_invalid:
+        valid = np.isfinite(columns['x']) & np.isfinite(columns['y']) & np.isfinite(columns['z'])
+        if not valid.all():
+            columns = {name: column[valid] for name, column in columns.items()}
+
+    return columns
+
+
+def stack_xyz(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Une las columnas x, y, z en un arreglo (N, 3) float32"""
+    return np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+
+
+def empty_columns() -> Dict[str, np.ndarray]:
+    """Columnas vacías para frames sin puntos válidos"""
+    return {axis: np.empty(0, dtype=np.float32) for axis in ('x', 'y', 'z')}
@@ -0,0 +1,249 @@
+import os
+import struct
+import time
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from dataManagement.parallelDecode import decode_shared_message, map_pointcloud_messages
+
+# Exportación de frames PointCloud2 a PCD (binary / binary_compressed) y LAS 1.4
+# escribiendo directamente las columnas decodificadas, sin pasar por una tupla
+# por punto ni por Open3D. Cada worker del pool decodifica su mensaje y escribe
+# el archivo, así que al proceso principal solo vuelve el nombre y el número de
+# puntos. Se conservan todos los campos del mensaje: en PCD cada columna es un
+# campo y en LAS los que no tienen sitio en el registro estándar van como
+# "extra bytes".
+
+PCD_BINARY = 'pcd'
+PCD_COMPRESSED = 'pcd_compressed'
+LAS_FORMAT = 'las'
+EXPORT_FORMATS = (PCD_BINARY, PCD_COMPRESSED, LAS_FORMAT)
+
+# Resolución de las coordenadas enteras de LAS (metros)
+LAS_SCALE = 0.001
+
+# Índice de frames exportados (uno por exportación)
+INDEX_FILE = 'frames.csv'
+
+# Tipo de NumPy -> TYPE de PCD
+_PCD_TYPES = {'f': 'F', 'i': 'I', 'u': 'U', 'b': 'U'}
+
+# Tipo de NumPy -> data_type de los extra bytes de LAS 1.4
+_LAS_EXTRA_TYPES = {'u1': 1, 'i1': 2, 'u2': 3, 'i2': 4, 'u4': 5, 'i4': 6, 'u8': 7, 'i8': 8, 'f4': 9, 'f8': 10,
+                    'b1': 1}
+
+# Registro del formato de punto 6 (LAS 1.4), 30 bytes
+_LAS_POINT6 = [('X', '<i4'), ('Y', '<i4'), ('Z', '<i4'), ('intensity', '<u2'), ('return_bits', 'u1'),
+               ('flag_bits', 'u1'), ('classification', 'u1'), ('user_data', 'u1'), ('scan_angle', '<i2'),
+               ('point_source_id', '<u2'), ('gps_time', '<f8')]
+_LAS_HEADER_SIZE = 375
+_LAS_EXTRA_BYTES_SIZE = 192
+
+
+class ExportResult(NamedTuple):
+    files: List[str]
+    points: int
+    elapsed: float
+
+
+def _flat_columns(columns: Dict[str, np.ndarray]):
+    """(nombre, columna 1D) de cada campo; los campos con count > 1 se separan"""
+    for name, column in columns.items():
+        column = np.asarray(column)
+        if column.ndim == 1:
+            yield name, column
+        else:
+            for k in range(column.shape[1]):
+                yield f'{name}_{k}', column[:, k]
+
+
+def _packed(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Columnas -> arreglo estructurado sin relleno (little-endian)"""
+    dtype = np.dtype([(name, column.dtype.newbyteorder('<').str, column.shape[1:])
+                      for name, column in columns.items()])
+    records = np.empty(len(columns['x']), dtype=dtype)
+    for name in dtype.names:
+        records[name] = columns[name]
+    return records
+
+
+def _lzf():
+    """Módulo `lzf` (compresión de DATA binary_compressed en PCD)"""
+    try:
+        import lzf
+    except ImportError:
+        raise ImportError("Se necesita el paquete 'lzf' para exportar a PCD binary_compressed "
+                          "(pip install python-lzf); sin él, usar el formato pcd o las")
+    return lzf
+
+
+def lzf_compress(data: bytes) -> bytes:
+    """Comprime con LZF (paquete `lzf`, ImportError si no está instalado)"""
+    if not data:
+        return b''
+    compressed = _lzf().compress(data)
+    if compressed is None:
+        # lzf devuelve None si la salida no cabe en su búfer (datos incompresibles)
+        compressed = _lzf().compress(data, len(data) + len(data) // 32 + 16)
+    return compressed
+
+
+def write_pcd(path: str, columns: Dict[str, np.ndarray], compressed: bool = False) -> int:
+    """
+    Escribe las columnas en un PCD v0.7 (DATA binary o binary_compressed).
+    Devuelve el número de puntos.
+    """
+    count = len(columns['x'])
+    fields = [(name, np.asarray(column)) for name, column in columns.items()]
+    names = ' '.join(name for name, _ in fields)
+    sizes = ' '.join(str(column.dtype.itemsize) for _, column in fields)
+    types = ' '.join(_PCD_TYPES[column.dtype.kind] for _, column in fields)
+    counts = ' '.join(str(column.shape[1] if column.ndim > 1 else 1) for _, column in fields)
+    header = (f"# .PCD v0.7 - Point Cloud Data file format\nVERSION 0.7\nFIELDS {names}\nSIZE {sizes}\n"
+              f"TYPE {types}\nCOUNT {counts}\nWIDTH {count}\nHEIGHT 1\nVIEWPOINT 0 0 0 1 0 0 0\n"
+              f"POINTS {count}\nDATA {'binary_compressed' if compressed else 'binary'}\n")
+
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        if compressed:
+            # Un campo detrás de otro (todas las x, luego todas las y, ...)
+            data = b''.join(np.ascontiguousarray(column, dtype=column.dtype.newbyteorder('<')).tobytes()
+                            for _, column in fields)
+            payload = lzf_compress(data)
+            f.write(struct.pack('<II', len(payload), len(data)))
+            f.write(payload)
+        else:
+            f.write(_packed(columns).tobytes())
+    return count
+
+
+def _extra_bytes_record(name: str, column: np.ndarray) -> bytes:
+    code = 'b1' if column.dtype.kind == 'b' else column.dtype.str[1:]
+    record = bytearray(_LAS_EXTRA_BYTES_SIZE)
+    record[2] = _LAS_EXTRA_TYPES[code]
+    record[4:36] = name.encode('ascii', 'replace')[:32].ljust(32, b'\0')
+    return bytes(record)
+
+
+def write_las(path: str, columns: Dict[str, np.ndarray], timestamp: float = 0.0) -> int:
+    """
+    Escribe las columnas en un LAS 1.4 con formato de punto 6. x, y, z se
+    guardan como enteros con resolución LAS_SCALE; intensity y classification
+    van a sus campos del registro y gps_time es el tiempo del frame. El resto
+    de columnas se añaden como extra bytes con su tipo nativo.
+    """
+    count = len(columns['x'])
+    xyz = np.column_stack([np.asarray(columns[axis], dtype=np.float64) for axis in ('x', 'y', 'z')])
+    extras = [(name, column) for name, column in _flat_columns(columns)
+              if name not in ('x', 'y', 'z', 'intensity', 'classification')]
+    if 'intensity' in columns and columns['intensity'].dtype.kind == 'f':
+        # La intensidad en coma flotante no cabe en el uint16 de LAS sin perder decimales
+        extras.append(('intensity_float', columns['intensity']))
+
+    dtype = np.dtype(_LAS_POINT6 + [(name, column.dtype.newbyteorder('<').str) for name, column in extras])
+    records = np.zeros(count, dtype=dtype)
+
+    finite = np.isfinite(xyz).all(axis=1)
+    mins = xyz[finite].min(axis=0) if finite.any() else np.zeros(3)
+    maxs = xyz[finite].max(axis=0) if finite.any() else np.zeros(3)
+    offsets = np.floor(mins)
+    raw = np.round((np.where(finite[:, None], xyz, mins) - offsets) / LAS_SCALE)
+    records['X'], records['Y'], records['Z'] = raw.astype(np.int32).T
+    if 'intensity' in columns:
+        records['intensity'] = np.clip(np.round(np.asarray(columns['intensity'], dtype=np.float64)), 0, 65535)
+    if 'classification' in columns:
+        records['classification'] = np.clip(columns['classification'], 0, 255)
+    records['return_bits'] = 0x11  # Retorno 1 de 1
+    records['gps_time'] = timestamp
+    for name, column in extras:
+        records[name] = column
+
+    vlrs = b''
+    if extras:
+        body = b''.join(_extra_bytes_record(name, column) for name, column in extras)
+        vlrs = (struct.pack('<H16sHH32s', 0, b'LASF_Spec', 4, len(body), b'Extra bytes') + body)
+
+    today = date.today()
+    point_offset = _LAS_HEADER_SIZE + len(vlrs)
+    header = struct.pack(
+        '<4sHH16sBB32s32sHHHIIBHI5I3d3d6dQQIQ15Q',
+        b'LASF', 0, 0x10, b'\0' * 16, 1, 4, b'NovaLidar', b'NovaLidar pointCloudExport',
+        today.timetuple().tm_yday, today.year, _LAS_HEADER_SIZE, point_offset, 1 if extras else 0,
+        6, dtype.itemsize, 0, 0, 0, 0, 0, 0,
+        LAS_SCALE, LAS_SCALE, LAS_SCALE, *offsets,
+        maxs[0], mins[0], maxs[1], mins[1], maxs[2], mins[2],
+        0, 0, 0, count, count, *([0] * 14))
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(vlrs)
+        f.write(records.tobytes())
+    return count
+
+
+def write_frame(path: str, columns: Dict[str, np.ndarray], export_format: str = PCD_BINARY,
+                timestamp: float = 0.0) -> int:
+    """Escribe un frame en el formato pedido (ver EXPORT_FORMATS)"""
+    if export_format == LAS_FORMAT:
+        return write_las(path, columns, timestamp)
+    if export_format in (PCD_BINARY, PCD_COMPRESSED):
+        return write_pcd(path, columns, compressed=export_format == PCD_COMPRESSED)
+    raise ValueError(f"Formato de exportación desconocido: {export_format}")
+
+
+def frame_file_name(index: int, export_format: str) -> str:
+    return f"frame_{index:06d}.{'las' if export_format == LAS_FORMAT else 'pcd'}"
+
+
+def _export_in_worker(shm_name: str, length: int, encoding: str, index: int, timestamp: float,
+                      fields, output_dir: str, export_format: str):
+    """Decodifica un mensaje y escribe su archivo (se ejecuta en el worker)"""
+    columns = decode_shared_message(shm_name, length, encoding, fields)
+    if len(columns['x']) == 0:
+        return None, 0
+    path = os.path.join(output_dir, frame_file_name(index, export_format))
+    return path, write_frame(path, columns, export_format, timestamp)
+
+
+def export_pointcloud_frames(bag_path, topic: str, output_dir: str, export_format: str = PCD_BINARY,
+                             stride: int = 1, start_time: Optional[float] = None,
+                             end_time: Optional[float] = None, max_frames: Optional[int] = None,
+                             fields=None, workers: Optional[int] = None,
+                             progress: bool = False) -> ExportResult:
+    """
+    Exporta los frames del topic (todos, o los de [start_time, end_time] en
+    segundos) a un archivo por frame en output_dir. Con fields=None se
+    conservan todos los campos del mensaje. Junto a los archivos se escribe
+    INDEX_FILE con el índice, tiempo, archivo y puntos de cada frame. El índice
+    (y el nombre del archivo) es la posición del mensaje en el topic completo,
+    la misma que usan el slider de frames y load_pointcloud_frame.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación desconocido: {export_format}")
+    if export_format == PCD_COMPRESSED:
+        _lzf()  # Fallar antes de arrancar el pool si falta el paquete
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.time()
+
+    rows, total = [], 0
+    results = map_pointcloud_messages(bag_path, topic, _export_in_worker,
+                                      (fields, os.path.abspath(output_dir), export_format),
+                                      stride=stride, start_time=start_time, end_time=end_time,
+                                      max_frames=max_frames, workers=workers)
+    for index, timestamp, (path, points) in results:
+        if path is None:
+            continue
+        rows.append((index, timestamp, os.path.basename(path), points))
+        total += points
+        if progress:
+            print(f"\r{len(rows)} frames exportados ({total} puntos)", end='', flush=True)
+
+    table = pd.DataFrame(rows, columns=['index', 'timestamp', 'file', 'points'])
+    table.to_csv(os.path.join(output_dir, INDEX_FILE), index=False, float_format='%.9f')
+    elapsed = time.time() - started
+    if progress:
+        print(f"\r✅ {len(rows)} frames exportados en {output_dir} ({elapsed:.1f} s)")
+    return ExportResult([os.path.join(output_dir, row[2]) for row in rows], total, elapsed)
@@ -0,0 +1,147 @@
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+# Filtros de submuestreo para nubes de puntos en columnas (ver pointCloudDecoder).
+# Todo es vectorizado con NumPy: las celdas de la rejilla se identifican con una
+# clave entera por punto, se agrupan ordenando las claves y se reducen con reduceat.
+
+# Puntos que se envían al navegador por defecto
+DEFAULT_POINT_BUDGET = 300000
+
+# Resolución máxima de la rejilla por eje (la clave de voxel debe caber en int64)
+MAX_GRID_CELLS = 1 << 20
+
+VOXEL_CENTROID = 'voxel-centroid'
+VOXEL_FIRST = 'voxel-first'
+RANDOM = 'random'
+NO_DOWNSAMPLING = 'none'
+DOWNSAMPLE_METHODS = (VOXEL_CENTROID, VOXEL_FIRST, RANDOM, NO_DOWNSAMPLING)
+
+
+def _xyz(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+
+
+def _axis_min(values: np.ndarray) -> np.ndarray:
+    # Reducir columna a columna es varias veces más rápido que min(axis=0) sobre (N, 3)
+    return np.array([values[:, axis].min() for axis in range(values.shape[1])])
+
+
+def _axis_max(values: np.ndarray) -> np.ndarray:
+    return np.array([values[:, axis].max() for axis in range(values.shape[1])])
+
+
+def voxel_keys(xyz: np.ndarray, leaf_size: float, origin: Optional[np.ndarray] = None) -> np.ndarray:
+    """Clave int64 del voxel de cada punto para una rejilla de lado leaf_size"""
+    origin = _axis_min(xyz) if origin is None else origin
+    cells = ((xyz - origin.astype(xyz.dtype)) * xyz.dtype.type(1.0 / leaf_size)).astype(np.int64)
+    dims = _axis_max(cells) + 1 if len(cells) else np.ones(3, dtype=np.int64)
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+
+def group_keys(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Agrupa claves iguales: devuelve (orden que las deja contiguas, inicio de cada
+    grupo dentro de ese orden). Ordenar es bastante más rápido que np.unique.
+    """
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    return order, starts
+
+
+def _min_leaf_size(xyz: np.ndarray) -> float:
+    """Lado mínimo para que la rejilla no desborde la clave int64"""
+    extent = float((_axis_max(xyz) - _axis_min(xyz)).max()) if len(xyz) else 0.0
+    return max(extent / MAX_GRID_CELLS, 1e-6)
+
+
+def count_voxels(xyz: np.ndarray, leaf_size: float) -> int:
+    """Número de voxels ocupados con un lado dado"""
+    if len(xyz) == 0:
+        return 0
+    return int(np.count_nonzero(np.diff(np.sort(voxel_keys(xyz, leaf_size))))) + 1
+
+
+def leaf_size_for_budget(xyz: np.ndarray, max_points: int, iterations: int = 3) -> float:
+    """
+    Estima el lado de voxel que deja como mucho ~max_points voxels ocupados.
+
+    En nubes LiDAR los puntos están sobre superficies, así que el número de voxels
+    ocupados escala aproximadamente con 1/lado²; se parte del volumen de la caja
+    envolvente y se corrige con esa ley en unas pocas iteraciones.
+    """
+    extent = np.maximum(_axis_max(xyz) - _axis_min(xyz), 1e-6)
+    leaf = max(float(np.cbrt(np.prod(extent) / max_points)), _min_leaf_size(xyz))
+    for _ in range(iterations):
+        occupied = count_voxels(xyz, leaf)
+        if 0.8 * max_points <= occupied <= max_points:
+            break
+        leaf = max(leaf * np.sqrt(occupied / max_points), _min_leaf_size(xyz))
+    return leaf
+
+
+def voxel_downsample(columns: Dict[str, np.ndarray], leaf_size: float,
+                     mode: str = VOXEL_CENTROID) -> Dict[str, np.ndarray]:
+    """
+    Deja un punto por voxel. Con mode='voxel-centroid' x, y, z y los campos
+    flotantes se promedian dentro del voxel (los enteros, p. ej. ring, toman el
+    primer punto); con 'voxel-first' se conserva el primer punto de cada voxel.
+    """
+    xyz = _xyz(columns)
+    if len(xyz) == 0:
+        return columns
+    leaf_size = max(float(leaf_size), _min_leaf_size(xyz))
+    order, starts = group_keys(voxel_keys(xyz, leaf_size))
+    # Índice original más bajo de cada voxel (el primer punto recibido)
+    first = np.minimum.reduceat(order, starts)
+
+    if mode == VOXEL_FIRST:
+        return {name: np.asarray(column)[first] for name, column in columns.items()}
+    if mode != VOXEL_CENTROID:
+        raise ValueError(f"Modo de voxel no soportado: {mode}")
+
+    counts = np.diff(np.append(starts, len(order)))
+    reduced = {}
+    for name, column in columns.items():
+        column = np.asarray(column)
+        if column.ndim == 1 and np.issubdtype(column.dtype, np.floating):
+            sums = np.add.reduceat(column[order].astype(np.float64), starts)
+            reduced[name] = (sums / counts).astype(column.dtype)
+        else:
+            reduced[name] = column[first]
+    return reduced
+
+
+def random_downsample(columns: Dict[str, np.ndarray], max_points: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """Submuestreo aleatorio uniforme (sin reemplazo) hasta max_points"""
+    n = len(columns['x'])
+    if n <= max_points:
+        return columns
+    keep = np.sort(np.random.default_rng(seed).choice(n, max_points, replace=False))
+    return {name: np.asarray(column)[keep] for name, column in columns.items()}
+
+
+def downsample_pointcloud(columns: Dict[str, np.ndarray], method: str = VOXEL_CENTROID,
+                          leaf_size: Optional[float] = None,
+                          max_points: int = DEFAULT_POINT_BUDGET) -> Tuple[Dict[str, np.ndarray], float]:
+    """
+    Reduce la nube para visualizarla. Con los métodos de voxel, si no se da
+    leaf_size (o es 0) se elige para aproximarse a max_points; si aun así sobran
+    puntos se descartan voxels al azar, lo que mantiene la densidad uniforme.
+    Devuelve (columnas, lado de voxel usado o 0).
+    """
+    n = len(columns['x'])
+    if method == NO_DOWNSAMPLING or n == 0:
+        return columns, 0.0
+    if method == RANDOM:
+        return random_downsample(columns, max_points), 0.0
+    if method not in (VOXEL_CENTROID, VOXEL_FIRST):
+        raise ValueError(f"Método de submuestreo no soportado: {method}")
+
+    if not leaf_size:
+        if n <= max_points:
+            return columns, 0.0
+        leaf_size = leaf_size_for_budget(_xyz(columns), max_points)
+    reduced = voxel_downsample(columns, leaf_size, method)
+    return random_downsample(reduced, max_points), float(leaf_size)
@@ -0,0 +1,163 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+# Pirámide de niveles de detalle (LOD) sobre un octree implícito. Los puntos se
+# ordenan por su código Morton (z-order), de modo que cada nodo del octree es un
+# rango contiguo del arreglo ordenado; el nivel de profundidad d guarda un punto
+# representativo por nodo ocupado, así que cada nivel está acotado en puntos y
+# se puede enviar primero uno grueso y refinar después solo una región.
+
+MORTON_BITS = 21          # Bits por eje (3 x 21 = 63 bits en un uint64)
+MAX_DEPTH = MORTON_BITS
+
+# Puntos del primer render (rápido de serializar y de dibujar en el navegador)
+COARSE_POINTS = 20000
+
+# Pirámides que se mantienen en memoria (una por frame o mapa acumulado)
+LOD_CACHE_ENTRIES = 4
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """Intercala dos ceros entre cada uno de los 21 bits bajos (paso previo al código Morton)"""
+    v = values.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_codes(cells: np.ndarray) -> np.ndarray:
+    """Códigos Morton uint64 de celdas enteras (N, 3) de hasta 21 bits por eje"""
+    return (_spread_bits(cells[:, 0])
+            | _spread_bits(cells[:, 1]) << np.uint64(1)
+            | _spread_bits(cells[:, 2]) << np.uint64(2))
+
+
+def split_depths(codes: np.ndarray) -> np.ndarray:
+    """
+    Para códigos ordenados, profundidad del octree a la que cada par consecutivo
+    cae en nodos distintos (MAX_DEPTH + 1 si son iguales hasta el final)
+    """
+    diff = codes[1:] ^ codes[:-1]
+    groups = np.zeros(len(diff), dtype=np.int8)
+    for level in range(MAX_DEPTH):
+        groups += (diff >> np.uint64(3 * level)) != 0
+    return (MAX_DEPTH + 1 - groups).astype(np.int8)
+
+
+def _first_in_nodes(splits: np.ndarray, depth: int) -> np.ndarray:
+    """Índice del primer punto de cada nodo ocupado a la profundidad dada"""
+    return np.concatenate(([0], np.flatnonzero(splits <= depth) + 1))
+
+
+def _depth_for_budget(splits: np.ndarray, max_points: int) -> int:
+    """Profundidad más fina cuyo número de nodos ocupados no pasa de max_points"""
+    counts = 1 + np.cumsum(np.bincount(splits, minlength=MAX_DEPTH + 2))
+    within = np.flatnonzero(counts[:MAX_DEPTH + 1] <= max_points)
+    return int(within[-1]) if len(within) else 0
+
+
+class PointCloudLOD:
+    """Nube ordenada en z-order con acceso por nivel de detalle y por región"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        xyz = np.column_stack((columns['x'], columns['y'], columns['z'])).astype(np.float32, copy=False)
+        n = len(xyz)
+        self.origin = np.array([xyz[:, axis].min() for axis in range(3)]) if n else np.zeros(3)
+        extent = np.array([xyz[:, axis].max() for axis in range(3)]) - self.origin if n else np.zeros(3)
+        self.size = max(float(extent.max()), 1e-6)  # Lado del cubo raíz
+
+        scale = ((1 << MORTON_BITS) - 1) / self.size
+        cells = ((xyz - self.origin.astype(np.float32)) * np.float32(scale)).astype(np.int64)
+        np.clip(cells, 0, (1 << MORTON_BITS) - 1, out=cells)
+        codes = morton_codes(cells)
+        order = np.argsort(codes)
+
+        self.codes = codes[order]
+        self.columns = {name: np.asarray(column)[order] for name, column in columns.items()}
+        self.splits = split_depths(self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def node_count(self, depth: int) -> int:
+        """Nodos ocupados (puntos del nivel) a una profundidad"""
+        return 1 + int(np.count_nonzero(self.splits <= depth)) if len(self) else 0
+
+    def level(self, depth: int) -> Dict[str, np.ndarray]:
+        """Un punto representativo por nodo ocupado a la profundidad dada"""
+        if not len(self):
+            return self.columns
+        keep = _first_in_nodes(self.splits, depth)
+        return {name: column[keep] for name, column in self.columns.items()}
+
+    def level_for_budget(self, max_points: int) -> Dict[str, np.ndarray]:
+        """Nivel más detallado que no pasa de max_points puntos"""
+        if len(self) <= max_points:
+            return self.columns
+        return self.level(_depth_for_budget(self.splits, max_points))
+
+    def region(self, center, radius: float, max_points: int) -> Dict[str, np.ndarray]:
+        """
+        Puntos dentro del cubo centrado en `center` con semilado `radius`, al nivel
+        más detallado que no pasa de max_points dentro de esa región
+        """
+        center = np.asarray(center, dtype=np.float32)
+        inside = np.ones(len(self), dtype=bool)
+        for axis, name in enumerate(('x', 'y', 'z')):
+            inside &= np.abs(self.columns[name] - center[axis]) <= radius
+        selected = np.flatnonzero(inside)
+        if len(selected) <= max_points:
+            return {name: column[selected] for name, column in self.columns.items()}
+
+        # La selección conserva el z-order, así que la pirámide se aplica igual
+        splits = split_depths(self.codes[selected])
+        keep = selected[_first_in_nodes(splits, _depth_for_budget(splits, max_points))]
+        return {name: column[keep] for name, column in self.columns.items()}
+
+
+class _LODCache:
+    """Caché LRU pequeña de pirámides ya construidas"""
+
+    def __init__(self, max_entries: int = LOD_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, columns: Optional[Dict[str, np.ndarray]] = None) -> Optional[PointCloudLOD]:
+        with self._lock:
+            lod = self._entries.get(key)
+            if lod is not None:
+                self._entries.move_to_end(key)
+                return lod
+        if columns is None:
+            return None
+
+        lod = PointCloudLOD(columns)
+        with self._lock:
+            self._entries[key] = lod
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return lod
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _LODCache()
+
+
+def get_lod(key: Hashable, columns: Optional[Dict[str, np.ndarray]] = None) -> Optional[PointCloudLOD]:
+    """Pirámide asociada a `key`; se construye a partir de `columns` si no está en caché"""
+    return _cache.get(key, columns)
+
+
+def clear_lod_cache():
+    _cache.clear()
@@ -0,0 +1,199 @@
+import warnings
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+# Proyección esférica de un frame LiDAR en una imagen de rango densa H x W: cada
+# fila es un anillo del sensor (ring) y cada columna un intervalo de azimut. La
+# fila y la columna de cada punto salen de aritmética de índices vectorizada, así
+# que la proyección es lineal en el número de puntos. Sobre la imagen, los
+# vecinos de un punto son los píxeles contiguos: suavizado, detección de suelo o
+# una vista previa 2D son operaciones con arreglos, sin árboles ni búsquedas.
+
+# Filas de la imagen cuando la nube no trae el campo ring (se agrupa por elevación)
+RANGE_IMAGE_ROWS = 64
+
+# Límites del ancho automático (columnas de azimut)
+MIN_WIDTH = 256
+MAX_WIDTH = 4096
+
+
+class RangeImage(NamedTuple):
+    """Imagen de rango de un frame. Los píxeles sin punto tienen rango 0 e índice -1"""
+    range: np.ndarray       # (H, W) float32, distancia al sensor
+    intensity: np.ndarray   # (H, W) float32
+    xyz: np.ndarray         # (H, W, 3) float32, NaN en píxeles vacíos
+    index: np.ndarray       # (H, W) punto de la nube proyectado en cada píxel
+    pixels: np.ndarray      # (N,) píxel (fila * W + columna) de cada punto, -1 si no es válido
+
+    @property
+    def valid(self) -> np.ndarray:
+        return self.index >= 0
+
+    @property
+    def shape(self):
+        return self.range.shape
+
+
+def ring_rows(ring: np.ndarray, elevation: np.ndarray):
+    """
+    Fila de cada punto a partir de su anillo. Cada driver numera los anillos a
+    su manera, así que se ordenan por su elevación media (la fila 0 es la más alta).
+    """
+    ring = ring.astype(np.int64)
+    count = int(ring.max()) + 1
+    points = np.bincount(ring, minlength=count)
+    mean_elevation = np.bincount(ring, elevation, count) / np.maximum(points, 1)
+    present = np.flatnonzero(points)
+    order = present[np.argsort(-mean_elevation[present], kind='stable')]
+    row_of_ring = np.full(count, -1, dtype=np.int64)
+    row_of_ring[order] = np.arange(len(order))
+    return row_of_ring[ring], len(order)
+
+
+def project_range_image(columns: Dict[str, np.ndarray], width: Optional[int] = None,
+                        rows: int = RANGE_IMAGE_ROWS) -> RangeImage:
+    """
+    Proyecta la nube en una imagen de rango. Con `ring` las filas son los anillos;
+    si no, la elevación se reparte en `rows` intervalos. width=None ajusta el
+    ancho a los puntos por fila. Si varios puntos caen en el mismo píxel se
+    queda el más cercano.
+    """
+    x = np.asarray(columns['x'], dtype=np.float32)
+    y = np.asarray(columns['y'], dtype=np.float32)
+    z = np.asarray(columns['z'], dtype=np.float32)
+    distance = np.sqrt(x * x + y * y + z * z)
+    valid = np.isfinite(distance) & (distance > 0)
+    pixels = np.full(len(x), -1, dtype=np.int64)
+    candidates = np.flatnonzero(valid)
+
+    elevation = np.arcsin(z[candidates] / distance[candidates])
+    if 'ring' in columns and len(candidates):
+        row, height = ring_rows(np.asarray(columns['ring'])[candidates], elevation)
+    elif len(candidates):
+        low, high = float(elevation.min()), float(elevation.max())
+        height = max(int(rows), 1)
+        row = ((high - elevation) / max(high - low, 1e-6) * height).astype(np.int64)
+        row = np.minimum(row, height - 1)
+    else:
+        row, height = np.zeros(0, dtype=np.int64), 1
+
+    if width is None:
+        # Algo menos de los puntos por fila: mejor juntar puntos que dejar huecos
+        width = int(np.clip(64 * (len(candidates) // max(height, 1) // 64), MIN_WIDTH, MAX_WIDTH))
+    # Columna 0 detrás del sensor, el frente (+x) en el centro y +y a la izquierda
+    azimuth = np.arctan2(y[candidates], x[candidates])
+    column = ((np.pi - azimuth) / (2 * np.pi) * width).astype(np.int64) % width
+    pixel = row * width + column
+    pixels[candidates] = pixel
+
+    # El punto más cercano de cada píxel: ordenar por (píxel, distancia)
+    order = np.lexsort((distance[candidates], pixel))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pixel[order[1:]] != pixel[order[:-1]]
+    winners = candidates[order[first]]
+    target = pixel[order[first]]
+
+    index = np.full(height * width, -1, dtype=np.int64)
+    index[target] = winners
+    image_range = np.zeros(height * width, dtype=np.float32)
+    image_range[target] = distance[winners]
+    intensity = np.zeros(height * width, dtype=np.float32)
+    if 'intensity' in columns:
+        intensity[target] = np.asarray(columns['intensity'])[winners]
+    xyz = np.full((height * width, 3), np.nan, dtype=np.float32)
+    xyz[target] = np.column_stack((x[winners], y[winners], z[winners]))
+
+    shape = (height, width)
+    return RangeImage(image_range.reshape(shape), intensity.reshape(shape), xyz.reshape(shape + (3,)),
+                      index.reshape(shape), pixels)
+
+
+def range_image_columns(image: RangeImage) -> Dict[str, np.ndarray]:
+    """Nube de los píxeles ocupados (un punto por píxel), en el formato de columnas habitual"""
+    valid = image.valid
+    xyz = image.xyz[valid]
+    return {'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2], 'intensity': image.intensity[valid]}
+
+
+def neighbor(channel: np.ndarray, drow: int, dcol: int, fill=0) -> np.ndarray:
+    """
+    Valor del vecino (fila + drow, columna + dcol) de cada píxel. Las columnas
+    dan la vuelta (360°); fuera de las filas se usa `fill`.
+    """
+    shifted = np.roll(channel, -dcol, axis=1)
+    if drow == 0:
+        return shifted
+    result = np.full_like(shifted, fill)
+    if drow > 0:
+        result[:-drow] = shifted[drow:]
+    else:
+        result[-drow:] = shifted[:drow]
+    return result
+
+
+def smooth_range(image: RangeImage, size: int = 3) -> np.ndarray:
+    """Mediana del rango en una ventana size x size, solo con los vecinos ocupados"""
+    half = size // 2
+    values = np.where(image.valid, image.range, np.nan)
+    stack = np.stack([neighbor(values, dr, dc, np.nan)
+                      for dr in range(-half, half + 1) for dc in range(-half, half + 1)])
+    with warnings.catch_warnings():
+        # Píxeles sin ningún vecino ocupado: la mediana es NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        smoothed = np.nanmedian(stack, axis=0)
+    return np.where(image.valid, smoothed, 0).astype(np.float32)
+
+
+def range_image_ground(image: RangeImage, threshold: float, max_slope: float) -> np.ndarray:
+    """
+    Suelo sobre la imagen (H, W), recorriendo las filas de abajo arriba: un
+    píxel es suelo si la pendiente hasta el píxel ocupado de debajo es menor que
+    max_slope y ese píxel era suelo, o si su altura está a menos de `threshold`
+    del último suelo de su columna (el suelo que reaparece detrás de un objeto),
+    y el píxel de encima no sube casi en vertical desde él.
+    La primera referencia de altura es la mediana de la fila más baja.
+    """
+    height, width = image.shape
+    valid = image.valid
+    xyz = image.xyz
+    ground = np.zeros((height, width), dtype=bool)
+    lowest = xyz[height - 1, :, 2][valid[height - 1]]
+    if len(lowest) == 0:
+        return ground
+
+    last_ground_z = np.full(width, float(np.median(lowest)), dtype=np.float32)
+    below_rho = np.full(width, np.nan, dtype=np.float32)
+    below_z = np.full(width, np.nan, dtype=np.float32)
+    below_ground = np.zeros(width, dtype=bool)
+    tan_slope = np.tan(max_slope)
+    all_rho = np.hypot(xyz[:, :, 0], xyz[:, :, 1])
+    with np.errstate(invalid='ignore'):
+        # La base de una pared puede quedar a poca pendiente del suelo de debajo,
+        # pero sobre ella hay un píxel casi vertical
+        steep_above = (np.abs(neighbor(xyz[:, :, 2], -1, 0, np.nan) - xyz[:, :, 2]) >
+                       tan_slope * np.abs(neighbor(all_rho, -1, 0, np.nan) - all_rho))
+    for row in range(height - 1, -1, -1):
+        occupied = valid[row]
+        z = xyz[row, :, 2]
+        rho = all_rho[row]
+        with np.errstate(invalid='ignore'):
+            flat = np.abs(z - below_z) <= tan_slope * np.abs(rho - below_rho)
+            near = np.abs(z - last_ground_z) <= threshold
+        first = np.isnan(below_z)
+        is_ground = occupied & ~steep_above[row] & ((first & near) | (~first & flat & (below_ground | near)))
+        ground[row] = is_ground
+        last_ground_z = np.where(is_ground, z, last_ground_z)
+        below_rho = np.where(occupied, rho, below_rho)
+        below_z = np.where(occupied, z, below_z)
+        below_ground = np.where(occupied, is_ground, below_ground)
+    return ground
+
+
+def pixel_values(image: RangeImage, values: np.ndarray, fill=0) -> np.ndarray:
+    """Lleva un valor por píxel (H, W) a cada punto de la nube original"""
+    flat = values.reshape(-1)
+    result = np.full(len(image.pixels), fill, dtype=flat.dtype)
+    projected = image.pixels >= 0
+    result[projected] = flat[image.pixels[projected]]
+    return result
@@ -0,0 +1,431 @@
+import glob
+import os
+import sqlite3
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+from dataManagement.bagReader import (BagReaderBase, ChunkInfo, Connection, MessageSpans,
+                                      bag_file_path, filter_spans)
+from dataManagement.rosMessages import ENCODING_CDR, gather_bytes
+
+# Lector de bags de ROS 2 (directorio con metadata.yaml y archivos .db3 o .mcap)
+# con la misma API que bagReader.BagReader. Los "chunks" del índice son ventanas
+# de tiempo sobre la tabla messages de sqlite (consultadas con su índice de
+# timestamp) o los chunks reales del MCAP (localizados con su índice de chunks).
+
+METADATA_FILE = 'metadata.yaml'
+ROS2_EXTENSIONS = ('.db3', '.mcap', '.yaml')
+
+STORAGE_SQLITE = 'sqlite3'
+STORAGE_MCAP = 'mcap'
+
+# Tamaño máximo de las ventanas de sqlite (acota la memoria al leer un bloque)
+SQLITE_WINDOW_BYTES = 8 * 1024 * 1024
+SQLITE_WINDOW_MESSAGES = 20000
+
+# Filas que se piden a sqlite en cada lote al construir el índice
+SQLITE_FETCH_ROWS = 65536
+
+MCAP_OP_MESSAGE = 0x05
+MCAP_OP_MESSAGE_INDEX = 0x07
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_MCAP_RECORD = struct.Struct('<BQ')
+_MCAP_CHUNK_HEAD = struct.Struct('<QQQI')
+_MCAP_MESSAGE_HEAD = struct.Struct('<HIQQ')
+_MCAP_INDEX_ENTRY = np.dtype([('log_time', '<u8'), ('offset', '<u8')])
+
+
+class Ros2BagIndex(NamedTuple):
+    connections: Dict[int, Connection]
+    chunks: List[ChunkInfo]            # position = posición en `locations`
+    storage: str                       # 'sqlite3' o 'mcap'
+    message_encoding: str
+    locations: List[Tuple[int, int, int, int]]  # (archivo, inicio, longitud, longitud del índice) por chunk
+    local_ids: List[Dict[int, int]]    # Por archivo: id global de conexión -> id local
+
+
+def is_ros2_bag(path) -> bool:
+    """True si la ruta es un bag de ROS 2 (directorio, metadata.yaml, .db3 o .mcap)"""
+    path = bag_file_path(path)
+    return os.path.isdir(path) or os.path.splitext(path)[1].lower() in ROS2_EXTENSIONS
+
+
+def _read_metadata(metadata_path: str) -> dict:
+    try:
+        import yaml
+    except ImportError:
+        return {}
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        metadata = yaml.safe_load(f) or {}
+    return metadata.get('rosbag2_bagfile_information', {})
+
+
+def ros2_storage_files(path) -> Tuple[str, List[str]]:
+    """Devuelve (tipo de almacenamiento, archivos en orden) de un bag de ROS 2"""
+    path = bag_file_path(path)
+    storage = ''
+    if os.path.isdir(path) or os.path.basename(path) == METADATA_FILE:
+        bag_dir = path if os.path.isdir(path) else os.path.dirname(path)
+        info = {}
+        if os.path.exists(os.path.join(bag_dir, METADATA_FILE)):
+            info = _read_metadata(os.path.join(bag_dir, METADATA_FILE))
+        storage = info.get('storage_identifier', '')
+        files = []
+        for name in info.get('relative_file_paths', []):
+            # Algunas versiones de rosbag2 guardan la ruta relativa al directorio padre
+            candidates = (os.path.join(bag_dir, name), os.path.join(bag_dir, os.path.basename(name)))
+            files.append(next((c for c in candidates if os.path.exists(c)), candidates[0]))
+        if not files:
+            files = sorted(glob.glob(os.path.join(bag_dir, '*.db3')) + glob.glob(os.path.join(bag_dir, '*.mcap')))
+    else:
+        files = [path]
+
+    if not files:
+        raise ValueError(f"No se encontraron archivos .db3 ni .mcap en {path}")
+    extension = os.path.splitext(files[0])[1].lower()
+    if extension == '.db3':
+        storage = STORAGE_SQLITE
+    elif extension == '.mcap':
+        storage = STORAGE_MCAP
+    if storage not in (STORAGE_SQLITE, STORAGE_MCAP):
+        raise ValueError(f"Almacenamiento de ROS 2 no soportado: {storage or extension}")
+    return storage, files
+
+
+def _fetch_int_columns(cursor: sqlite3.Cursor, columns: int) -> np.ndarray:
+    """
+    Resultado de una consulta de enteros como arreglo (N, columns), pasando a
+    NumPy en lotes: nunca se tienen en memoria más de SQLITE_FETCH_ROWS tuplas
+    """
+    batches = []
+    while True:
+        rows = cursor.fetchmany(SQLITE_FETCH_ROWS)
+        if not rows:
+            break
+        batches.append(np.array(rows, dtype=np.int64).reshape(-1, columns))
+    return np.concatenate(batches) if batches else np.empty((0, columns), dtype=np.int64)
+
+
+def _ros1_type_name(msg_type: str) -> str:
+    """'sensor_msgs/msg/Imu' -> 'sensor_msgs/Imu' (mismo nombre que en ROS1)"""
+    return msg_type.replace('/msg/', '/')
+
+
+def _decompress_mcap(compression: str, data: bytes, size: int) -> bytes:
+    if compression == '':
+        return data
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Se necesita el paquete 'zstandard' para leer chunks MCAP comprimidos con zstd")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    if compression == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("Se necesita el paquete 'lz4' para leer chunks MCAP comprimidos con lz4")
+        return lz4.frame.decompress(data)
+    raise ValueError(f"Compresión de chunk MCAP no soportada: {compression}")
+
+
+def _parse_message_indexes(data: bytes) -> Dict[int, np.ndarray]:
+    """Decodifica los registros MessageIndex que siguen a un chunk MCAP"""
+    entries = {}
+    pos = 0
+    while pos + _MCAP_RECORD.size <= len(data):
+        op, length = _MCAP_RECORD.unpack_from(data, pos)
+        pos += _MCAP_RECORD.size
+        if op == MCAP_OP_MESSAGE_INDEX:
+            (channel,) = _U16.unpack_from(data, pos)
+            (size,) = _U32.unpack_from(data, pos + 2)
+            entries[channel] = np.frombuffer(data, dtype=_MCAP_INDEX_ENTRY, count=size // 16, offset=pos + 6)
+        pos += length
+    return entries
+
+
+class Ros2BagReader(BagReaderBase):
+    """
+    Lector de bags de ROS 2 (sqlite3 o MCAP) con la misma API que BagReader.
+
+    Se puede pasar un Ros2BagIndex ya calculado para evitar volver a leer el índice.
+    """
+
+    def __init__(self, path, index: Optional[Ros2BagIndex] = None):
+        self.path = bag_file_path(path)
+        self.storage, self.files = ros2_storage_files(self.path)
+        self._handles = {}
+        if index is None:
+            index = self._read_sqlite_index() if self.storage == STORAGE_SQLITE else self._read_mcap_index()
+        self.index = index
+        self.message_encoding = index.message_encoding
+
+    def _handle(self, file_index: int):
+        """Conexión sqlite o archivo MCAP abierto (se abren bajo demanda)"""
+        handle = self._handles.get(file_index)
+        if handle is None:
+            path = self.files[file_index]
+            if self.storage == STORAGE_SQLITE:
+                handle = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                                         check_same_thread=False)
+            else:
+                handle = open(path, 'rb')
+            self._handles[file_index] = handle
+        return handle
+
+    # ------------------------------------------------------------------
+    # sqlite3
+
+    def _read_sqlite_index(self) -> Ros2BagIndex:
+        connections, chunks, locations, local_ids = {}, [], [], []
+        by_topic = {}
+        encodings = set()
+
+        for file_index in range(len(self.files)):
+            db = self._handle(file_index)
+            ids = {}
+            for topic_id, name, msg_type, encoding in db.execute(
+                    "SELECT id, name, type, serialization_format FROM topics"):
+                if name not in by_topic:
+                    by_topic[name] = len(by_topic)
+                    connections[by_topic[name]] = Connection(by_topic[name], name, _ros1_type_name(msg_type),
+                                                             '', '', '', False)
+                ids[by_topic[name]] = topic_id
+                encodings.add(encoding)
+            local_ids.append(ids)
+
+            # Solo se leen tiempo, topic y tamaño de cada mensaje (no el contenido)
+            rows = _fetch_int_columns(db.execute(
+                "SELECT topic_id, timestamp, length(data) FROM messages ORDER BY timestamp, id"), 3)
+            if not len(rows):
+                continue
+            topic_ids, times, sizes = rows[:, 0], rows[:, 1], rows[:, 2]
+
+            # Cortar en ventanas acotadas en bytes y en mensajes; nunca entre mensajes
+            # con el mismo timestamp (las ventanas se consultan por rango de tiempo)
+            key = (np.cumsum(sizes) - sizes) // SQLITE_WINDOW_BYTES + np.arange(len(rows)) // SQLITE_WINDOW_MESSAGES
+            starts = np.flatnonzero(np.diff(key)) + 1
+            starts = np.concatenate(([0], starts[times[starts] != times[starts - 1]]))
+            ends = np.append(starts[1:], len(rows))
+
+            to_global = {local: conn for conn, local in ids.items()}
+            for first, last in zip(starts.tolist(), ends.tolist()):
+                window_topics, counts = np.unique(topic_ids[first:last], return_counts=True)
+                chunks.append(ChunkInfo(
+                    position=len(locations),
+                    start_time=int(times[first]),
+                    end_time=int(times[last - 1]),
+                    counts={to_global[t]: int(c) for t, c in zip(window_topics.tolist(), counts.tolist())
+                            if t in to_global},
+                ))
+                locations.append((file_index, 0, 0, 0))
+
+        encoding = encodings.pop() if len(encodings) == 1 else ENCODING_CDR
+        chunks.sort(key=lambda chunk: (chunk.start_time, chunk.position))
+        return Ros2BagIndex(connections, chunks, STORAGE_SQLITE, encoding, locations, local_ids)
+
+    def _read_sqlite_window(self, chunk: ChunkInfo, conn_ids, start: Optional[int],
+                            end: Optional[int]) -> Optional[MessageSpans]:
+        file_index = self.index.locations[chunk.position][0]
+        ids = self.index.local_ids[file_index]
+        to_global = {ids[conn]: conn for conn in conn_ids if conn in ids}
+        if not to_global:
+            return None
+
+        first = chunk.start_time if start is None else max(chunk.start_time, start)
+        last = chunk.end_time if end is None else min(chunk.end_time, end)
+        placeholders = ','.join('?' * len(to_global))
+        # Rango sobre el índice timestamp_idx que crea rosbag2
+        rows = self._handle(file_index).execute(
+            f"SELECT topic_id, timestamp, data FROM messages "
+            f"WHERE timestamp >= ? AND timestamp <= ? AND topic_id IN ({placeholders}) "
+            f"ORDER BY timestamp, id", [first, last] + list(to_global)).fetchall()
+        if not rows:
+            return None
+
+        topic_ids, times, datas = zip(*rows)
+        lengths = np.fromiter((len(data) for data in datas), dtype=np.int64, count=len(datas))
+        return MessageSpans(
+            np.frombuffer(b''.join(datas), dtype=np.uint8),
+            np.array([to_global[t] for t in topic_ids], dtype=np.int64),
+            np.cumsum(lengths) - lengths,
+            lengths,
+            np.array(times, dtype=np.int64),
+        )
+
+    # ------------------------------------------------------------------
+    # MCAP
+
+    def _read_mcap_index(self) -> Ros2BagIndex:
+        try:
+            from mcap.reader import make_reader
+        except ImportError:
+            raise ImportError("Se necesita el paquete 'mcap' para leer bags de ROS 2 en formato MCAP")
+
+        connections, chunks, locations, local_ids = {}, [], [], []
+        by_topic = {}
+        encodings = set()
+
+        for file_index in range(len(self.files)):
+            f = self._handle(file_index)
+            summary = make_reader(f).get_summary()
+            if summary is None or not summary.chunk_indexes:
+                raise ValueError(f"{self.files[file_index]} no tiene índice de chunks (usar 'mcap recover')")
+
+            ids = {}
+            for channel in summary.channels.values():
+                schema = summary.schemas.get(channel.schema_id)
+                if channel.topic not in by_topic:
+                    by_topic[channel.topic] = len(by_topic)
+                    connections[by_topic[channel.topic]] = Connection(
+                        by_topic[channel.topic], channel.topic,
+                        _ros1_type_name(schema.name) if schema else '', '',
+                        schema.data.decode('utf-8', errors='replace') if schema else '', '', False)
+                ids[by_topic[channel.topic]] = channel.id
+                encodings.add(channel.message_encoding)
+            local_ids.append(ids)
+
+            to_global = {local: conn for conn, local in ids.items()}
+            for chunk_index in summary.chunk_indexes:
+                location = (file_index, chunk_index.chunk_start_offset, chunk_index.chunk_length,
+                            chunk_index.message_index_length)
+                # Los MessageIndex de cada chunk dan el número de mensajes por canal
+                f.seek(chunk_index.chunk_start_offset + chunk_index.chunk_length)
+                entries = _parse_message_indexes(f.read(chunk_index.message_index_length))
+                if entries:
+                    counts = {to_global[channel]: len(entry) for channel, entry in entries.items()
+                              if len(entry) and channel in to_global}
+                else:
+                    # Sin MessageIndex: contar recorriendo el chunk
+                    conns = self._read_mcap_chunk(location, to_global, None, None).connections
+                    values, totals = np.unique(conns, return_counts=True)
+                    counts = dict(zip(values.tolist(), totals.tolist()))
+                if not counts:
+                    continue
+                chunks.append(ChunkInfo(len(locations), chunk_index.message_start_time,
+                                        chunk_index.message_end_time, counts))
+                locations.append(location)
+
+        if len(encodings) > 1:
+            raise ValueError(f"El bag mezcla codificaciones de mensaje: {sorted(encodings)}")
+        encoding = encodings.pop() if encodings else ENCODING_CDR
+        chunks.sort(key=lambda chunk: (chunk.start_time, chunk.position))
+        return Ros2BagIndex(connections, chunks, STORAGE_MCAP, encoding, locations, local_ids)
+
+    def _read_mcap_chunk(self, location: Tuple[int, int, int, int], to_global: Dict[int, int],
+                         start: Optional[int], end: Optional[int]) -> Optional[MessageSpans]:
+        """Lee un chunk MCAP; `to_global` traduce los canales pedidos a ids de conexión"""
+        file_index, offset, length, index_length = location
+        f = self._handle(file_index)
+        f.seek(offset)
+        data = f.read(length + index_length)
+
+        # Registro Chunk: cabecera fija, compresión (string) y registros comprimidos
+        pos = _MCAP_RECORD.size
+        _, _, uncompressed_size, _ = _MCAP_CHUNK_HEAD.unpack_from(data, pos)
+        pos += _MCAP_CHUNK_HEAD.size
+        (name_length,) = _U32.unpack_from(data, pos)
+        compression = data[pos + 4:pos + 4 + name_length].decode('ascii')
+        pos += 4 + name_length
+        (records_length,) = _U64.unpack_from(data, pos)
+        pos += 8
+        records = _decompress_mcap(compression, data[pos:pos + records_length], uncompressed_size)
+        raw = np.frombuffer(records, dtype=np.uint8)
+
+        entries = _parse_message_indexes(data[length:])
+        if not entries:
+            return self._walk_mcap_chunk(raw, records, to_global, start, end)
+
+        entries = {channel: entry for channel, entry in entries.items() if channel in to_global and len(entry)}
+        if not entries:
+            return None
+        conns = np.concatenate([np.full(len(entry), to_global[channel], dtype=np.int64)
+                                for channel, entry in entries.items()])
+        entry = np.concatenate(list(entries.values()))
+        offsets = entry['offset'].astype(np.int64)
+
+        # Contenido del mensaje: tras opcode, longitud y la cabecera fija de Message
+        record_lengths = gather_bytes(raw, offsets + 1, 8).view('<u8').reshape(-1).astype(np.int64)
+        positions = offsets + _MCAP_RECORD.size + _MCAP_MESSAGE_HEAD.size
+        lengths = record_lengths - _MCAP_MESSAGE_HEAD.size
+        spans = MessageSpans(raw, conns, positions, lengths, entry['log_time'].astype(np.int64))
+        return filter_spans(spans, start, end)
+
+    def _walk_mcap_chunk(self, raw: np.ndarray, records: bytes, to_global: Dict[int, int],
+                         start: Optional[int], end: Optional[int]) -> MessageSpans:
+        """Recorre los registros del chunk (archivos MCAP sin MessageIndex)"""
+        conns, positions, lengths, times = [], [], [], []
+        pos = 0
+        while pos + _MCAP_RECORD.size <= len(records):
+            op, length = _MCAP_RECORD.unpack_from(records, pos)
+            pos += _MCAP_RECORD.size
+            if op == MCAP_OP_MESSAGE:
+                channel, _, log_time, _ = _MCAP_MESSAGE_HEAD.unpack_from(records, pos)
+                if channel in to_global:
+                    conns.append(to_global[channel])
+                    positions.append(pos + _MCAP_MESSAGE_HEAD.size)
+                    lengths.append(length - _MCAP_MESSAGE_HEAD.size)
+                    times.append(log_time)
+            pos += length
+
+        spans = MessageSpans(
+            raw,
+            np.array(conns, dtype=np.int64),
+            np.array(positions, dtype=np.int64),
+            np.array(lengths, dtype=np.int64),
+            np.array(times, dtype=np.int64),
+        )
+        return filter_spans(spans, start, end)
+
+    # ------------------------------------------------------------------
+
+    def read_chunk_spans(self, chunk: ChunkInfo, conn_ids, start: Optional[int] = None,
+                         end: Optional[int] = None) -> Optional[MessageSpans]:
+        """
+        Lee un bloque (ventana de sqlite o chunk MCAP) y ubica sus mensajes filtrados,
+        ordenados por tiempo (nivel bajo: ids de conexión y tiempos en nanosegundos)
+        """
+        if self.storage == STORAGE_SQLITE:
+            return self._read_sqlite_window(chunk, conn_ids, start, end)
+
+        location = self.index.locations[chunk.position]
+        ids = self.index.local_ids[location[0]]
+        to_global = {ids[conn]: conn for conn in conn_ids if conn in ids}
+        if not to_global:
+            return None
+        return self._read_mcap_chunk(location, to_global, start, end)
+
+    def chunk_message_times(self, chunk: ChunkInfo, conn_ids) -> np.ndarray:
+        """Tiempos de los mensajes del bloque sin leer su contenido (índice de sqlite o MessageIndex)"""
+        file_index, offset, length, index_length = self.index.locations[chunk.position]
+        ids = self.index.local_ids[file_index]
+        local = [ids[conn] for conn in conn_ids if conn in ids]
+        if not local:
+            return np.empty(0, dtype=np.int64)
+
+        if self.storage == STORAGE_SQLITE:
+            placeholders = ','.join('?' * len(local))
+            rows = self._handle(file_index).execute(
+                f"SELECT timestamp FROM messages "
+                f"WHERE timestamp >= ? AND timestamp <= ? AND topic_id IN ({placeholders})",
+                [chunk.start_time, chunk.end_time] + local).fetchall()
+            return np.array(rows, dtype=np.int64).reshape(-1)
+
+        f = self._handle(file_index)
+        f.seek(offset + length)
+        entries = _parse_message_indexes(f.read(index_length))
+        if not entries:
+            return super().chunk_message_times(chunk, conn_ids)
+        times = [entries[channel]['log_time'] for channel in local if channel in entries]
+        return np.concatenate(times).astype(np.int64) if times else np.empty(0, dtype=np.int64)
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
@@ -0,0 +1,306 @@
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+# Deserialización mínima de mensajes ROS1 y ROS 2 (CDR) sin depender de una instalación de ROS
+
+# Versión de las tablas de IMU y GPS decodificadas aquí: incrementar cuando cambie
+# su formato (invalida esas entradas de la caché en disco; los frames de nubes de
+# puntos tienen su propia versión, ver pointCloudDecoder.POINTCLOUD_DECODER_VERSION)
+TABLE_DECODER_VERSION = 1
+
+_U32 = struct.Struct('<I')
+_HEADER = struct.Struct('<III')
+_POINTFIELD_TAIL = struct.Struct('<IBI')
+_CLOUD_LAYOUT = struct.Struct('<II')
+_CLOUD_STEPS = struct.Struct('<BII')
+_CDR_STAMP = struct.Struct('<iI')
+_CDR_CLOUD_LAYOUT = struct.Struct('<III')
+_CDR_POINTFIELD_HEAD = struct.Struct('<IB')
+_CDR_CLOUD_STEPS = struct.Struct('<III')
+
+# Codificaciones de mensaje soportadas (message_encoding de MCAP / serialization_format de rosbag2)
+ENCODING_ROS1 = 'ros1'
+ENCODING_CDR = 'cdr'
+
+# Los mensajes CDR empiezan con 4 bytes de encapsulado; el alineamiento se mide desde ahí
+CDR_ORIGIN = 4
+
+
+class PointField(NamedTuple):
+    name: str
+    offset: int
+    datatype: int
+    count: int
+
+
+class PointCloud2(NamedTuple):
+    stamp: int          # Nanosegundos (header.stamp)
+    frame_id: str
+    height: int
+    width: int
+    fields: List[PointField]
+    is_bigendian: bool
+    point_step: int
+    row_step: int
+    data: memoryview    # Vista sobre el buffer original, sin copia
+    is_dense: bool
+
+
+def read_string(buf, pos: int) -> Tuple[str, int]:
+    """Lee un string ROS (uint32 de longitud + bytes)"""
+    (length,) = _U32.unpack_from(buf, pos)
+    pos += 4
+    return bytes(buf[pos:pos + length]).decode('utf-8', errors='replace'), pos + length
+
+
+def read_header(buf, pos: int = 0) -> Tuple[int, str, int]:
+    """Lee un std_msgs/Header y devuelve (stamp en ns, frame_id, nueva posición)"""
+    _, secs, nsecs = _HEADER.unpack_from(buf, pos)
+    frame_id, pos = read_string(buf, pos + 12)
+    return secs * 1_000_000_000 + nsecs, frame_id, pos
+
+
+def header_size(buf, pos: int = 0) -> int:
+    """Tamaño en bytes de un std_msgs/Header serializado"""
+    (length,) = _U32.unpack_from(buf, pos + 12)
+    return 16 + length
+
+
+def deserialize_pointcloud2(data, encoding: str = ENCODING_ROS1) -> PointCloud2:
+    """Deserializa un sensor_msgs/PointCloud2 de ROS1 o de ROS 2 (encoding='cdr')"""
+    if encoding == ENCODING_CDR:
+        return _deserialize_pointcloud2_cdr(data)
+    if encoding != ENCODING_ROS1:
+        raise ValueError(f"Codificación de mensaje no soportada: {encoding}")
+
+    buf = memoryview(data)
+    stamp, frame_id, pos = read_header(buf)
+    height, width = _CLOUD_LAYOUT.unpack_from(buf, pos)
+    pos += 8
+
+    (n_fields,) = _U32.unpack_from(buf, pos)
+    pos += 4
+    fields = []
+    for _ in range(n_fields):
+        name, pos = read_string(buf, pos)
+        offset, datatype, count = _POINTFIELD_TAIL.unpack_from(buf, pos)
+        pos += 9
+        fields.append(PointField(name, offset, datatype, count))
+
+    is_bigendian, point_step, row_step = _CLOUD_STEPS.unpack_from(buf, pos)
+    pos += 9
+    (n_bytes,) = _U32.unpack_from(buf, pos)
+    pos += 4
+    cloud = buf[pos:pos + n_bytes]
+    pos += n_bytes
+    is_dense = bool(buf[pos]) if pos < len(buf) else False
+
+    return PointCloud2(stamp, frame_id, height, width, fields, bool(is_bigendian),
+                       point_step, row_step, cloud, is_dense)
+
+
+def _check_cdr_little_endian(buf):
+    # Encapsulado: 0x0001 = CDR little-endian (0x0000 sería big-endian)
+    if len(buf) < CDR_ORIGIN or buf[1] != 1:
+        raise ValueError("Solo se soportan mensajes CDR little-endian")
+
+
+def _cdr_align(pos: int, size: int) -> int:
+    return pos + (-(pos - CDR_ORIGIN) % size)
+
+
+def _read_cdr_string(buf, pos: int) -> Tuple[str, int]:
+    """Lee un string CDR (uint32 alineado con la longitud incluyendo el NUL final)"""
+    pos = _cdr_align(pos, 4)
+    (length,) = _U32.unpack_from(buf, pos)
+    pos += 4
+    return bytes(buf[pos:pos + max(length - 1, 0)]).decode('utf-8', errors='replace'), pos + length
+
+
+def _deserialize_pointcloud2_cdr(data) -> PointCloud2:
+    buf = memoryview(data)
+    _check_cdr_little_endian(buf)
+    secs, nsecs = _CDR_STAMP.unpack_from(buf, CDR_ORIGIN)
+    frame_id, pos = _read_cdr_string(buf, CDR_ORIGIN + 8)
+
+    pos = _cdr_align(pos, 4)
+    height, width, n_fields = _CDR_CLOUD_LAYOUT.unpack_from(buf, pos)
+    pos += 12
+    fields = []
+    for _ in range(n_fields):
+        name, pos = _read_cdr_string(buf, pos)
+        pos = _cdr_align(pos, 4)
+        offset, datatype = _CDR_POINTFIELD_HEAD.unpack_from(buf, pos)
+        pos = _cdr_align(pos + 5, 4)
+        (count,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        fields.append(PointField(name, offset, datatype, count))
+
+    is_bigendian = buf[pos]
+    pos = _cdr_align(pos + 1, 4)
+    point_step, row_step, n_bytes = _CDR_CLOUD_STEPS.unpack_from(buf, pos)
+    pos += 12
+    cloud = buf[pos:pos + n_bytes]
+    pos += n_bytes
+    is_dense = bool(buf[pos]) if pos < len(buf) else False
+
+    return PointCloud2(secs * 1_000_000_000 + nsecs, frame_id, height, width, fields, bool(is_bigendian),
+                       point_step, row_step, cloud, is_dense)
+
+
+# ----------------------------------------------------------------------
+# Decodificación columnar de topics escalares (IMU, GPS)
+
+def _vector(prefix: str, axes: str = 'xyz') -> list:
+    return [(f'{prefix}.{axis}', '<f8') for axis in axes]
+
+
+def _covariance(prefix: str, size: int = 9) -> list:
+    return [(f'{prefix}_{i}', '<f8') for i in range(size)]
+
+
+# Cuerpo de sensor_msgs/Imu después del Header (296 bytes, sin relleno)
+IMU_BODY_DTYPE = np.dtype(
+    _vector('orientation', 'xyzw') + _covariance('orientation_covariance')
+    + _vector('angular_velocity') + _covariance('angular_velocity_covariance')
+    + _vector('linear_acceleration') + _covariance('linear_acceleration_covariance')
+)
+
+# Cuerpo de sensor_msgs/NavSatFix después del Header (100 bytes, sin relleno)
+NAVSATFIX_BODY_DTYPE = np.dtype(
+    [('status.status', 'i1'), ('status.service', '<u2'),
+     ('latitude', '<f8'), ('longitude', '<f8'), ('altitude', '<f8')]
+    + _covariance('position_covariance') + [('position_covariance_type', 'u1')]
+)
+
+
+def gather_bytes(raw: np.ndarray, starts: np.ndarray, width: int) -> np.ndarray:
+    """Copia `width` bytes desde cada posición de `starts` en una matriz (N, width)"""
+    return raw[starts[:, None] + np.arange(width)]
+
+
+def decode_stamped_columns(spans, body_dtype: np.dtype, encoding: str = ENCODING_ROS1) -> Dict[str, np.ndarray]:
+    """
+    Decodifica mensajes con Header + cuerpo de tamaño fijo en columnas de NumPy.
+
+    `spans` indica dónde está cada mensaje serializado dentro de un buffer
+    (bagReader.MessageSpans). Cabeceras y cuerpos se leen con indexado vectorizado,
+    sin pasar por texto ni por objetos de Python por mensaje.
+    """
+    if encoding == ENCODING_CDR:
+        return _decode_stamped_columns_cdr(spans, body_dtype)
+    if encoding != ENCODING_ROS1:
+        raise ValueError(f"Codificación de mensaje no soportada: {encoding}")
+
+    raw = spans.buffer
+    positions = spans.positions
+    n = len(positions)
+
+    headers = gather_bytes(raw, positions, 16).view('<u4').reshape(n, 4)
+    id_lengths = headers[:, 3].astype(np.int64)
+    bodies = gather_bytes(raw, positions + 16 + id_lengths, body_dtype.itemsize)
+    records = bodies.view(body_dtype).reshape(n)
+
+    columns = {
+        'Time': spans.timestamps / 1e9,
+        'header.seq': headers[:, 0].astype(np.uint32),
+        'header.stamp.secs': headers[:, 1].astype(np.uint32),
+        'header.stamp.nsecs': headers[:, 2].astype(np.uint32),
+        'header.frame_id': _decode_frame_ids(raw, positions + 16, id_lengths),
+    }
+    for name in body_dtype.names:
+        columns[name] = records[name].astype(records.dtype[name].newbyteorder('='))
+    return columns
+
+
+def _cdr_body_dtype(body_dtype: np.dtype, start: int) -> np.dtype:
+    """
+    Reubica los campos de un cuerpo ROS1 (empaquetado) con el alineamiento de CDR,
+    para un cuerpo que empieza en `start` bytes desde el origen CDR
+    """
+    names, formats, offsets = [], [], []
+    pos = start
+    for name in body_dtype.names:
+        field = body_dtype.fields[name][0]
+        pos += -pos % field.alignment
+        names.append(name)
+        formats.append(field)
+        offsets.append(pos - start)
+        pos += field.itemsize
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': pos - start})
+
+
+def _decode_stamped_columns_cdr(spans, body_dtype: np.dtype) -> Dict[str, np.ndarray]:
+    """
+    Versión CDR (ROS 2) de decode_stamped_columns. El relleno del cuerpo depende de
+    la longitud del frame_id, así que los mensajes se agrupan por su alineamiento
+    (como mucho 8 grupos) y cada grupo se decodifica de forma vectorizada.
+    """
+    raw = spans.buffer
+    positions = spans.positions
+    n = len(positions)
+    if n and not (raw[positions + 1] == 1).all():
+        raise ValueError("Solo se soportan mensajes CDR little-endian")
+
+    origins = positions + CDR_ORIGIN
+    headers = gather_bytes(raw, origins, 12).view('<u4').reshape(n, 3)
+    id_lengths = np.maximum(headers[:, 2].astype(np.int64) - 1, 0)  # Sin el NUL final
+    body_starts = 12 + headers[:, 2].astype(np.int64)                # Relativo al origen CDR
+
+    columns = {
+        'Time': spans.timestamps / 1e9,
+        'header.seq': np.zeros(n, dtype=np.uint32),  # ROS 2 no tiene seq
+        'header.stamp.secs': headers[:, 0].astype(np.uint32),
+        'header.stamp.nsecs': headers[:, 1].astype(np.uint32),
+        'header.frame_id': _decode_frame_ids(raw, origins + 12, id_lengths),
+    }
+    for name in body_dtype.names:
+        field = body_dtype.fields[name][0]
+        columns[name] = np.empty(n, dtype=field.newbyteorder('='))
+
+    residues = body_starts % 8
+    for residue in np.unique(residues):
+        group = np.flatnonzero(residues == residue)
+        dtype = _cdr_body_dtype(body_dtype, int(residue))
+        records = gather_bytes(raw, origins[group] + body_starts[group], dtype.itemsize).view(dtype).reshape(-1)
+        for name in body_dtype.names:
+            columns[name][group] = records[name]
+    return columns
+
+
+def _decode_frame_ids(raw: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Decodifica los frame_id; casi siempre se repiten, así que solo se decodifican los distintos"""
+    width = int(lengths.max()) if len(lengths) else 0
+    if width == 0:
+        return np.full(len(lengths), '', dtype=object)
+
+    chars = gather_bytes(raw, starts, width)
+    chars[np.arange(width)[None, :] >= lengths[:, None]] = 0
+    unique, inverse = np.unique(chars.view(f'S{width}').reshape(-1), return_inverse=True)
+    names = np.array([value.decode('utf-8', errors='replace') for value in unique], dtype=object)
+    return names[inverse.reshape(-1)]
+
+
+def decode_topic_columns(spans: Iterable, body_dtype: np.dtype,
+                         encoding: str = ENCODING_ROS1) -> Dict[str, np.ndarray]:
+    """Decodifica chunk a chunk y concatena las columnas de todo el topic"""
+    return concatenate_columns([decode_stamped_columns(chunk, body_dtype, encoding) for chunk in spans], body_dtype)
+
+
+def concatenate_columns(batches: List[Dict[str, np.ndarray]], body_dtype: np.dtype) -> Dict[str, np.ndarray]:
+    """Une las columnas decodificadas de varios chunks (o columnas vacías si no hay ninguno)"""
+    if not batches:
+        empty = np.empty(0, dtype=np.int64)
+        batches = [decode_stamped_columns(_EmptySpans(np.empty(0, np.uint8), empty, empty), body_dtype)]
+
+    if len(batches) == 1:
+        return batches[0]
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+
+
+class _EmptySpans(NamedTuple):
+    buffer: np.ndarray
+    positions: np.ndarray
+    timestamps: np.ndarray
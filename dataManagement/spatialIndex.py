@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Índice espacial sobre nubes decodificadas (columnas de pointCloudDecoder o un
+# arreglo (N, 3)). Combina un KD-tree (k vecinos más cercanos) con un hash de
+# voxels de lado igual al radio para búsquedas por radio fijo: cada consulta solo
+# mira las 27 celdas vecinas y todo se resuelve por lotes con NumPy. Es la base
+# de la eliminación de outliers, el clustering, las normales y el registro.
+
+# Consultas que se procesan a la vez en las búsquedas por radio (acota la memoria)
+QUERY_BATCH = 65536
+
+# Hashes de voxels (uno por radio) que se guardan por índice
+VOXEL_HASH_ENTRIES = 2
+
+# Desplazamientos a las 27 celdas vecinas (incluida la propia)
+_NEIGHBOR_OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)],
+                             dtype=np.int64)
+
+
+class RadiusNeighbors(NamedTuple):
+    """
+    Vecinos por radio en formato CSR: los vecinos de la consulta i son
+    indices[offsets[i]:offsets[i + 1]] (índices de la nube original).
+    """
+    offsets: np.ndarray
+    indices: np.ndarray
+    distances: np.ndarray
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def neighbors(self, i: int) -> np.ndarray:
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+
+def as_xyz(points: Union[Dict[str, np.ndarray], np.ndarray]) -> np.ndarray:
+    """Coordenadas (N, 3) float32 a partir de columnas x, y, z o de un arreglo"""
+    if isinstance(points, dict):
+        return np.column_stack((points['x'], points['y'], points['z'])).astype(np.float32, copy=False)
+    points = np.asarray(points, dtype=np.float32)
+    return points.reshape(-1, 3)
+
+
+class VoxelHash:
+    """Puntos agrupados por celda de lado `cell` (ordenados por clave de celda)"""
+
+    def __init__(self, xyz: np.ndarray, cell: float):
+        self.cell = float(cell)
+        n = len(xyz)
+        low = np.array([xyz[:, axis].min() for axis in range(3)]) if n else np.zeros(3)
+        high = np.array([xyz[:, axis].max() for axis in range(3)]) if n else np.zeros(3)
+        self.origin = low
+        self.dims = np.floor((high - low) / self.cell).astype(np.int64) + 1
+
+        keys = self.keys(self.cells(xyz))
+        self.order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[self.order]
+        self.xyz = xyz[self.order]
+
+        boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1 if n else np.zeros(0, np.int64)
+        self.starts = np.concatenate(([0], boundaries)) if n else np.zeros(0, np.int64)
+        self.counts = np.diff(np.append(self.starts, n))
+        self.cell_keys = sorted_keys[self.starts]
+
+    def cells(self, xyz: np.ndarray) -> np.ndarray:
+        """Celda entera de cada punto (puede caer fuera de la rejilla para consultas)"""
+        cells = np.floor((xyz - self.origin) / self.cell)
+        # Recortar antes de convertir evita desbordes con consultas muy lejanas
+        return np.clip(cells, -2, self.dims + 1).astype(np.int64)
+
+    def keys(self, cells: np.ndarray) -> np.ndarray:
+        """Clave lineal de cada celda (-1 si está fuera de la rejilla)"""
+        inside = np.all((cells >= 0) & (cells < self.dims), axis=1)
+        keys = (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+        return np.where(inside, keys, -1)
+
+    def lookup(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(inicio, número de puntos) de cada celda; 0 puntos si está vacía"""
+        if len(self.cell_keys) == 0:
+            return np.zeros(len(keys), np.int64), np.zeros(len(keys), np.int64)
+        pos = np.clip(np.searchsorted(self.cell_keys, keys), 0, len(self.cell_keys) - 1)
+        hit = (self.cell_keys[pos] == keys) & (keys >= 0)
+        return self.starts[pos], np.where(hit, self.counts[pos], 0)
+
+
+def _expand_ranges(starts: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Para rangos [start, start + count): (rango de cada elemento, posición) aplanados"""
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    return owner, starts[owner] + (np.arange(total) - first[owner])
+
+
+class SpatialIndex:
+    """KD-tree y hashes de voxels (construidos bajo demanda) sobre una nube fija"""
+
+    def __init__(self, points: Union[Dict[str, np.ndarray], np.ndarray], leafsize: int = 16):
+        self.xyz = as_xyz(points)
+        self.leafsize = leafsize
+        self._tree = None
+        self._hashes = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.xyz)
+
+    @property
+    def tree(self) -> cKDTree:
+        if self._tree is None:
+            # Sin balancear ni compactar: la construcción es varias veces más rápida
+            self._tree = cKDTree(self.xyz, leafsize=self.leafsize, balanced_tree=False, compact_nodes=False)
+        return self._tree
+
+    def voxel_hash(self, cell: float) -> VoxelHash:
+        cell = float(cell)
+        voxels = self._hashes.get(cell)
+        if voxels is None:
+            voxels = VoxelHash(self.xyz, cell)
+            self._hashes[cell] = voxels
+            while len(self._hashes) > VOXEL_HASH_ENTRIES:
+                self._hashes.popitem(last=False)
+        else:
+            self._hashes.move_to_end(cell)
+        return voxels
+
+    def knn(self, queries=None, k: int = 8, max_distance: float = np.inf,
+            workers: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k vecinos más cercanos de cada consulta: (distancias, índices) de forma
+        (M, k). Sin consultas se usa la propia nube (cada punto es su primer
+        vecino). Los huecos (más allá de max_distance) tienen distancia inf e
+        índice len(self).
+        """
+        queries = self.xyz if queries is None else as_xyz(queries)
+        if len(self) == 0:
+            return np.full((len(queries), k), np.inf), np.full((len(queries), k), 0, dtype=np.int64)
+        distances, indices = self.tree.query(queries, k=k, distance_upper_bound=max_distance, workers=workers)
+        if k == 1:
+            distances, indices = distances[:, None], indices[:, None]
+        return distances, indices.astype(np.int64, copy=False)
+
+    def _radius_batches(self, queries: np.ndarray, radius: float):
+        """Pares (consulta, posición en el hash, distancia²) dentro del radio, por lotes"""
+        voxels = self.voxel_hash(radius)
+        r2 = np.float32(radius) ** 2
+        for first in range(0, len(queries), QUERY_BATCH):
+            batch = queries[first:first + QUERY_BATCH]
+            cells = voxels.cells(batch)
+            # Las celdas vecinas se buscan una vez por celda distinta de las consultas
+            # (clave sobre la rejilla ampliada para no juntar las celdas de fuera)
+            padded = cells + 2
+            dims = voxels.dims + 4
+            keys = (padded[:, 0] * dims[1] + padded[:, 1]) * dims[2] + padded[:, 2]
+            order = np.argsort(keys, kind='stable')
+            new_cell = np.concatenate(([True], keys[order][1:] != keys[order][:-1]))
+            inverse = np.empty(len(keys), dtype=np.int64)
+            inverse[order] = np.cumsum(new_cell) - 1
+            unique_cells = cells[order[new_cell]]
+
+            pairs_q, pairs_p, pairs_d = [], [], []
+            for offset in _NEIGHBOR_OFFSETS:
+                starts, counts = voxels.lookup(voxels.keys(unique_cells + offset))
+                starts, counts = starts[inverse], counts[inverse]
+                if not counts.any():
+                    continue
+                owner, positions = _expand_ranges(starts, counts)
+                delta = voxels.xyz[positions] - batch[owner]
+                d2 = np.einsum('ij,ij->i', delta, delta)
+                keep = d2 <= r2
+                pairs_q.append(owner[keep] + first)
+                pairs_p.append(positions[keep])
+                pairs_d.append(d2[keep])
+            if pairs_q:
+                yield np.concatenate(pairs_q), np.concatenate(pairs_p), np.concatenate(pairs_d)
+
+    def radius_search(self, queries=None, radius: float = 0.5, sort: bool = False) -> RadiusNeighbors:
+        """
+        Todos los vecinos a distancia <= radius de cada consulta (la propia nube si
+        no se dan consultas), en formato CSR. Con sort=True cada lista va ordenada
+        por distancia.
+        """
+        queries = self.xyz if queries is None else as_xyz(queries)
+        counts = np.zeros(len(queries), dtype=np.int64)
+        found_q, found_i, found_d = [], [], []
+        if len(self):
+            voxels = self.voxel_hash(radius)
+            for owner, positions, d2 in self._radius_batches(queries, radius):
+                found_q.append(owner)
+                found_i.append(voxels.order[positions])
+                found_d.append(d2)
+        if not found_q:
+            return RadiusNeighbors(np.zeros(len(queries) + 1, np.int64), np.zeros(0, np.int64),
+                                   np.zeros(0, np.float32))
+
+        owner = np.concatenate(found_q)
+        indices = np.concatenate(found_i)
+        distances = np.sqrt(np.concatenate(found_d))
+        order = np.lexsort((distances, owner)) if sort else np.argsort(owner, kind='stable')
+        counts += np.bincount(owner, minlength=len(queries))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return RadiusNeighbors(offsets, indices[order], distances[order])
+
+    def radius_count(self, queries=None, radius: float = 0.5) -> np.ndarray:
+        """Número de vecinos a distancia <= radius de cada consulta (sin materializarlos)"""
+        queries = self.xyz if queries is None else as_xyz(queries)
+        counts = np.zeros(len(queries), dtype=np.int64)
+        if len(self):
+            for owner, _, _ in self._radius_batches(queries, radius):
+                counts += np.bincount(owner, minlength=len(queries))
+        return counts
+
+    def box_crop(self, low, high) -> np.ndarray:
+        """Índices (ordenados) de los puntos dentro de la caja [low, high]"""
+        low = np.asarray(low, dtype=np.float32)
+        high = np.asarray(high, dtype=np.float32)
+        inside = np.ones(len(self), dtype=bool)
+        for axis in range(3):
+            column = self.xyz[:, axis]
+            inside &= (column >= low[axis]) & (column <= high[axis])
+        return np.flatnonzero(inside)
+
+
+def crop_columns(columns: Dict[str, np.ndarray], low, high,
+                 index: Optional[SpatialIndex] = None) -> Dict[str, np.ndarray]:
+    """Recorta una nube en columnas a la caja [low, high]"""
+    index = index or SpatialIndex(columns)
+    keep = index.box_crop(low, high)
+    return {name: np.asarray(column)[keep] for name, column in columns.items()}
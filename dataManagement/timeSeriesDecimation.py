@@ -0,0 +1,97 @@
+from typing import Tuple
+
+import numpy as np
+
+# Reducción de series temporales largas antes de dibujarlas. Un navegador no
+# puede mostrar más de un valor por píxel, así que cada serie se reduce a un
+# número de puntos proporcional al ancho de la gráfica:
+# - Mín/máx: en cada intervalo de la serie se conservan el mínimo y el máximo,
+#   en orden temporal. La envolvente es exacta: ningún pico se pierde.
+# - LTTB (Largest-Triangle-Three-Buckets): un punto por intervalo, el que forma
+#   el triángulo de mayor área con el punto elegido en el intervalo anterior y
+#   la media del siguiente. Conserva mejor la forma de la señal.
+# Las series con menos puntos que el presupuesto se devuelven completas.
+
+MIN_MAX = 'min/max'
+LTTB = 'lttb'
+DECIMATION_METHODS = (MIN_MAX, LTTB)
+
+
+def minmax_indices(values: np.ndarray, buckets: int) -> np.ndarray:
+    """
+    Índices del mínimo y el máximo de cada uno de `buckets` intervalos de igual
+    número de muestras (y de la primera y la última), ordenados en el tiempo
+    """
+    n = len(values)
+    if n <= 2 * buckets + 2:
+        return np.arange(n)
+    size = -(-n // buckets)
+    count = -(-n // size)
+    values = np.asarray(values, dtype=np.float64)
+    # Relleno hasta completar el último intervalo; los NaN no pueden ser extremos
+    padded_low = np.full(count * size, np.inf)
+    padded_high = np.full(count * size, -np.inf)
+    finite = np.isfinite(values)
+    padded_low[:n] = np.where(finite, values, np.inf)
+    padded_high[:n] = np.where(finite, values, -np.inf)
+    offsets = np.arange(count) * size
+    lows = padded_low.reshape(count, size).argmin(axis=1) + offsets
+    highs = padded_high.reshape(count, size).argmax(axis=1) + offsets
+    indices = np.concatenate(([0, n - 1], np.minimum(lows, n - 1), np.minimum(highs, n - 1)))
+    return np.unique(indices)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Índices elegidos por LTTB (`points` puntos, incluidos el primero y el
+    último). `y` puede ser (N,) o (N, T): con varias series sobre el mismo eje x
+    se procesan todas a la vez y se devuelven índices (points, T).
+    """
+    n = len(x)
+    single = np.ndim(y) == 1
+    y = np.asarray(y, dtype=np.float64).reshape(n, -1)
+    if points >= n or points < 3:
+        indices = np.repeat(np.arange(n)[:, None], y.shape[1], axis=1)
+        return indices[:, 0] if single else indices
+    x = np.asarray(x, dtype=np.float64)
+    series = np.arange(y.shape[1])
+
+    # Intervalos entre el primer y el último punto, y la media de cada uno
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    cumulative_x = np.concatenate(([0.0], np.cumsum(x)))
+    cumulative_y = np.concatenate((np.zeros((1, y.shape[1])), np.cumsum(y, axis=0)))
+    lengths = np.maximum(edges[1:] - edges[:-1], 1)
+    mean_x = (cumulative_x[edges[1:]] - cumulative_x[edges[:-1]]) / lengths
+    mean_y = (cumulative_y[edges[1:]] - cumulative_y[edges[:-1]]) / lengths[:, None]
+    # El "siguiente" del último intervalo es el último punto
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.vstack((mean_y[1:], y[-1]))
+
+    indices = np.empty((points, y.shape[1]), dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    for bucket in range(points - 2):
+        start, stop = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        previous = indices[bucket]
+        ax, ay = x[previous], y[previous, series]
+        # Doble del área del triángulo (anterior, candidato, media del siguiente)
+        area = np.abs((ax - mean_x[bucket]) * (y[start:stop] - ay)
+                      - (ax - x[start:stop, None]) * (mean_y[bucket] - ay))
+        indices[bucket + 1] = start + np.nan_to_num(area, nan=-1.0).argmax(axis=0)
+    return indices[:, 0] if single else indices
+
+
+def decimate(x: np.ndarray, y: np.ndarray, pixels: int, method: str = MIN_MAX) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce la serie (x, y) para una gráfica de `pixels` píxeles de ancho: como
+    mucho 2 * pixels + 2 puntos con mín/máx y `pixels` con LTTB
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if method == MIN_MAX:
+        indices = minmax_indices(y, pixels)
+    elif method == LTTB:
+        indices = lttb_indices(x, y, pixels)
+    else:
+        raise ValueError(f"Método de reducción no soportado: {method}")
+    return x[indices], y[indices]
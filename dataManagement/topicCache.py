@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Caché persistente en disco de topics ya decodificados. Las tablas (IMU, GPS)
+# se guardan en Parquet y los frames de nubes de puntos como un .npy por columna,
+# que se vuelven a abrir con mmap. Cada entrada se identifica por la huella del
+# bag, el topic y la versión del decodificador que la generó.
+
+CACHE_DIR = os.environ.get('NOVALIDAR_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'novalidar'))
+CACHE_MAX_BYTES = int(os.environ.get('NOVALIDAR_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+
+# Revisar el tamaño de la caché cada N escrituras (recorrerla tiene coste)
+EVICT_EVERY = 16
+
+_lock = threading.Lock()
+_writes = 0
+
+
+def _topic_key(topic: str) -> str:
+    """Nombre de carpeta seguro y único para un topic"""
+    name = topic.strip('/').replace('/', '__') or 'root'
+    digest = hashlib.blake2b(topic.encode('utf-8'), digest_size=4).hexdigest()
+    return f"{name}-{digest}"
+
+
+def _entry_dir(fingerprint: str, topic: str, name: str, version: int) -> str:
+    return os.path.join(CACHE_DIR, fingerprint, _topic_key(topic), f"{name}-v{version}")
+
+
+def _touch(path: str):
+    """Marca la entrada como usada recientemente (para el desalojo LRU)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _commit(tmp_dir: str, entry: str):
+    """Publica una entrada escrita en un directorio temporal de forma atómica"""
+    global _writes
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    try:
+        os.replace(tmp_dir, entry)
+    except OSError:
+        # Otra sesión la escribió a la vez: conservar la existente
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    with _lock:
+        _writes += 1
+        check = _writes % EVICT_EVERY == 1
+    if check:
+        evict()
+
+
+def _new_tmp_dir() -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix='.tmp-', dir=CACHE_DIR)
+
+
+def load_table(fingerprint: str, topic: str, name: str, version: int) -> Optional[pd.DataFrame]:
+    """Carga una tabla decodificada o None si no está en caché"""
+    entry = _entry_dir(fingerprint, topic, name, version)
+    try:
+        if os.path.exists(os.path.join(entry, 'table.parquet')):
+            table = pd.read_parquet(os.path.join(entry, 'table.parquet'), memory_map=True)
+        elif os.path.exists(os.path.join(entry, 'table.pkl')):
+            table = pd.read_pickle(os.path.join(entry, 'table.pkl'))
+        else:
+            return None
+    except Exception as e:
+        print(f"Entrada de caché ilegible, se ignora: {str(e)}")
+        return None
+    _touch(entry)
+    return table
+
+
+def store_table(fingerprint: str, topic: str, name: str, version: int, table: pd.DataFrame):
+    """Guarda una tabla decodificada (Parquet si pyarrow está disponible)"""
+    try:
+        tmp_dir = _new_tmp_dir()
+        try:
+            table.to_parquet(os.path.join(tmp_dir, 'table.parquet'), index=False)
+        except ImportError:
+            table.to_pickle(os.path.join(tmp_dir, 'table.pkl'))
+        _commit(tmp_dir, _entry_dir(fingerprint, topic, name, version))
+    except Exception as e:
+        print(f"No se pudo guardar en caché: {str(e)}")
+
+
+def load_arrays(fingerprint: str, topic: str, name: str, version: int):
+    """
+    Carga una entrada de arreglos con nombre como (meta, arreglos). Los arreglos
+    se abren mapeados en memoria y en solo lectura. None si no está en caché.
+    """
+    entry = _entry_dir(fingerprint, topic, name, version)
+    meta_path = os.path.join(entry, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {
+            array: np.load(os.path.join(entry, f"{array}.npy"), mmap_mode='r')
+            for array in meta['columns']
+        }
+    except Exception as e:
+        print(f"Entrada de caché ilegible, se ignora: {str(e)}")
+        return None
+    _touch(entry)
+    return meta, arrays
+
+
+def store_arrays(fingerprint: str, topic: str, name: str, version: int,
+                 arrays: Dict[str, np.ndarray], meta: Optional[dict] = None):
+    """
+    Guarda arreglos con nombre (un .npy por arreglo, pueden tener tamaños
+    distintos) y un diccionario `meta` serializable en JSON
+    """
+    try:
+        tmp_dir = _new_tmp_dir()
+        for array, values in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{array}.npy"), np.ascontiguousarray(values))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(meta or {}, columns=list(arrays)), f)
+        _commit(tmp_dir, _entry_dir(fingerprint, topic, name, version))
+    except Exception as e:
+        print(f"No se pudo guardar en caché: {str(e)}")
+
+
+def load_frame(fingerprint: str, topic: str, name: str, version: int):
+    """
+    Carga un frame de nube de puntos como (timestamp, columnas). Las columnas son
+    arreglos mapeados en memoria de solo lectura. Devuelve None si no está en caché.
+    """
+    cached = load_arrays(fingerprint, topic, name, version)
+    if cached is None:
+        return None
+    meta, columns = cached
+    return meta['timestamp'], columns
+
+
+def store_frame(fingerprint: str, topic: str, name: str, version: int,
+                timestamp: float, columns: Dict[str, np.ndarray]):
+    """Guarda un frame de nube de puntos, una columna .npy por campo"""
+    store_arrays(fingerprint, topic, name, version, columns, {'timestamp': timestamp})
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+def evict(max_bytes: Optional[int] = None):
+    """Elimina las entradas usadas hace más tiempo hasta quedar bajo el límite"""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    with _lock:
+        entries = []
+        for fingerprint in os.listdir(CACHE_DIR):
+            bag_dir = os.path.join(CACHE_DIR, fingerprint)
+            if fingerprint.startswith('.') or not os.path.isdir(bag_dir):
+                continue
+            for topic in os.listdir(bag_dir):
+                topic_dir = os.path.join(bag_dir, topic)
+                for name in os.listdir(topic_dir):
+                    entry = os.path.join(topic_dir, name)
+                    try:
+                        entries.append((os.path.getmtime(entry), _dir_size(entry), entry))
+                    except OSError:
+                        continue  # Eliminada mientras se recorría
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def clear_topic_cache():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
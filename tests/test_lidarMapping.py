@@ -0,0 +1,45 @@
+import numpy as np
+
+from dataManagement.lidarMapping import MAX_RANGE, LidarMapper
+
+
+def room_scan(points: int = 5000, seed: int = 0) -> np.ndarray:
+    """Barrido sintético de una habitación de 20 x 16 x 4 m (suelo, techo y paredes)"""
+    rng = np.random.default_rng(seed)
+    plane = rng.integers(0, 6, points)
+    xyz = np.column_stack((rng.uniform(-10, 10, points), rng.uniform(-8, 8, points), rng.uniform(-1.5, 2.5, points)))
+    for side, (axis, value) in enumerate(((0, -10), (0, 10), (1, -8), (1, 8), (2, -1.5), (2, 2.5))):
+        xyz[plane == side, axis] = value
+    return xyz.astype(np.float32)
+
+
+def test_empty_first_frame_starts_the_map_at_the_next_frame():
+    mapper = LidarMapper()
+    mapper.add_frame(0.0, np.zeros((0, 3)))
+    pose = mapper.add_frame(0.1, room_scan())
+    np.testing.assert_allclose(pose, np.eye(4))
+    assert mapper.keyframes == 1
+    assert mapper.failed == 0
+
+    pose = mapper.add_frame(0.2, room_scan(seed=1))
+    np.testing.assert_allclose(pose, np.eye(4), atol=0.05)
+
+
+def test_out_of_range_first_frame_starts_the_map_at_the_next_frame():
+    mapper = LidarMapper()
+    mapper.add_frame(0.0, np.full((100, 3), 2 * MAX_RANGE, dtype=np.float32))
+    mapper.add_frame(0.1, room_scan())
+    assert mapper.keyframes == 1
+    assert len(mapper.poses) == 2
+
+
+def test_empty_frame_after_the_first_skips_registration():
+    mapper = LidarMapper()
+    mapper.add_frame(0.0, room_scan())
+    pose = mapper.add_frame(0.1, np.zeros((0, 3)))
+    np.testing.assert_allclose(pose, np.eye(4))
+    assert mapper.failed == 1
+    assert mapper.keyframes == 1
+
+    pose = mapper.add_frame(0.2, room_scan(seed=1))
+    np.testing.assert_allclose(pose, np.eye(4), atol=0.05)